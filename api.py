@@ -8,28 +8,51 @@ Provides REST API endpoints for:
 - Insights and anomaly detection
 - Monitoring metrics
 """
+import asyncio
+import gzip
+import hashlib
+import importlib
+import json
 import logging
+import mimetypes
 import os
+import time
 import uuid
+import zipfile
 from datetime import datetime
-from typing import List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 from pathlib import Path
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Header
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Header, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from prometheus_client import Counter, Histogram, generate_latest
-from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import CONTENT_TYPE_LATEST, multiprocess
 from starlette.responses import Response
 
 from src.models.schemas import (
-    DocumentExtraction, UploadResponse, QueryRequest, QueryResponse,
-    DocumentStatus, ProcessingStatus, Anomaly, Insight
+    DocumentExtraction, DocumentMetadata, UploadResponse, QueryRequest, QueryResponse,
+    DocumentStatus, ProcessingStatus, ProcessingJob, BatchUploadResponse, BatchStatus,
+    Anomaly, Insight
 )
 from src.config import get_settings
+from src.jobs.job_queue import JobQueue, ProgressCallback
+from src.jobs.progress import ProgressBroker, TERMINAL_EVENTS
+from src.storage.repository import DocumentRepository, SQLDocumentRepository
+from src.utils.admission import AdmissionController, AdmissionRejected, admission_rejections
+from src.utils.helpers import timed_operation
+from src.utils.uploads import FileTooLargeError, copy_file, read_chunks, save_stream
 from poc_pipeline import DocumentPipeline
 
+if TYPE_CHECKING:
+    from src.anomaly.features import FeatureStore
+    from src.anomaly.registry import AnomalyModelManager
+    from src.rag.embeddings import EmbeddingBackend
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -43,12 +66,18 @@ upload_counter = Counter('documents_uploaded_total', 'Total documents uploaded')
 processing_duration = Histogram('document_processing_seconds', 'Time spent processing documents')
 query_counter = Counter('queries_total', 'Total queries processed')
 anomaly_counter = Counter('anomalies_detected_total', 'Total anomalies detected')
+dedup_counter = Counter(
+    'documents_deduplicated_total',
+    'Uploads resolved to an existing document by content hash',
+    ['status']
+)
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Financial Document Extraction API",
     description="PoC API for intelligent financial document processing with OCR, LLM extraction, and RAG insights",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -60,11 +89,119 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+class NonStreamingGZipMiddleware(GZipMiddleware):
+    """Gzip responses, except event streams (gzip would buffer events until close)."""
+    
+    STREAM_SUFFIXES = ("/stream", "/events")
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith(self.STREAM_SUFFIXES):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+app.add_middleware(NonStreamingGZipMiddleware, minimum_size=1024, compresslevel=6)
+
 # Global pipeline instance (in production, use dependency injection or singleton pattern)
 pipeline = None
 
-# Storage for processed documents (in production, use database)
-document_store = {}
+# Persistent storage for processed documents
+document_repository = None
+
+# Per-process anomaly feature columns, synced from the repository change log
+feature_store = None
+
+# Loads saved anomaly models and retrains them in the background
+anomaly_models = None
+
+# Background processing queue and live progress events
+job_queue = None
+progress_broker = ProgressBroker()
+
+# Admission control in front of endpoints that run OCR, LLM or ML work
+admission = {
+    endpoint: AdmissionController(
+        endpoint,
+        max_concurrent=getattr(settings, f"admission_{endpoint}_concurrency"),
+        max_queue=getattr(settings, f"admission_{endpoint}_queue"),
+        queue_timeout_seconds=settings.admission_queue_timeout_seconds
+    )
+    for endpoint in ("upload", "query", "anomalies", "trends")
+}
+
+# Retry hint for uploads refused because the processing backlog is full
+BACKLOG_RETRY_AFTER_SECONDS = 30
+
+# Embedding model loaded once in the pre-fork master and shared by worker processes
+preloaded_embeddings: Optional["EmbeddingBackend"] = None
+
+# Set once this process has finished warm_up(); reported by /ready
+worker_ready = False
+
+ALLOWED_EXTENSIONS = {'.pdf', '.png', '.jpg', '.jpeg', '.tiff'}
+
+# Heavy subsystems, otherwise imported on first use
+PRELOAD_MODULES = (
+    "src.ocr.preprocessor", "camelot", "pdfplumber",
+    "src.extraction.llm_extractor",
+    "src.rag.rag_engine", "src.rag.embeddings",
+    "src.anomaly.detector", "sklearn.ensemble", "prophet", "statsmodels.tsa.holtwinters",
+)
+
+
+def preload_subsystems() -> Dict[str, float]:
+    """
+    Import heavy subsystems and load fork-safe models; returns import seconds per module.
+    
+    Called by gunicorn in the master before workers fork, and by warm_up().
+    Nothing holding connections, file handles or threads is created here.
+    """
+    global preloaded_embeddings
+    timings = {}
+    for module in PRELOAD_MODULES:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        timings[module] = round(time.perf_counter() - start, 3)
+    
+    # Local model weights are read-only after load, so they are shared copy-on-write
+    if preloaded_embeddings is None and settings.embedding_backend.lower() in ("local", "sentence_transformers"):
+        from src.rag.embeddings import get_embedding_backend
+        preloaded_embeddings = get_embedding_backend()
+    
+    logger.info(f"Preloaded {len(PRELOAD_MODULES)} modules in {sum(timings.values()):.2f}s")
+    return timings
+
+
+def warm_up(load_subsystems: bool = False) -> None:
+    """
+    Open this process's connections and workers, then mark it ready.
+    
+    With load_subsystems, heavy subsystems and pipeline components are also
+    loaded now; otherwise each is loaded on first use.
+    """
+    global worker_ready
+    if load_subsystems:
+        preload_subsystems()
+    
+    pipe = get_pipeline()
+    documents = get_repository().count()
+    
+    if load_subsystems:
+        pipe.load_components()
+        if preloaded_embeddings is not None:
+            # First inference initializes per-process thread pools
+            pipe.vector_store.embed_query("warm-up")
+    
+    # Start background workers (resumes jobs interrupted by a restart)
+    get_job_queue()
+    
+    # Load the saved anomaly model and keep it current in the background
+    get_anomaly_models()
+    
+    worker_ready = True
+    logger.info(f"Worker {os.getpid()} ready ({documents} documents, subsystems preloaded: {load_subsystems})")
 
 
 def get_pipeline() -> DocumentPipeline:
@@ -72,10 +209,256 @@ def get_pipeline() -> DocumentPipeline:
     global pipeline
     if pipeline is None:
         logger.info("Initializing document pipeline...")
-        pipeline = DocumentPipeline()
+        pipeline = DocumentPipeline(embedding_backend=preloaded_embeddings)
     return pipeline
 
 
+def get_repository() -> DocumentRepository:
+    """Get or initialize the document repository."""
+    global document_repository
+    if document_repository is None:
+        document_repository = SQLDocumentRepository()
+    return document_repository
+
+
+def get_feature_store() -> "FeatureStore":
+    """Get or initialize the anomaly feature store (loads all stored features once)."""
+    global feature_store
+    if feature_store is None:
+        from src.anomaly.features import FeatureStore
+        feature_store = FeatureStore(get_repository())
+    return feature_store
+
+
+def get_anomaly_models() -> "AnomalyModelManager":
+    """Get or initialize the anomaly model manager and start its background thread."""
+    global anomaly_models
+    if anomaly_models is None:
+        from src.anomaly.registry import AnomalyModelManager
+        anomaly_models = AnomalyModelManager(get_pipeline().anomaly_detector, get_feature_store())
+        anomaly_models.start()
+    return anomaly_models
+
+
+def run_processing_job(job: ProcessingJob, report_progress: ProgressCallback) -> None:
+    """Run the pipeline for a queued upload (called on a job worker thread)."""
+    pipe = get_pipeline()
+    
+    def progress(stage: str, percentage: int, details: Optional[dict] = None) -> None:
+        report_progress(stage, percentage)
+        progress_broker.publish(job.document_id, "progress", {
+            "status": ProcessingStatus.PROCESSING.value,
+            "stage": stage,
+            "progress": percentage,
+            "details": details or {}
+        })
+    
+    with processing_duration.time():
+        extraction = pipe.process_document(
+            job.file_path,
+            uploader=job.uploader,
+            source_type=job.source_type,
+            document_id=job.document_id,
+            filename=job.filename,
+            content_hash=job.content_hash,
+            progress_callback=progress
+        )
+    
+    get_repository().save(extraction)
+    if feature_store is not None:
+        feature_store.sync()
+    
+    logger.info(f"Document {job.document_id} processed successfully")
+
+
+def publish_job_result(job: ProcessingJob) -> None:
+    """Publish a job's terminal event once the queue has recorded its final state."""
+    if job.status == ProcessingStatus.COMPLETED:
+        progress_broker.publish(job.document_id, "completed", {
+            "status": ProcessingStatus.COMPLETED.value, "stage": "completed", "progress": 100
+        })
+    else:
+        progress_broker.publish(job.document_id, "failed", {
+            "status": ProcessingStatus.FAILED.value, "error_message": job.error_message
+        })
+
+
+def find_duplicate(content_hash: str) -> Optional[ProcessingJob]:
+    """Find a queued, in-flight or completed job for identical file content."""
+    job = get_job_queue().find_by_content_hash(content_hash)
+    
+    # A completed job is only reusable while its extraction is still stored
+    if job and job.status == ProcessingStatus.COMPLETED and not get_repository().exists(job.document_id):
+        return None
+    return job
+
+
+@timed_operation("upload_enqueue")
+async def queue_upload(
+    filename: str,
+    source: Any,
+    uploader: str,
+    batch_id: Optional[str] = None,
+    force_reprocess: bool = False
+) -> UploadResponse:
+    """Stream an uploaded file to disk and queue it for background processing."""
+    upload_id = str(uuid.uuid4())
+    upload_path = upload_path_for(upload_id, filename)
+    
+    # Copy in fixed-size chunks so memory stays flat and oversized files stop early
+    file_size, content_hash = await save_stream(
+        read_chunks(source, settings.upload_chunk_size_kb * 1024),
+        upload_path,
+        max_bytes=settings.max_file_size_mb * 1024 * 1024
+    )
+    
+    return register_upload(
+        upload_id, upload_path, filename, file_size, content_hash, uploader,
+        batch_id=batch_id, force_reprocess=force_reprocess
+    )
+
+
+def upload_path_for(upload_id: str, filename: str) -> str:
+    """Where an upload is stored until its job has processed it."""
+    return f"./data/uploads/{upload_id}{Path(filename).suffix.lower()}"
+
+
+def register_upload(
+    upload_id: str,
+    upload_path: str,
+    filename: str,
+    file_size: int,
+    content_hash: str,
+    uploader: str,
+    batch_id: Optional[str] = None,
+    force_reprocess: bool = False
+) -> UploadResponse:
+    """Queue a file saved to upload_path for processing, or resolve it to an identical document."""
+    metadata = DocumentMetadata(
+        document_id=upload_id,
+        filename=filename,
+        file_size=file_size,
+        mime_type=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        upload_timestamp=datetime.utcnow(),
+        uploader=uploader,
+        content_hash=content_hash
+    )
+    
+    # Identical bytes resolve to the existing document instead of re-running OCR/LLM/embedding
+    existing = find_duplicate(content_hash)
+    in_flight = existing is not None and existing.status != ProcessingStatus.COMPLETED
+    if existing and (in_flight or not force_reprocess):
+        os.remove(upload_path)
+        dedup_counter.labels(status=existing.status.value).inc()
+        logger.info(f"Upload {filename} is a duplicate of document {existing.document_id}")
+        
+        metadata.document_id = existing.document_id
+        return UploadResponse(
+            document_id=existing.document_id,
+            status=existing.status.value,
+            message=f"Duplicate of document {existing.document_id}",
+            metadata=metadata,
+            job_id=existing.job_id,
+            deduplicated=True
+        )
+    
+    # Reprocessing keeps the document id so the vector index is updated, not duplicated
+    document_id = existing.document_id if existing else upload_id
+    metadata.document_id = document_id
+    
+    # A previous run's terminal event must not end streams watching this one
+    progress_broker.reset(document_id)
+    
+    # Workers run the pipeline off the event loop
+    job = get_job_queue().submit(
+        document_id=document_id,
+        file_path=upload_path,
+        filename=filename,
+        uploader=uploader,
+        batch_id=batch_id,
+        content_hash=content_hash
+    )
+    
+    return UploadResponse(
+        document_id=document_id,
+        status=ProcessingStatus.UPLOADED.value,
+        message="Document queued for processing",
+        metadata=metadata,
+        job_id=job.job_id
+    )
+
+
+def extract_archive(
+    source: Any,
+    max_files: int
+) -> Tuple[List[Tuple[str, str, str, int, str]], List[Dict[str, str]]]:
+    """
+    Save the supported members of a zip archive as uploads, without queueing them.
+    
+    Reading the archive decompresses, so this blocks; run it off the event
+    loop. Returns (name, upload id, upload path, size, content hash) per
+    saved member, and the rejected members. Raises zipfile.BadZipFile.
+    """
+    max_bytes = settings.max_file_size_mb * 1024 * 1024
+    saved = []
+    rejected = []
+    
+    with zipfile.ZipFile(source) as archive:
+        for member in archive.infolist():
+            if member.is_dir() or Path(member.filename).name.startswith("."):
+                continue
+            
+            # Never trust archive paths; keep only the base name
+            name = Path(member.filename).name
+            if member.file_size > max_bytes:
+                rejected.append({"filename": name, "reason": "File too large"})
+            elif len(saved) >= max_files:
+                limit = f"Batch limit of {settings.batch_max_files} files reached"
+                rejected.append({"filename": name, "reason": limit})
+            elif Path(name).suffix.lower() not in ALLOWED_EXTENSIONS:
+                rejected.append({"filename": name, "reason": "Unsupported file type"})
+            else:
+                upload_id = str(uuid.uuid4())
+                upload_path = upload_path_for(upload_id, name)
+                # Declared sizes can lie; the copy enforces the limit too
+                try:
+                    with archive.open(member) as member_file:
+                        size, content_hash = copy_file(
+                            member_file, upload_path, max_bytes, settings.upload_chunk_size_kb * 1024
+                        )
+                except FileTooLargeError:
+                    rejected.append({"filename": name, "reason": "File too large"})
+                    continue
+                saved.append((name, upload_id, upload_path, size, content_hash))
+    
+    return saved, rejected
+
+
+def get_job_queue() -> JobQueue:
+    """Get or initialize the background job queue and start its workers."""
+    global job_queue
+    if job_queue is None:
+        job_queue = JobQueue(handler=run_processing_job, on_finished=publish_job_result)
+        job_queue.start()
+    return job_queue
+
+
+def admission_slot(endpoint: str):
+    """Dependency that holds one of the endpoint's admission slots while the request runs."""
+    async def hold_slot():
+        async with admission[endpoint].admit():
+            yield
+    return hold_slot
+
+
+def check_job_backlog() -> None:
+    """Dependency refusing uploads while the processing backlog is over its limit."""
+    limit = settings.job_queue_max_pending
+    if limit and get_job_queue().pending_count() >= limit:
+        admission_rejections.labels(endpoint="upload", reason="backlog").inc()
+        raise AdmissionRejected("upload", "backlog", BACKLOG_RETRY_AFTER_SECONDS)
+
+
 async def verify_api_key(x_api_key: Optional[str] = Header(None)) -> bool:
     """Verify API key (basic security)."""
     if settings.app_env == "development":
@@ -98,12 +481,46 @@ async def startup_event():
     os.makedirs("./data/processed", exist_ok=True)
     os.makedirs(settings.vector_db_path, exist_ok=True)
     
-    # Initialize pipeline
-    get_pipeline()
+    # Initialize pipeline, storage and job workers before accepting traffic
+    await run_in_threadpool(warm_up, settings.warm_up_subsystems)
     
     logger.info("API startup complete")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers."""
+    if job_queue is not None:
+        job_queue.stop()
+    if anomaly_models is not None:
+        anomaly_models.stop()
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Tell clients to back off and when to retry."""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Reject single uploads by Content-Length before the body is read."""
+    if request.url.path == "/api/v1/documents/upload":
+        content_length = request.headers.get("content-length")
+        # Allow headroom for multipart boundaries and form fields
+        limit = settings.max_file_size_mb * 1024 * 1024 + 64 * 1024
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"File exceeds maximum size of {settings.max_file_size_mb} MB"}
+            )
+    return await call_next(request)
+
+
 # Mount static files for UI
 app.mount("/ui", StaticFiles(directory="ui", html=True), name="ui")
 
@@ -118,10 +535,13 @@ async def root():
         "endpoints": {
             "upload": "/api/v1/documents/upload",
             "query": "/api/v1/query",
+            "query_stream": "/api/v1/query/stream",
             "status": "/api/v1/documents/{document_id}/status",
             "insights": "/api/v1/insights",
             "anomalies": "/api/v1/anomalies",
             "health": "/health",
+            "ready": "/ready",
+            "warm_up": "/api/v1/admin/warm-up",
             "metrics": "/metrics"
         }
     }
@@ -141,9 +561,22 @@ async def health_check():
     }
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until this worker process has warmed up."""
+    if not worker_ready:
+        return JSONResponse(status_code=503, content={"status": "starting", "pid": os.getpid()})
+    return {"status": "ready", "pid": os.getpid()}
+
+
 @app.get("/metrics")
 async def metrics():
     """Prometheus metrics endpoint."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Aggregate samples written by every worker process
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
@@ -151,11 +584,17 @@ async def metrics():
 async def upload_document(
     file: UploadFile = File(...),
     uploader: str = "api_user",
-    authorized: bool = Depends(verify_api_key)
+    force_reprocess: bool = False,
+    authorized: bool = Depends(verify_api_key),
+    backlog_ok: None = Depends(check_job_backlog),
+    admitted: None = Depends(admission_slot("upload"))
 ):
     """
-    Upload and process a financial document.
+    Upload a financial document and queue it for processing.
     
+    Returns immediately with a job id; poll the status endpoint for progress.
+    Re-uploads of identical bytes return the existing document unless
+    force_reprocess is set.
     Supported formats: PDF, PNG, JPG, JPEG, TIFF
     """
     try:
@@ -163,53 +602,115 @@ async def upload_document(
         logger.info(f"Received upload: {file.filename}")
         
         # Validate file type
-        allowed_extensions = {'.pdf', '.png', '.jpg', '.jpeg', '.tiff'}
         file_ext = Path(file.filename).suffix.lower()
         
-        if file_ext not in allowed_extensions:
+        if file_ext not in ALLOWED_EXTENSIONS:
             raise HTTPException(
                 status_code=400,
-                detail=f"Unsupported file type: {file_ext}. Allowed: {allowed_extensions}"
+                detail=f"Unsupported file type: {file_ext}. Allowed: {ALLOWED_EXTENSIONS}"
             )
         
-        # Save uploaded file
-        document_id = str(uuid.uuid4())
-        upload_path = f"./data/uploads/{document_id}{file_ext}"
-        
-        with open(upload_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        # Process document asynchronously (in production, use background tasks or queue)
-        pipe = get_pipeline()
-        
-        with processing_duration.time():
-            extraction = pipe.process_document(upload_path, uploader=uploader)
-        
-        # Store extraction (in production, save to database)
-        document_store[document_id] = extraction
-        
-        logger.info(f"Document {document_id} processed successfully")
-        
-        return UploadResponse(
-            document_id=document_id,
-            status="completed",
-            message="Document processed successfully",
-            metadata=extraction.metadata
-        )
+        return await queue_upload(file.filename, file, uploader, force_reprocess=force_reprocess)
     
+    except HTTPException:
+        raise
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        logger.error(f"Upload processing failed: {e}", exc_info=True)
+        logger.error(f"Upload failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/v1/documents/batch", response_model=BatchUploadResponse)
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    uploader: str = "api_user",
+    force_reprocess: bool = False,
+    authorized: bool = Depends(verify_api_key),
+    backlog_ok: None = Depends(check_job_backlog),
+    admitted: None = Depends(admission_slot("upload"))
+):
+    """
+    Upload many documents (or .zip archives of them) as one batch.
+    
+    Every supported file is queued as its own job under a shared batch id; the
+    job workers process them in parallel. Unsupported files are reported as
+    rejected instead of failing the whole batch.
+    """
+    batch_id = str(uuid.uuid4())
+    accepted = []
+    rejected = []
+    
+    async def add(filename: str, source: Any) -> None:
+        if len(accepted) >= settings.batch_max_files:
+            rejected.append({"filename": filename, "reason": f"Batch limit of {settings.batch_max_files} files reached"})
+        elif Path(filename).suffix.lower() not in ALLOWED_EXTENSIONS:
+            rejected.append({"filename": filename, "reason": "Unsupported file type"})
+        else:
+            try:
+                accepted.append(await queue_upload(
+                    filename, source, uploader, batch_id=batch_id, force_reprocess=force_reprocess
+                ))
+                upload_counter.inc()
+            except FileTooLargeError:
+                rejected.append({"filename": filename, "reason": "File too large"})
+    
+    try:
+        for file in files:
+            if Path(file.filename).suffix.lower() != ".zip":
+                await add(file.filename, file)
+                continue
+            
+            try:
+                saved, skipped = await run_in_threadpool(
+                    extract_archive, file.file, settings.batch_max_files - len(accepted)
+                )
+            except zipfile.BadZipFile:
+                rejected.append({"filename": file.filename, "reason": "Invalid zip archive"})
+                continue
+            
+            rejected.extend(skipped)
+            for name, upload_id, upload_path, size, content_hash in saved:
+                accepted.append(register_upload(
+                    upload_id, upload_path, name, size, content_hash, uploader,
+                    batch_id=batch_id, force_reprocess=force_reprocess
+                ))
+                upload_counter.inc()
+    
+    except Exception as e:
+        logger.error(f"Batch upload failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if not accepted:
+        raise HTTPException(status_code=400, detail={"message": "No supported files in batch", "rejected": rejected})
+    
+    logger.info(f"Queued batch {batch_id}: {len(accepted)} accepted, {len(rejected)} rejected")
+    return BatchUploadResponse(batch_id=batch_id, accepted=accepted, rejected=rejected)
+
+
+@app.get("/api/v1/batches/{batch_id}", response_model=BatchStatus)
+async def get_batch_status(
+    batch_id: str,
+    authorized: bool = Depends(verify_api_key)
+):
+    """Get per-file statuses and throughput of a batch upload."""
+    status = get_job_queue().get_batch_status(batch_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return status
+
+
 @app.get("/api/v1/documents/{document_id}/status", response_model=DocumentStatus)
 async def get_document_status(
     document_id: str,
     authorized: bool = Depends(verify_api_key)
 ):
     """Get processing status of a document."""
-    if document_id not in document_store:
+    status = get_job_queue().get_status(document_id)
+    if status is not None:
+        return status
+    
+    if not get_repository().exists(document_id):
         raise HTTPException(status_code=404, detail="Document not found")
     
     return DocumentStatus(
@@ -220,22 +721,189 @@ async def get_document_status(
     )
 
 
+@app.get("/api/v1/documents/{document_id}/events")
+async def document_events(
+    document_id: str,
+    request: Request,
+    authorized: bool = Depends(verify_api_key)
+):
+    """
+    Stream processing progress of a document as server-sent events.
+    
+    Emits "progress" events (stage, progress, details such as page counts)
+    as the pipeline runs, then a final "completed" or "failed" event.
+    """
+    if get_job_queue().get_status(document_id) is None and not get_repository().exists(document_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    async def event_stream():
+        # Subscribe before reading history so no event falls in between
+        subscription = progress_broker.subscribe(document_id)
+        try:
+            last_seq = 0
+            for event, data in progress_broker.history(document_id):
+                last_seq = data["seq"]
+                yield _sse_event(event, data)
+                if event in TERMINAL_EVENTS:
+                    return
+            
+            last_status = None
+            if last_seq == 0:
+                event, last_status = await run_in_threadpool(status_event, document_id)
+                yield _sse_event(event, last_status)
+                if event in TERMINAL_EVENTS:
+                    return
+            
+            while not await request.is_disconnected():
+                try:
+                    event, data = await asyncio.wait_for(
+                        subscription.get(), timeout=settings.progress_poll_interval_seconds
+                    )
+                except asyncio.TimeoutError:
+                    # The job may be running in another process; fall back to the job store
+                    event, data = await run_in_threadpool(status_event, document_id)
+                    if data == last_status:
+                        yield ": keepalive\n\n"
+                        continue
+                    last_status = data
+                else:
+                    if data["seq"] <= last_seq:
+                        continue
+                    last_seq = data["seq"]
+                
+                yield _sse_event(event, data)
+                if event in TERMINAL_EVENTS:
+                    return
+        finally:
+            progress_broker.unsubscribe(document_id, subscription)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def status_event(document_id: str) -> tuple:
+    """Build an SSE (event, data) pair from the stored job status."""
+    status = get_job_queue().get_status(document_id)
+    if status is None:
+        return "completed", {"document_id": document_id, "status": ProcessingStatus.COMPLETED.value, "progress": 100}
+    
+    event = {
+        ProcessingStatus.COMPLETED: "completed",
+        ProcessingStatus.FAILED: "failed",
+    }.get(status.status, "progress")
+    
+    return event, {
+        "document_id": document_id,
+        "status": status.status.value,
+        "stage": status.current_stage,
+        "progress": status.progress_percentage,
+        "error_message": status.error_message
+    }
+
+
 @app.get("/api/v1/documents/{document_id}", response_model=DocumentExtraction)
 async def get_document(
     document_id: str,
+    request: Request,
+    fields: Optional[str] = None,
     authorized: bool = Depends(verify_api_key)
 ):
-    """Retrieve complete extraction for a document."""
-    if document_id not in document_store:
+    """
+    Retrieve extraction for a document.
+    
+    fields is a comma-separated list of top-level fields to return (e.g.
+    "document_type,metadata,structured_data"); omit it for the full extraction.
+    Per-word OCR results are better fetched page by page from /ocr.
+    Responses carry an ETag; a matching If-None-Match returns 304.
+    """
+    include = None
+    if fields:
+        include = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = include - set(DocumentExtraction.model_fields)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {sorted(unknown)}")
+    
+    repository = get_repository()
+    etag = repository.get_etag(document_id)
+    if etag is None:
+        get_document_or_404(document_id)  # Raises 409 while processing, else 404
+    
+    if include:
+        etag = f"{etag}-{hashlib.blake2b(','.join(sorted(include)).encode(), digest_size=4).hexdigest()}"
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    if include:
+        extraction = get_document_or_404(document_id)
+        return ORJSONResponse(extraction.model_dump(mode="json", include=include), headers=headers)
+    
+    # Full document: serve the bytes stored at write time, already gzip-compressed
+    serialized = repository.get_serialized(document_id)
+    if serialized is None:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    return document_store[document_id]
+    headers["Vary"] = "Accept-Encoding"
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(serialized.body, media_type="application/json", headers=headers)
+    return Response(gzip.decompress(serialized.body), media_type="application/json", headers=headers)
+
+
+@app.get("/api/v1/documents/{document_id}/ocr")
+async def get_document_ocr(
+    document_id: str,
+    page: int = 1,
+    authorized: bool = Depends(verify_api_key)
+):
+    """Get OCR results (words with bounding boxes) for one page of a document."""
+    extraction = get_document_or_404(document_id)
+    
+    page_numbers = sorted({result.page_number for result in extraction.ocr_results})
+    if page_numbers and not 1 <= page <= len(page_numbers):
+        raise HTTPException(status_code=404, detail=f"Page {page} not found ({len(page_numbers)} pages)")
+    
+    page_number = page_numbers[page - 1] if page_numbers else None
+    results = [result for result in extraction.ocr_results if result.page_number == page_number]
+    
+    return ORJSONResponse({
+        "document_id": document_id,
+        "page": page,
+        "total_pages": len(page_numbers),
+        "ocr_results": [result.model_dump(mode="json") for result in results]
+    })
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def get_document_or_404(document_id: str) -> DocumentExtraction:
+    """Load a stored document, or raise 409 while it is processing and 404 if unknown."""
+    extraction = get_repository().get(document_id)
+    
+    if extraction is None:
+        status = get_job_queue().get_status(document_id)
+        if status is not None and status.status in (ProcessingStatus.UPLOADED, ProcessingStatus.PROCESSING):
+            raise HTTPException(status_code=409, detail=f"Document is still {status.status.value}")
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    return extraction
 
 
 @app.post("/api/v1/query", response_model=QueryResponse)
 async def query_documents(
     request: QueryRequest,
-    authorized: bool = Depends(verify_api_key)
+    authorized: bool = Depends(verify_api_key),
+    admitted: None = Depends(admission_slot("query"))
 ):
     """
     Query documents using RAG (Retrieval Augmented Generation).
@@ -247,7 +915,7 @@ async def query_documents(
         logger.info(f"Processing query: {request.query}")
         
         pipe = get_pipeline()
-        response = pipe.rag_engine.query(request)
+        response = await run_in_threadpool(pipe.rag_engine.query, request)
         
         return response
     
@@ -256,6 +924,40 @@ async def query_documents(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _sse_event(event: str, data) -> str:
+    """Format a server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+@app.post("/api/v1/query/stream")
+async def query_documents_stream(
+    request: QueryRequest,
+    authorized: bool = Depends(verify_api_key),
+    admitted: None = Depends(admission_slot("query"))
+):
+    """
+    Query documents using RAG and stream the answer as server-sent events.
+    
+    Emits a `sources` event, one `token` event per answer chunk, an `insights`
+    event and a final `done` event carrying the complete QueryResponse.
+    """
+    query_counter.inc()
+    logger.info(f"Processing streaming query: {request.query}")
+    
+    pipe = get_pipeline()
+    
+    def event_stream():
+        for event, data in pipe.rag_engine.stream_query(request):
+            yield _sse_event(event, data)
+    
+    # Sync generator is iterated in a threadpool, keeping LLM I/O off the event loop
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/v1/insights", response_model=List[Insight])
 async def get_insights(
     document_ids: Optional[List[str]] = None,
@@ -268,10 +970,7 @@ async def get_insights(
     """
     try:
         # Get relevant documents
-        if document_ids:
-            extractions = [document_store[doc_id] for doc_id in document_ids if doc_id in document_store]
-        else:
-            extractions = list(document_store.values())
+        extractions = get_repository().list(document_ids=document_ids or None)
         
         if not extractions:
             return []
@@ -294,8 +993,10 @@ async def get_insights(
 
 @app.get("/api/v1/anomalies", response_model=List[Anomaly])
 async def get_anomalies(
+    response: Response,
     document_ids: Optional[List[str]] = None,
-    authorized: bool = Depends(verify_api_key)
+    authorized: bool = Depends(verify_api_key),
+    admitted: None = Depends(admission_slot("anomalies"))
 ):
     """
     Detect anomalies in processed documents.
@@ -303,17 +1004,18 @@ async def get_anomalies(
     Uses ML-based outlier detection and statistical analysis.
     """
     try:
-        # Get relevant documents
-        if document_ids:
-            extractions = [document_store[doc_id] for doc_id in document_ids if doc_id in document_store]
-        else:
-            extractions = list(document_store.values())
+        # Features are kept materialized; this only applies changes since the last request
+        frame = await run_in_threadpool(get_feature_store().frame, document_ids or None)
         
-        if not extractions:
+        if not len(frame):
             return []
         
+        # Only waits on training when no model has been saved yet; the model is never fitted per request
+        if not await run_in_threadpool(get_anomaly_models().ensure_model):
+            response.headers["X-Anomaly-Model"] = "unavailable"
+        
         pipe = get_pipeline()
-        anomalies = pipe.detect_anomalies(extractions)
+        anomalies = await run_in_threadpool(pipe.detect_anomalies_from_features, frame)
         
         anomaly_counter.inc(len(anomalies))
         
@@ -324,21 +1026,61 @@ async def get_anomalies(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/v1/anomalies/alerts", response_model=List[Anomaly])
+async def get_anomaly_alerts(
+    document_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    limit: int = 100,
+    authorized: bool = Depends(verify_api_key)
+):
+    """Anomalies and duplicates raised as documents were ingested, newest first."""
+    pipe = get_pipeline()
+    limit = min(limit, 1000)
+    
+    alerts: List[Anomaly] = []
+    for source in (pipe.online_scorer, pipe.duplicate_index):
+        alerts.extend(await run_in_threadpool(source.alerts, document_id=document_id, since=since, limit=limit))
+    return sorted(alerts, key=lambda anomaly: anomaly.detected_at, reverse=True)[:limit]
+
+
+@app.get("/api/v1/anomalies/validation", response_model=List[Anomaly])
+async def get_validation_errors(
+    document_ids: Optional[List[str]] = None,
+    document_type: Optional[str] = None,
+    authorized: bool = Depends(verify_api_key),
+    admitted: None = Depends(admission_slot("anomalies"))
+):
+    """Re-check stored documents against the validation rules (missing fields, totals, dates)."""
+    try:
+        extractions = await run_in_threadpool(
+            get_repository().list, document_ids=document_ids or None, document_type=document_type
+        )
+        
+        pipe = get_pipeline()
+        return await run_in_threadpool(pipe.validator.validate_batch, extractions)
+    
+    except Exception as e:
+        logger.error(f"Validation failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/api/v1/trends")
 async def get_trends(
-    authorized: bool = Depends(verify_api_key)
+    authorized: bool = Depends(verify_api_key),
+    admitted: None = Depends(admission_slot("trends"))
 ):
     """
     Analyze trends across all documents using time series analysis.
     """
     try:
-        extractions = list(document_store.values())
+        frame = await run_in_threadpool(get_feature_store().frame)
         
-        if len(extractions) < 10:
+        if len(frame) < 10:
             return {"message": "Insufficient data for trend analysis (need at least 10 documents)"}
         
+        # Keyed on the change seq the frame reflects, so unchanged data reuses the last forecast
         pipe = get_pipeline()
-        trends = pipe.analyze_trends(extractions)
+        trends = await run_in_threadpool(pipe.analyze_trends_from_features, frame, frame.seq)
         
         return trends
     
@@ -353,15 +1095,19 @@ async def delete_document(
     authorized: bool = Depends(verify_api_key)
 ):
     """Delete a document and its associated data."""
-    if document_id not in document_store:
+    repository = get_repository()
+    if not repository.exists(document_id):
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Remove from vector store
     pipe = get_pipeline()
     pipe.vector_store.delete_document(document_id)
+    pipe.online_scorer.remove([document_id])
+    pipe.duplicate_index.remove([document_id])
     
-    # Remove from document store
-    del document_store[document_id]
+    # Remove from document store, and its jobs so status and deduplication forget it
+    repository.delete(document_id)
+    get_job_queue().delete_for_documents([document_id])
     
     # Delete uploaded file (if exists)
     # Implementation depends on storage strategy
@@ -369,6 +1115,67 @@ async def delete_document(
     return {"status": "deleted", "document_id": document_id}
 
 
+@app.post("/api/v1/documents/purge")
+async def purge_documents(
+    uploader: Optional[str] = None,
+    document_type: Optional[str] = None,
+    uploaded_before: Optional[datetime] = None,
+    uploaded_after: Optional[datetime] = None,
+    authorized: bool = Depends(verify_api_key)
+):
+    """Bulk-delete documents matching uploader, type and/or upload date filters."""
+    if uploader is None and document_type is None and uploaded_before is None and uploaded_after is None:
+        raise HTTPException(status_code=400, detail="At least one purge filter is required")
+    
+    # The repository holds every stored document, including ones whose indexing failed
+    repository = get_repository()
+    purged = repository.find_ids(
+        uploader=uploader,
+        document_type=document_type,
+        uploaded_before=uploaded_before,
+        uploaded_after=uploaded_after
+    )
+    
+    pipe = get_pipeline()
+    pipe.vector_store.delete_documents(purged)
+    pipe.online_scorer.remove(purged)
+    pipe.duplicate_index.remove(purged)
+    repository.delete_many(purged)
+    get_job_queue().delete_for_documents(purged)
+    
+    return {"status": "purged", "count": len(purged), "document_ids": purged}
+
+
+@app.post("/api/v1/admin/warm-up")
+async def warm_up_subsystems(authorized: bool = Depends(verify_api_key)):
+    """Load all heavy subsystems now instead of on first use."""
+    start = time.perf_counter()
+    timings = await run_in_threadpool(preload_subsystems)
+    await run_in_threadpool(get_pipeline().load_components)
+    
+    return {
+        "status": "warm",
+        "elapsed_seconds": round(time.perf_counter() - start, 3),
+        "import_seconds": timings
+    }
+
+
+@app.get("/api/v1/admin/anomaly-model")
+async def get_anomaly_model(authorized: bool = Depends(verify_api_key)):
+    """Version, training-set summary and drift of the anomaly model in use."""
+    return await run_in_threadpool(get_anomaly_models().status)
+
+
+@app.post("/api/v1/admin/anomaly-model/retrain")
+async def retrain_anomaly_model(authorized: bool = Depends(verify_api_key)):
+    """Retrain the anomaly model on all stored documents and swap it in."""
+    model = await run_in_threadpool(get_anomaly_models().retrain, "manual")
+    if model is None:
+        raise HTTPException(status_code=409, detail="Anomaly model is already being retrained")
+    
+    return {"status": "retrained", "model": model.metadata.model_dump(mode="json")}
+
+
 if __name__ == "__main__":
     import uvicorn
     
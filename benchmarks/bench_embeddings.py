@@ -0,0 +1,78 @@
+"""
+Benchmark embedding backend throughput.
+
+Usage:
+    python benchmarks/bench_embeddings.py --backends hashing local openai --chunks 512
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.rag.embeddings import get_embedding_backend  # noqa: E402
+
+WORDS = (
+    "invoice total amount due vendor payment terms net tax subtotal balance "
+    "statement account transaction deposit withdrawal quantity unit price"
+).split()
+
+
+def make_chunks(count: int, words_per_chunk: int, seed: int = 42) -> list:
+    """Generate synthetic document chunks of roughly realistic length."""
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(WORDS) for _ in range(words_per_chunk)) + f" ${rng.randint(1, 99999)}"
+        for _ in range(count)
+    ]
+
+
+def bench_backend(name: str, chunks: list, repeats: int) -> dict:
+    """Time embed_documents for one backend, best of N runs."""
+    backend = get_embedding_backend(name)
+    backend.embed_documents(chunks[:8])  # Warm up (model load, connection setup)
+    
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.embed_documents(chunks)
+        timings.append(time.perf_counter() - start)
+    
+    best = min(timings)
+    return {
+        'backend': name,
+        'model': backend.model_name,
+        'dimension': backend.dimension,
+        'seconds': best,
+        'chunks_per_second': len(chunks) / best,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', default=['hashing', 'local', 'openai'])
+    parser.add_argument('--chunks', type=int, default=256)
+    parser.add_argument('--words', type=int, default=200, help='Words per chunk')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    
+    chunks = make_chunks(args.chunks, args.words)
+    print(f"Embedding {len(chunks)} chunks of ~{args.words} words (best of {args.repeats})")
+    print(f"{'backend':<10} {'model':<42} {'dim':>5} {'seconds':>9} {'chunks/s':>10}")
+    
+    for name in args.backends:
+        try:
+            result = bench_backend(name, chunks, args.repeats)
+        except Exception as e:
+            print(f"{name:<10} skipped: {e}")
+            continue
+        print(
+            f"{result['backend']:<10} {result['model']:<42} {result['dimension']:>5} "
+            f"{result['seconds']:>9.3f} {result['chunks_per_second']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark GET /documents/{id} serialization paths for large extractions.
+
+Compares FastAPI's default path (validate + jsonable_encoder + json.dumps),
+model_dump + orjson, and serving the bytes pre-serialized at write time.
+
+Usage:
+    python benchmarks/bench_serialization.py --pages 20 --words-per-page 400
+"""
+import argparse
+import gzip
+import json
+import random
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import orjson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from src.models.schemas import (  # noqa: E402
+    BoundingBox, Currency, DocumentExtraction, DocumentMetadata, DocumentType,
+    InvoiceExtraction, MonetaryAmount, OCRResult
+)
+
+WORDS = (
+    "invoice total amount due vendor payment terms net tax subtotal balance "
+    "statement account transaction deposit withdrawal quantity unit price"
+).split()
+
+
+def make_extraction(pages: int, words_per_page: int, seed: int = 42) -> DocumentExtraction:
+    """Build a synthetic extraction with per-word OCR boxes."""
+    rng = random.Random(seed)
+    ocr_results = [
+        OCRResult(
+            text=rng.choice(WORDS),
+            confidence=rng.random(),
+            bounding_box=BoundingBox(
+                x=rng.randint(0, 2400), y=rng.randint(0, 3300), width=80, height=24, page=page
+            ),
+            page_number=page
+        )
+        for page in range(pages)
+        for _ in range(words_per_page)
+    ]
+    
+    return DocumentExtraction(
+        document_id="bench-doc",
+        document_type=DocumentType.INVOICE,
+        metadata=DocumentMetadata(
+            document_id="bench-doc",
+            filename="bench.pdf",
+            file_size=1024 * 1024,
+            mime_type="application/pdf",
+            upload_timestamp=datetime(2025, 11, 1),
+            uploader="bench"
+        ),
+        ocr_results=ocr_results,
+        structured_data=InvoiceExtraction(
+            vendor_name="Acme Corp",
+            total_amount=MonetaryAmount(amount=1500.0, currency=Currency.USD)
+        ),
+        raw_text=" ".join(result.text for result in ocr_results)
+    )
+
+
+def time_best(func, repeats: int) -> float:
+    """Best wall time of N calls."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--words-per-page', type=int, default=400)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+    
+    extraction = make_extraction(args.pages, args.words_per_page)
+    stored = gzip.compress(extraction.model_dump_json().encode("utf-8"), compresslevel=6)
+    
+    paths = {
+        # What FastAPI does for a response_model endpoint returning the model
+        'fastapi_default': lambda: json.dumps(
+            jsonable_encoder(DocumentExtraction.model_validate(extraction))
+        ).encode("utf-8"),
+        'model_dump_orjson': lambda: orjson.dumps(extraction.model_dump(mode="json")),
+        'model_dump_json': lambda: extraction.model_dump_json().encode("utf-8"),
+        'model_dump_gzip': lambda: gzip.compress(extraction.model_dump_json().encode("utf-8"), compresslevel=6),
+        # Stored gzip bytes are sent as-is to gzip clients; others get them decompressed
+        'stored_decompress': lambda: gzip.decompress(stored),
+    }
+    
+    print(
+        f"Extraction with {len(extraction.ocr_results)} OCR words, "
+        f"{len(extraction.model_dump_json()) / 1024:.0f} KB JSON, "
+        f"{len(stored) / 1024:.0f} KB gzip (best of {args.repeats})"
+    )
+    print(f"{'path':<20} {'ms':>10} {'speedup':>9}")
+    
+    baseline = None
+    for name, func in paths.items():
+        seconds = time_best(func, args.repeats)
+        baseline = baseline or seconds
+        print(f"{name:<20} {seconds * 1000:>10.2f} {baseline / max(seconds, 1e-9):>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
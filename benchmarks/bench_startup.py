@@ -0,0 +1,83 @@
+"""
+Benchmark API cold start: time to import the app in a fresh interpreter.
+
+Heavy subsystems (OCR/table extraction, LLM clients, vector store, anomaly
+ML) load on first use, so importing the API should stay fast. Also times a
+full warm-up for comparison. Exits non-zero if the import exceeds
+--max-seconds, so it can guard against eager imports creeping back in.
+
+Usage:
+    python benchmarks/bench_startup.py --repeats 5 --max-seconds 2.5
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = [
+    "camelot", "pdfplumber", "chromadb", "langchain_openai",
+    "prophet", "sklearn", "statsmodels",
+]
+
+IMPORT_SNIPPET = f"""
+import json, sys, time
+start = time.perf_counter()
+import api
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+WARM_UP_SNIPPET = """
+import json, time
+start = time.perf_counter()
+import api
+api.preload_subsystems()
+print(json.dumps({"seconds": time.perf_counter() - start, "loaded": []}))
+"""
+
+
+def run(snippet: str) -> dict:
+    """Run a snippet in a fresh interpreter and return its JSON report plus wall time."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["wall_seconds"] = time.perf_counter() - start
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=2.5,
+                        help='fail if the best import time exceeds this')
+    parser.add_argument('--skip-warm-up', action='store_true')
+    args = parser.parse_args()
+    
+    runs = [run(IMPORT_SNIPPET) for _ in range(args.repeats)]
+    best = min(runs, key=lambda r: r["seconds"])
+    
+    print(f"{'phase':<16} {'import s':>9} {'process s':>10}")
+    print(f"{'import api':<16} {best['seconds']:>9.2f} {best['wall_seconds']:>10.2f}")
+    
+    if not args.skip_warm_up:
+        warm = run(WARM_UP_SNIPPET)
+        print(f"{'full warm-up':<16} {warm['seconds']:>9.2f} {warm['wall_seconds']:>10.2f}")
+    
+    if best["loaded"]:
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(best['loaded'])}")
+        sys.exit(1)
+    if best["seconds"] > args.max_seconds:
+        print(f"FAIL: import took {best['seconds']:.2f}s (limit {args.max_seconds:.2f}s)")
+        sys.exit(1)
+    
+    print(f"OK: import within {args.max_seconds:.2f}s with no heavy modules loaded")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Gunicorn configuration for multi-process serving.
+
+The app is imported once in the master (preload_app) and heavy dependencies
+and the local embedding model are loaded before workers fork, so workers
+share those memory pages copy-on-write. Everything mutable lives in shared
+stores opened per worker after fork: the job queue and chunk manifest
+(SQLite, WAL), the document repository (DATABASE_URL) and, with more than
+one worker, a Chroma server (CHROMA_HOST). Set PROMETHEUS_MULTIPROC_DIR to
+an empty directory so /metrics aggregates all workers.
+
+Usage:
+    gunicorn -c gunicorn.conf.py
+"""
+import gc
+import logging
+import multiprocessing
+import os
+
+wsgi_app = "api:app"
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count(), 4)))
+
+# Import the app (and its dependencies) in the master before forking
+preload_app = True
+
+# Workers warm up before serving; allow for model loading and slow OCR requests
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+
+def when_ready(server):
+    """Load heavy subsystems in the master, then freeze them out of GC scans."""
+    import api
+    
+    api.preload_subsystems()
+    
+    if workers > 1 and not api.settings.chroma_host:
+        logging.getLogger("gunicorn.error").warning(
+            "Running %d workers with an embedded Chroma index; set CHROMA_HOST so "
+            "workers share one vector store", workers
+        )
+    
+    # Keep preloaded objects out of the collector so it doesn't dirty shared pages
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live metric files so /metrics aggregates stay accurate."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        
+        multiprocess.mark_process_dead(worker.pid)
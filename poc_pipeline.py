@@ -3,21 +3,25 @@ End-to-end document processing pipeline.
 
 This orchestrates: ingestion → OCR → LLM extraction → vectorization → anomaly detection
 """
+import importlib
 import logging
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
 
 from src.models.schemas import (
     DocumentExtraction, DocumentMetadata, DocumentType, 
-    ProcessingStatus, Anomaly
+    ProcessingStatus, Anomaly, AnomalyType
 )
-from src.ocr.preprocessor import DocumentPreprocessor
-from src.extraction.llm_extractor import LLMExtractor
-from src.rag.rag_engine import VectorStore, RAGEngine
-from src.anomaly.detector import AnomalyDetector, TrendAnalyzer, ValidationEngine
 from src.config import get_settings
+from src.utils.helpers import timed_operation, timed_stage
+
+if TYPE_CHECKING:
+    from src.anomaly.features import FeatureFrame
+    from src.rag.embeddings import EmbeddingBackend
 
 # Configure logging
 logging.basicConfig(
@@ -27,29 +31,101 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Component classes whose modules pull in OCR, LLM, vector store and ML libraries.
+# They are imported on first use; as module attributes they can still be patched.
+_LAZY_IMPORTS = {
+    "DocumentPreprocessor": "src.ocr.preprocessor",
+    "LLMExtractor": "src.extraction.llm_extractor",
+    "VectorStore": "src.rag.rag_engine",
+    "RAGEngine": "src.rag.rag_engine",
+    "AnomalyDetector": "src.anomaly.detector",
+    "TrendAnalyzer": "src.anomaly.detector",
+    "ValidationEngine": "src.anomaly.detector",
+    "OnlineAnomalyScorer": "src.anomaly.online",
+    "DuplicateIndex": "src.anomaly.duplicates",
+}
+
+
+def __getattr__(name: str) -> Any:
+    """Import a pipeline component class on first access."""
+    module = _LAZY_IMPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def _component_class(name: str) -> Any:
+    """Resolve a component class, preferring an already imported (or patched) one."""
+    return globals()[name] if name in globals() else __getattr__(name)
+
+
+class _Component:
+    """Pipeline attribute built on first access, so unused subsystems are never loaded."""
+    
+    def __init__(self, factory: Callable[["DocumentPipeline"], Any]):
+        self.factory = factory
+    
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+    
+    def __get__(self, pipeline: Optional["DocumentPipeline"], owner: Optional[type] = None) -> Any:
+        if pipeline is None:
+            return self
+        
+        with pipeline._components_lock:
+            if self.name not in pipeline.__dict__:
+                start = time.perf_counter()
+                pipeline.__dict__[self.name] = self.factory(pipeline)
+                logger.info(f"Loaded pipeline component {self.name} in {time.perf_counter() - start:.2f}s")
+        return pipeline.__dict__[self.name]
+
 
 class DocumentPipeline:
     """Main document processing pipeline."""
     
-    def __init__(self):
-        """Initialize pipeline components."""
-        logger.info("Initializing document processing pipeline...")
-        
-        self.preprocessor = DocumentPreprocessor()
-        self.llm_extractor = LLMExtractor()
-        self.vector_store = VectorStore()
-        self.rag_engine = RAGEngine(self.vector_store)
-        self.anomaly_detector = AnomalyDetector()
-        self.trend_analyzer = TrendAnalyzer()
-        self.validator = ValidationEngine()
-        
-        logger.info("Pipeline initialized successfully")
+    preprocessor = _Component(lambda pipeline: _component_class("DocumentPreprocessor")())
+    llm_extractor = _Component(lambda pipeline: _component_class("LLMExtractor")())
+    vector_store = _Component(
+        lambda pipeline: _component_class("VectorStore")(embedding_backend=pipeline.embedding_backend)
+    )
+    rag_engine = _Component(lambda pipeline: _component_class("RAGEngine")(pipeline.vector_store))
+    anomaly_detector = _Component(lambda pipeline: _component_class("AnomalyDetector")())
+    trend_analyzer = _Component(lambda pipeline: _component_class("TrendAnalyzer")())
+    duplicate_index = _Component(lambda pipeline: _component_class("DuplicateIndex")())
+    validator = _Component(
+        lambda pipeline: _component_class("ValidationEngine")(duplicate_index=pipeline.duplicate_index)
+    )
+    online_scorer = _Component(lambda pipeline: _component_class("OnlineAnomalyScorer")())
+    
+    COMPONENTS = (
+        "preprocessor", "llm_extractor", "vector_store", "rag_engine",
+        "anomaly_detector", "trend_analyzer", "duplicate_index", "validator", "online_scorer",
+    )
+    
+    def __init__(self, embedding_backend: Optional["EmbeddingBackend"] = None):
+        """Initialize pipeline (components load on first use; see load_components())."""
+        self.embedding_backend = embedding_backend
+        self._components_lock = threading.RLock()
+        logger.info("Document processing pipeline created")
+    
+    def load_components(self) -> None:
+        """Build every component now instead of on first use (warm-up)."""
+        for name in self.COMPONENTS:
+            getattr(self, name)
+        logger.info("Pipeline components loaded")
     
     def process_document(
         self, 
         file_path: str,
         uploader: str = "system",
-        source_type: str = "upload"
+        source_type: str = "upload",
+        document_id: Optional[str] = None,
+        filename: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        progress_callback: Optional[Callable[..., None]] = None
     ) -> DocumentExtraction:
         """
         Process a single document through the complete pipeline.
@@ -58,51 +134,77 @@ class DocumentPipeline:
             file_path: Path to the document file
             uploader: User/system that uploaded the document
             source_type: Source of the document (upload, email, sftp, etc.)
+            document_id: ID to assign (generated if not given)
+            filename: Original filename (defaults to the file's name on disk)
+            content_hash: SHA-256 of the file if already computed during upload
+            progress_callback: Called with (stage, progress_percentage, details) as
+                steps start and pages are rasterized/OCR'd
         
         Returns:
             DocumentExtraction with all extracted data
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
+        
+        def report(stage: str, progress: int, details: Optional[Dict[str, Any]] = None) -> None:
+            if progress_callback:
+                progress_callback(stage, progress, details)
+        
+        def report_page(event: str, page: int, total_pages: int) -> None:
+            # OCR spans 5-40% of overall progress
+            progress = 5 + (35 * page // total_pages if total_pages else 0)
+            report(event, progress, {"page": page, "total_pages": total_pages})
         
         try:
             # Generate document ID
-            document_id = str(uuid.uuid4())
+            document_id = document_id or str(uuid.uuid4())
             logger.info(f"Processing document {document_id}: {file_path}")
             
             # Create metadata
             path = Path(file_path)
             metadata = DocumentMetadata(
                 document_id=document_id,
-                filename=path.name,
+                filename=filename or path.name,
                 file_size=path.stat().st_size,
                 mime_type=self._get_mime_type(path),
                 upload_timestamp=time.time(),
                 uploader=uploader,
-                source_type=source_type
+                source_type=source_type,
+                content_hash=content_hash
             )
             
             # Step 1: OCR & Preprocessing
             logger.info(f"[{document_id}] Step 1: OCR & Preprocessing")
-            ocr_results, tables, full_text = self.preprocessor.process_document(file_path)
+            report("ocr", 5)
+            with timed_stage("ocr"):
+                ocr_results, tables, full_text = self.preprocessor.process_document(
+                    file_path, page_callback=report_page if progress_callback else None
+                )
             
             # Step 2: Document Classification
             logger.info(f"[{document_id}] Step 2: Document Classification")
-            doc_type = self.llm_extractor.classify_document(full_text)
+            report("classification", 40)
+            with timed_stage("classification"):
+                doc_type = self.llm_extractor.classify_document(full_text)
             logger.info(f"[{document_id}] Classified as: {doc_type.value}")
+            report("classified", 45, {"document_type": doc_type.value})
             
             # Step 3: Structured Data Extraction
             logger.info(f"[{document_id}] Step 3: Structured Data Extraction")
+            report("extraction", 50)
             tables_dict = [{"headers": t.headers, "rows": t.rows} for t in tables]
-            structured_data = self.llm_extractor.extract_structured_data(
-                full_text, doc_type, tables_dict
-            )
+            with timed_stage("extraction"):
+                structured_data = self.llm_extractor.extract_structured_data(
+                    full_text, doc_type, tables_dict
+                )
             
             # Step 4: Entity Extraction
             logger.info(f"[{document_id}] Step 4: Entity Extraction")
-            entities = self.llm_extractor.extract_generic_entities(full_text, doc_type)
+            report("entity_extraction", 65)
+            with timed_stage("entity_extraction"):
+                entities = self.llm_extractor.extract_generic_entities(full_text, doc_type)
             
             # Create extraction result
-            processing_time = time.time() - start_time
+            processing_time = time.perf_counter() - start_time
             extraction = DocumentExtraction(
                 document_id=document_id,
                 document_type=doc_type,
@@ -117,16 +219,36 @@ class DocumentPipeline:
             
             # Step 5: Vectorization & Storage
             logger.info(f"[{document_id}] Step 5: Vectorization")
-            self.vector_store.add_document(extraction)
+            report("vectorization", 80)
+            with timed_stage("vectorization"):
+                index_changes = self.vector_store.add_document(extraction)
+            report("embedded", 90, index_changes)
             
             # Step 6: Validation
             logger.info(f"[{document_id}] Step 6: Validation")
-            validation_anomalies = self.validator.validate_extraction(extraction)
+            report("validation", 95)
+            with timed_stage("validation"):
+                validation_anomalies = self.validator.validate_extraction(extraction)
+            duplicates = [a for a in validation_anomalies if a.anomaly_type == AnomalyType.DUPLICATE]
+            if duplicates:
+                report("duplicates", 96, {
+                    "anomalies": [anomaly.model_dump(mode="json") for anomaly in duplicates]
+                })
+            
+            # Step 7: Online anomaly scoring against running per-vendor/type statistics
+            logger.info(f"[{document_id}] Step 7: Anomaly Scoring")
+            report("anomaly_scoring", 97)
+            with timed_stage("anomaly_scoring"):
+                ingest_anomalies = self.online_scorer.observe(extraction)
+            if ingest_anomalies:
+                report("anomalies", 98, {
+                    "anomalies": [anomaly.model_dump(mode="json") for anomaly in ingest_anomalies]
+                })
             
             logger.info(
                 f"[{document_id}] Processing complete in {processing_time:.2f}s. "
                 f"Extracted {len(entities)} entities, {len(tables)} tables. "
-                f"Found {len(validation_anomalies)} validation issues."
+                f"Found {len(validation_anomalies)} validation issues, {len(ingest_anomalies)} anomalies."
             )
             
             return extraction
@@ -135,19 +257,23 @@ class DocumentPipeline:
             logger.error(f"Pipeline processing failed for {file_path}: {e}", exc_info=True)
             raise
     
-    def process_batch(self, file_paths: List[str]) -> List[DocumentExtraction]:
-        """Process multiple documents."""
-        extractions = []
+    def process_batch(self, file_paths: List[str], max_workers: Optional[int] = None) -> List[DocumentExtraction]:
+        """Process multiple documents concurrently, preserving input order."""
+        max_workers = max_workers or settings.job_workers
         
-        for file_path in file_paths:
+        def process(file_path: str) -> Optional[DocumentExtraction]:
             try:
-                extraction = self.process_document(file_path)
-                extractions.append(extraction)
+                return self.process_document(file_path)
             except Exception as e:
                 logger.error(f"Failed to process {file_path}: {e}")
+                return None
         
-        return extractions
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(process, file_paths))
+        
+        return [extraction for extraction in results if extraction is not None]
     
+    @timed_operation("anomaly_detection")
     def detect_anomalies(self, extractions: List[DocumentExtraction]) -> List[Anomaly]:
         """Run anomaly detection on processed documents."""
         logger.info(f"Running anomaly detection on {len(extractions)} documents")
@@ -169,11 +295,38 @@ class DocumentPipeline:
         logger.info(f"Detected {len(all_anomalies)} total anomalies")
         return all_anomalies
     
+    @timed_operation("anomaly_detection")
+    def detect_anomalies_from_features(self, frame: "FeatureFrame") -> List[Anomaly]:
+        """
+        Run anomaly detection on a materialized feature frame.
+        
+        Outliers are only scored with a model trained on the whole store by
+        AnomalyModelManager; without one, only amount anomalies are returned.
+        """
+        logger.info(f"Running anomaly detection on {len(frame)} documents")
+        
+        all_anomalies = self.anomaly_detector.detect_outliers_matrix(frame.document_ids, frame.values)
+        all_anomalies.extend(self.anomaly_detector.detect_amount_anomalies_matrix(
+            frame.document_ids, frame.column('total_amount'),
+            frame.currencies, frame.vendor_names, frame.document_types
+        ))
+        
+        logger.info(f"Detected {len(all_anomalies)} total anomalies")
+        return all_anomalies
+    
+    @timed_operation("trend_analysis")
     def analyze_trends(self, extractions: List[DocumentExtraction]) -> dict:
         """Analyze trends in document data."""
         logger.info(f"Analyzing trends across {len(extractions)} documents")
         return self.trend_analyzer.analyze_trends(extractions)
     
+    @timed_operation("trend_analysis")
+    def analyze_trends_from_features(self, frame: "FeatureFrame", data_version: Optional[int] = None) -> dict:
+        """Analyze trends from a materialized feature frame (cached per data version)."""
+        return self.trend_analyzer.analyze_series(
+            frame.upload_timestamps, frame.column('total_amount'), data_version=data_version
+        )
+    
     def _get_mime_type(self, path: Path) -> str:
         """Determine MIME type from file extension."""
         suffix = path.suffix.lower()
@@ -3,35 +3,57 @@ Anomaly detection using ML algorithms and statistical methods.
 """
 import logging
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, NamedTuple, Optional
 import uuid
 
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import StandardScaler
-from prophet import Prophet
-from statsmodels.tsa.seasonal import seasonal_decompose
 
+from src.anomaly.duplicates import DuplicateIndex
+from src.anomaly.features import FEATURE_NAMES
+from src.anomaly.reconciliation import reconcile_statement
+from src.anomaly.rules import RuleEngine
 from src.models.schemas import (
-    DocumentExtraction, Anomaly, AnomalyType, MonetaryAmount
+    DocumentExtraction, Anomaly, AnomalyModelMetadata, AnomalyType, MonetaryAmount
 )
+from src.utils.cache import TTLCache
+from src.utils.helpers import timed_operation, timed_stage
+from src.config import get_settings
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Scale factors that turn the median / mean absolute deviation into a standard deviation estimate
+MAD_SCALE = 1.4826
+MEAN_AD_SCALE = 1.2533
+
+
+class AnomalyModel(NamedTuple):
+    """A fitted scaler and isolation forest; replaced as a whole, never mutated."""
+    scaler: Any
+    isolation_forest: Any
+    metadata: AnomalyModelMetadata
 
 
 class AnomalyDetector:
     """ML-based anomaly detection for financial documents."""
     
     def __init__(self):
-        """Initialize anomaly detector."""
-        self.isolation_forest = IsolationForest(
-            contamination=0.1,  # Expect 10% anomalies
-            random_state=42,
-            n_estimators=100
-        )
-        self.scaler = StandardScaler()
-        self.fitted = False
+        """Initialize anomaly detector (scikit-learn is imported on first fit)."""
+        # Swapped by a single assignment, so scoring never sees a half-updated model
+        self.model: Optional[AnomalyModel] = None
+    
+    @property
+    def fitted(self) -> bool:
+        return self.model is not None
+    
+    @property
+    def isolation_forest(self) -> Any:
+        return self.model.isolation_forest if self.model else None
+    
+    @property
+    def scaler(self) -> Any:
+        return self.model.scaler if self.model else None
     
     def extract_features(self, extractions: List[DocumentExtraction]) -> pd.DataFrame:
         """Extract numerical features from document extractions."""
@@ -66,110 +88,202 @@ class AnomalyDetector:
         """Train anomaly detector on historical data."""
         try:
             df = self.extract_features(extractions)
-            
-            # Select numerical features
-            numerical_features = ['processing_time', 'text_length', 'num_tables', 
-                                'num_entities', 'avg_confidence', 'total_amount']
-            
-            X = df[numerical_features].fillna(0)
-            
-            # Scale features
-            X_scaled = self.scaler.fit_transform(X)
-            
-            # Train isolation forest
-            self.isolation_forest.fit(X_scaled)
-            self.fitted = True
-            
-            logger.info(f"Anomaly detector trained on {len(extractions)} documents")
+            self.fit_matrix(df[FEATURE_NAMES].to_numpy(dtype=float))
         except Exception as e:
             logger.error(f"Failed to train anomaly detector: {e}")
     
+    def fit_matrix(self, X: np.ndarray) -> None:
+        """Train on a feature matrix with FEATURE_NAMES columns (NaN is treated as 0)."""
+        self.swap(self.train(X))
+    
+    @timed_operation("anomaly_model_fit")
+    def train(self, X: np.ndarray, reason: str = "initial", data_version: int = 0) -> AnomalyModel:
+        """Fit a new model on a feature matrix without touching the one in use."""
+        from sklearn.ensemble import IsolationForest
+        from sklearn.preprocessing import StandardScaler
+        
+        X = np.nan_to_num(X)
+        isolation_forest = IsolationForest(
+            contamination=0.1,  # Expect 10% anomalies
+            random_state=42,
+            n_estimators=100
+        )
+        scaler = StandardScaler()
+        
+        # Scale features, then train isolation forest
+        isolation_forest.fit(scaler.fit_transform(X))
+        
+        logger.info(f"Anomaly detector trained on {len(X)} documents")
+        return AnomalyModel(scaler, isolation_forest, AnomalyModelMetadata(
+            reason=reason,
+            training_documents=len(X),
+            data_version=data_version,
+            feature_names=list(FEATURE_NAMES),
+            feature_means=X.mean(axis=0).tolist(),
+            feature_stds=X.std(axis=0).tolist()
+        ))
+    
+    def swap(self, model: AnomalyModel) -> None:
+        """Start scoring with a new model; requests already scoring finish on the old one."""
+        self.model = model
+    
+    def drift(self, X: np.ndarray) -> float:
+        """Largest shift of a feature mean since training, in training standard deviations."""
+        model = self.model
+        if model is None or not len(X):
+            return 0.0
+        
+        means = np.asarray(model.metadata.feature_means)
+        # Constant training features would otherwise make any change infinite drift
+        stds = np.maximum(np.asarray(model.metadata.feature_stds), 1e-9 + 1e-3 * np.abs(means))
+        return float(np.max(np.abs(np.nan_to_num(X).mean(axis=0) - means) / stds))
+    
     def detect_outliers(self, extractions: List[DocumentExtraction]) -> List[Anomaly]:
         """Detect outlier documents using Isolation Forest."""
         if not self.fitted:
             logger.warning("Anomaly detector not fitted. Skipping outlier detection.")
             return []
         
+        df = self.extract_features(extractions)
+        return self.detect_outliers_matrix(
+            df['document_id'].to_numpy(), df[FEATURE_NAMES].to_numpy(dtype=float)
+        )
+    
+    def detect_outliers_matrix(self, document_ids: np.ndarray, X: np.ndarray) -> List[Anomaly]:
+        """Detect outlier rows of a feature matrix using Isolation Forest."""
+        model = self.model
+        if model is None:
+            logger.warning("Anomaly detector not fitted. Skipping outlier detection.")
+            return []
+        
         try:
-            df = self.extract_features(extractions)
-            numerical_features = ['processing_time', 'text_length', 'num_tables', 
-                                'num_entities', 'avg_confidence', 'total_amount']
-            
-            X = df[numerical_features].fillna(0)
-            X_scaled = self.scaler.transform(X)
+            X_scaled = model.scaler.transform(np.nan_to_num(X))
             
             # Predict anomalies (-1 for anomalies, 1 for normal)
-            predictions = self.isolation_forest.predict(X_scaled)
-            anomaly_scores = self.isolation_forest.score_samples(X_scaled)
+            predictions = model.isolation_forest.predict(X_scaled)
+            anomaly_scores = model.isolation_forest.score_samples(X_scaled)
             
             anomalies = []
-            for i, (pred, score) in enumerate(zip(predictions, anomaly_scores)):
-                if pred == -1:
-                    # Determine severity based on score
-                    severity = self._calculate_severity(score)
-                    
-                    anomaly = Anomaly(
-                        anomaly_id=str(uuid.uuid4()),
-                        document_id=df.iloc[i]['document_id'],
-                        anomaly_type=AnomalyType.OUTLIER_AMOUNT,
-                        severity=severity,
-                        description=f"Document exhibits unusual characteristics (anomaly score: {score:.3f})",
-                        confidence_score=abs(score),
-                    )
-                    anomalies.append(anomaly)
+            for i in np.flatnonzero(predictions == -1):
+                score = anomaly_scores[i]
+                anomaly = Anomaly(
+                    anomaly_id=str(uuid.uuid4()),
+                    document_id=document_ids[i],
+                    anomaly_type=AnomalyType.OUTLIER_AMOUNT,
+                    severity=self._calculate_severity(score),
+                    description=f"Document exhibits unusual characteristics (anomaly score: {score:.3f})",
+                    confidence_score=abs(score),
+                )
+                anomalies.append(anomaly)
             
-            logger.info(f"Detected {len(anomalies)} outliers out of {len(extractions)} documents")
+            logger.info(f"Detected {len(anomalies)} outliers out of {len(X)} documents")
             return anomalies
         except Exception as e:
             logger.error(f"Outlier detection failed: {e}")
             return []
     
-    def detect_amount_anomalies(self, extractions: List[DocumentExtraction], threshold_std: float = 3.0) -> List[Anomaly]:
-        """Detect anomalous amounts using statistical thresholds."""
+    def detect_amount_anomalies(
+        self,
+        extractions: List[DocumentExtraction],
+        threshold: float = 3.5,
+        min_group_size: int = 5
+    ) -> List[Anomaly]:
+        """Detect anomalous amounts using robust per-group statistics."""
+        rows = []
+        for extraction in extractions:
+            total = getattr(extraction.structured_data, 'total_amount', None)
+            if total and isinstance(total, MonetaryAmount):
+                rows.append((
+                    extraction.document_id, total.amount, total.currency.value,
+                    getattr(extraction.structured_data, 'vendor_name', None), extraction.document_type.value
+                ))
+        
+        if not rows:
+            return []
+        
+        document_ids, amounts, currencies, vendor_names, document_types = (np.array(column) for column in zip(*rows))
+        return self.detect_amount_anomalies_matrix(
+            document_ids, amounts.astype(float), currencies, vendor_names, document_types,
+            threshold=threshold, min_group_size=min_group_size
+        )
+    
+    def detect_amount_anomalies_matrix(
+        self,
+        document_ids: np.ndarray,
+        amounts: np.ndarray,
+        currencies: Optional[np.ndarray] = None,
+        vendor_names: Optional[np.ndarray] = None,
+        document_types: Optional[np.ndarray] = None,
+        threshold: float = 3.5,
+        min_group_size: int = 5
+    ) -> List[Anomaly]:
+        """
+        Detect totals far from the median of comparable documents (NaN totals are ignored).
+        
+        Documents are compared within (currency, vendor, document type); vendors
+        with fewer than min_group_size documents are compared within (currency,
+        document type) instead. Scores are robust z-scores (median and MAD), so
+        the outliers being looked for cannot inflate the spread and hide.
+        """
         try:
-            amounts = []
-            doc_ids = []
-            
-            for extraction in extractions:
-                if hasattr(extraction.structured_data, 'total_amount'):
-                    total = extraction.structured_data.total_amount
-                    if total and isinstance(total, MonetaryAmount):
-                        amounts.append(total.amount)
-                        doc_ids.append(extraction.document_id)
-            
-            if not amounts:
+            missing = np.full(len(amounts), None, dtype=object)
+            df = pd.DataFrame({
+                'document_id': document_ids,
+                'amount': amounts,
+                'currency': missing if currencies is None else currencies,
+                'vendor_name': missing if vendor_names is None else vendor_names,
+                'document_type': missing if document_types is None else document_types,
+            }).dropna(subset=['amount'])
+            if df.empty:
                 return []
             
-            amounts_array = np.array(amounts)
-            mean = np.mean(amounts_array)
-            std = np.std(amounts_array)
+            # Unknown keys form their own group rather than being dropped
+            keys = df[['currency', 'vendor_name', 'document_type']].fillna('')
+            by_vendor = _robust_scores(df['amount'], [keys['currency'], keys['vendor_name'], keys['document_type']])
+            by_type = _robust_scores(df['amount'], [keys['currency'], keys['document_type']])
             
-            anomalies = []
-            for i, amount in enumerate(amounts):
-                z_score = abs((amount - mean) / std) if std > 0 else 0
-                
-                if z_score > threshold_std:
-                    severity = "critical" if z_score > 5 else "high" if z_score > 4 else "medium"
-                    
-                    anomaly = Anomaly(
-                        anomaly_id=str(uuid.uuid4()),
-                        document_id=doc_ids[i],
-                        anomaly_type=AnomalyType.OUTLIER_AMOUNT,
-                        severity=severity,
-                        description=f"Amount ${amount:,.2f} is {z_score:.1f} standard deviations from mean ${mean:,.2f}",
-                        field_name="total_amount",
-                        expected_value=mean,
-                        actual_value=amount,
-                        confidence_score=min(z_score / 5.0, 1.0)
-                    )
-                    anomalies.append(anomaly)
+            vendor_level = by_vendor['size'] >= min_group_size
+            stats = by_vendor.where(vendor_level, by_type)
+            flagged = (stats['size'] >= min_group_size) & (stats['z'].abs() > threshold)
+            
+            anomalies = [
+                self._amount_anomaly(row, median, z, row.vendor_name if by_vendor_level else None)
+                for row, median, z, by_vendor_level in zip(
+                    df[flagged].itertuples(index=False),
+                    stats.loc[flagged, 'median'],
+                    stats.loc[flagged, 'z'],
+                    vendor_level[flagged]
+                )
+            ]
             
-            logger.info(f"Detected {len(anomalies)} amount anomalies")
+            logger.info(f"Detected {len(anomalies)} amount anomalies out of {len(df)} totals")
             return anomalies
         except Exception as e:
             logger.error(f"Amount anomaly detection failed: {e}")
             return []
     
+    def _amount_anomaly(self, row: Any, median: float, z_score: float, vendor_name: Optional[str]) -> Anomaly:
+        """Build the anomaly for a flagged total."""
+        magnitude = abs(z_score)
+        severity = "critical" if magnitude > 7 else "high" if magnitude > 5 else "medium"
+        currency = f" {row.currency}" if row.currency else ""
+        peers = vendor_name or f"{row.document_type or 'document'}s"
+        
+        return Anomaly(
+            anomaly_id=str(uuid.uuid4()),
+            document_id=row.document_id,
+            anomaly_type=AnomalyType.OUTLIER_AMOUNT,
+            severity=severity,
+            description=(
+                f"Amount {row.amount:,.2f}{currency} is {magnitude:.1f} robust standard deviations "
+                f"{'above' if z_score > 0 else 'below'} the median {median:,.2f}{currency} for {peers}"
+            ),
+            field_name="total_amount",
+            expected_value=float(median),
+            actual_value=float(row.amount),
+            confidence_score=min(magnitude / 7.0, 1.0)
+        )
+    
     def _calculate_severity(self, anomaly_score: float) -> str:
         """Calculate severity based on anomaly score."""
         abs_score = abs(anomaly_score)
@@ -183,142 +297,217 @@ class AnomalyDetector:
             return "low"
 
 
+def _robust_scores(amounts: pd.Series, keys: List[pd.Series]) -> pd.DataFrame:
+    """Per-row group median, robust spread, group size and robust z-score, in one grouped pass."""
+    groups = amounts.groupby(keys, sort=False)
+    median = groups.transform('median')
+    deviation = (amounts - median).abs()
+    deviations = deviation.groupby(keys, sort=False)
+    
+    # MAD scaled to estimate the standard deviation; when over half a group is
+    # identical the MAD is 0, so fall back to the scaled mean absolute deviation
+    scale = MAD_SCALE * deviations.transform('median')
+    scale = scale.where(scale > 0, MEAN_AD_SCALE * deviations.transform('mean'))
+    z = ((amounts - median) / scale).where(scale > 0, 0.0)
+    
+    return pd.DataFrame({'median': median, 'z': z, 'size': groups.transform('size')})
+
+
 class TrendAnalyzer:
-    """Time series trend analysis using Prophet."""
+    """Time series trend analysis of daily document totals (Prophet or exponential smoothing)."""
     
-    def __init__(self):
+    ENGINES = ("prophet", "exponential_smoothing")
+    
+    def __init__(self, engine: Optional[str] = None, interval_z: float = 1.96):
         """Initialize trend analyzer."""
+        self.engine = (engine or settings.trend_engine).lower()
+        if self.engine not in self.ENGINES:
+            raise ValueError(f"Unknown trend engine {self.engine!r}; expected one of {self.ENGINES}")
+        self.interval_z = interval_z
         self.model = None
+        # Results keyed on (data version, engine, horizon): unchanged data is never refit
+        self.cache = TTLCache("trend_forecasts", max_entries=8)
     
     def analyze_trends(
         self, 
         extractions: List[DocumentExtraction],
         forecast_periods: int = 30
     ) -> Dict[str, Any]:
-        """Analyze trends in document amounts over time using Prophet."""
+        """Analyze trends in document amounts over time."""
+        rows = [
+            (extraction.metadata.upload_timestamp, extraction.structured_data.total_amount.amount)
+            for extraction in extractions
+            if isinstance(getattr(extraction.structured_data, 'total_amount', None), MonetaryAmount)
+        ]
+        timestamps, amounts = (list(column) for column in zip(*rows)) if rows else ([], [])
+        return self.analyze_series(timestamps, np.asarray(amounts, dtype=float), forecast_periods)
+    
+    def analyze_series(
+        self,
+        timestamps: Any,
+        amounts: np.ndarray,
+        forecast_periods: int = 30,
+        data_version: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Analyze per-document totals at the given upload times (datetimes or POSIX seconds).
+        
+        Totals are summed per calendar day (days without documents count as 0)
+        before fitting. With a data_version, the result is cached until it changes.
+        """
+        key = (data_version, self.engine, forecast_periods)
+        if data_version is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
         try:
-            # Prepare time series data
-            data = []
-            for extraction in extractions:
-                if hasattr(extraction.structured_data, 'total_amount'):
-                    total = extraction.structured_data.total_amount
-                    if total and isinstance(total, MonetaryAmount):
-                        data.append({
-                            'ds': extraction.metadata.upload_timestamp,
-                            'y': total.amount
-                        })
-            
-            if len(data) < 10:
-                logger.warning("Insufficient data for trend analysis (need at least 10 points)")
+            daily = daily_totals(timestamps, amounts)
+            documents = int(daily['count'].sum())
+            if documents < 10 or len(daily) < 2:
+                logger.warning("Insufficient data for trend analysis (need at least 10 points on 2 days)")
                 return {}
             
-            df = pd.DataFrame(data)
-            df = df.sort_values('ds')
-            
-            # Train Prophet model
-            model = Prophet(
-                daily_seasonality=False,
-                weekly_seasonality=True,
-                yearly_seasonality=False
-            )
-            model.fit(df)
-            
-            # Make forecast
-            future = model.make_future_dataframe(periods=forecast_periods)
-            forecast = model.predict(future)
+            with timed_stage("trend_model_fit"):
+                if self.engine == "prophet":
+                    history, forecast = self._fit_prophet(daily, forecast_periods)
+                else:
+                    history, forecast = self._fit_exponential_smoothing(daily, forecast_periods)
             
             # Calculate trend direction
-            recent_trend = forecast['trend'].iloc[-forecast_periods:].mean()
-            historical_trend = forecast['trend'].iloc[:-forecast_periods].mean()
+            recent_trend = forecast['trend'].mean()
+            historical_trend = history['trend'].mean()
             trend_direction = "increasing" if recent_trend > historical_trend else "decreasing"
             
-            # Detect trend anomalies
-            anomalies = self._detect_trend_anomalies(df, forecast)
-            
             result = {
+                'engine': self.engine,
                 'trend_direction': trend_direction,
-                'forecast': forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(forecast_periods).to_dict('records'),
-                'anomalies': anomalies,
-                'average_amount': df['y'].mean(),
+                'forecast': forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].to_dict('records'),
+                'anomalies': self._detect_trend_anomalies(daily, history),
+                'average_amount': float(daily['y'].sum() / documents),
+                'days': len(daily),
                 'trend_change_pct': ((recent_trend - historical_trend) / historical_trend * 100) if historical_trend != 0 else 0
             }
             
-            logger.info(f"Trend analysis complete: {trend_direction} trend detected")
-            return result
+            logger.info(f"Trend analysis complete ({self.engine}, {len(daily)} days): {trend_direction} trend detected")
         except Exception as e:
             logger.error(f"Trend analysis failed: {e}")
             return {}
+        
+        if data_version is not None:
+            self.cache.set(key, result)
+        return result
+    
+    def _fit_prophet(self, daily: pd.DataFrame, forecast_periods: int) -> tuple:
+        """Fit Prophet; returns (history, forecast) frames with yhat, bounds and trend."""
+        # Imported here; it is slow to load
+        from prophet import Prophet
+        
+        model = Prophet(
+            daily_seasonality=False,
+            weekly_seasonality=True,
+            yearly_seasonality=False
+        )
+        model.fit(daily[['ds', 'y']])
+        self.model = model
+        
+        predicted = model.predict(model.make_future_dataframe(periods=forecast_periods))
+        columns = ['ds', 'yhat', 'yhat_lower', 'yhat_upper', 'trend']
+        return predicted[columns].iloc[:len(daily)], predicted[columns].iloc[len(daily):]
     
-    def _detect_trend_anomalies(self, df: pd.DataFrame, forecast: pd.DataFrame) -> List[Dict]:
-        """Detect points that deviate significantly from predicted trend."""
-        anomalies = []
+    def _fit_exponential_smoothing(self, daily: pd.DataFrame, forecast_periods: int) -> tuple:
+        """Fit Holt-Winters; returns (history, forecast) frames with yhat, bounds and trend."""
+        from statsmodels.tsa.holtwinters import ExponentialSmoothing
         
-        # Merge actual and predicted values
-        merged = df.merge(forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']], on='ds', how='left')
+        y = daily['y'].to_numpy(dtype=float)
+        # Weekly seasonality needs two full weeks of history
+        seasonal = "add" if len(y) >= 14 else None
+        model = ExponentialSmoothing(
+            y, trend="add", seasonal=seasonal, seasonal_periods=7 if seasonal else None,
+            initialization_method="estimated"
+        ).fit()
+        self.model = model
         
-        for _, row in merged.iterrows():
-            if pd.notna(row['yhat']):
-                # Check if actual is outside prediction interval
-                if row['y'] < row['yhat_lower'] or row['y'] > row['yhat_upper']:
-                    anomalies.append({
-                        'date': row['ds'].isoformat(),
-                        'actual': row['y'],
-                        'predicted': row['yhat'],
-                        'deviation': abs(row['y'] - row['yhat'])
-                    })
+        # Intervals from the in-sample residual spread, widening with the horizon
+        sigma = float(np.std(y - model.fittedvalues))
+        steps = np.arange(1, forecast_periods + 1)
+        margin = self.interval_z * sigma * np.sqrt(1 + model.params['smoothing_level'] ** 2 * (steps - 1))
         
-        return anomalies
+        history = pd.DataFrame({
+            'ds': daily['ds'],
+            'yhat': model.fittedvalues,
+            'yhat_lower': model.fittedvalues - self.interval_z * sigma,
+            'yhat_upper': model.fittedvalues + self.interval_z * sigma,
+            'trend': model.level,
+        })
+        yhat = model.forecast(forecast_periods)
+        forecast = pd.DataFrame({
+            'ds': pd.date_range(daily['ds'].iloc[-1] + pd.Timedelta(days=1), periods=forecast_periods, freq='D'),
+            'yhat': yhat,
+            'yhat_lower': yhat - margin,
+            'yhat_upper': yhat + margin,
+            'trend': model.level[-1] + model.trend[-1] * steps,
+        })
+        return history, forecast
+    
+    def _detect_trend_anomalies(self, daily: pd.DataFrame, history: pd.DataFrame) -> List[Dict]:
+        """Detect days whose total falls outside the model's prediction interval."""
+        actual = daily['y'].to_numpy()
+        predicted = history['yhat'].to_numpy()
+        outside = (actual < history['yhat_lower'].to_numpy()) | (actual > history['yhat_upper'].to_numpy())
+        
+        return [
+            {'date': day.isoformat(), 'actual': float(y), 'predicted': float(yhat), 'deviation': float(abs(y - yhat))}
+            for day, y, yhat in zip(daily['ds'][outside], actual[outside], predicted[outside])
+        ]
+
+
+def daily_totals(timestamps: Any, amounts: np.ndarray) -> pd.DataFrame:
+    """Sum totals per calendar day (ds, y, count), with empty days between the first and last as 0."""
+    timestamps = np.asarray(timestamps)
+    if np.issubdtype(timestamps.dtype, np.number):
+        index = pd.to_datetime(timestamps, unit='s')
+    else:
+        index = pd.DatetimeIndex(timestamps)
+    
+    # Documents without a total or an upload time are left out
+    series = pd.Series(np.asarray(amounts, dtype=float), index=index).dropna()
+    series = series[series.index.notna()]
+    if series.empty:
+        return pd.DataFrame({'ds': pd.DatetimeIndex([]), 'y': [], 'count': []})
+    
+    daily = series.resample('D').agg(['sum', 'count'])
+    return pd.DataFrame({
+        'ds': daily.index, 'y': daily['sum'].to_numpy(), 'count': daily['count'].to_numpy()
+    }).reset_index(drop=True)
 
 
 class ValidationEngine:
     """Data validation and consistency checks."""
     
+    def __init__(self, duplicate_index: Optional[DuplicateIndex] = None, rules: Optional[RuleEngine] = None):
+        """Initialize engine; duplicates are only checked with an index."""
+        self.duplicate_index = duplicate_index
+        self.rules = rules or RuleEngine()
+    
     def validate_extraction(self, extraction: DocumentExtraction) -> List[Anomaly]:
         """Validate extraction data and identify issues."""
-        anomalies = []
-        
-        # Check for missing critical fields
-        if extraction.document_type.value in ['invoice', 'bank_statement']:
-            missing_fields = self._check_missing_fields(extraction)
-            anomalies.extend(missing_fields)
-        
-        # Check for duplicate detection
-        # (In production, would compare against database)
-        
-        # Check for validation errors in structured data
-        validation_errors = self._validate_structured_data(extraction)
-        anomalies.extend(validation_errors)
+        # Missing fields and inconsistent amounts or dates
+        anomalies = self.rules.validate([extraction])
         
-        return anomalies
-    
-    def _check_missing_fields(self, extraction: DocumentExtraction) -> List[Anomaly]:
-        """Check for missing required fields."""
-        anomalies = []
+        # Bank statement balances against the running sum of transactions
+        anomalies.extend(reconcile_statement(extraction))
         
-        if extraction.document_type == "invoice":
-            required_fields = ['invoice_number', 'total_amount', 'vendor_name']
-            for field in required_fields:
-                if not hasattr(extraction.structured_data, field) or getattr(extraction.structured_data, field) is None:
-                    anomaly = Anomaly(
-                        anomaly_id=str(uuid.uuid4()),
-                        document_id=extraction.document_id,
-                        anomaly_type=AnomalyType.MISSING_DATA,
-                        severity="medium",
-                        description=f"Required field '{field}' is missing",
-                        field_name=field,
-                        confidence_score=1.0
-                    )
-                    anomalies.append(anomaly)
+        # Check against earlier documents (this also adds the document to the index)
+        if self.duplicate_index is not None:
+            anomalies.extend(self.duplicate_index.observe(extraction))
         
         return anomalies
     
-    def _validate_structured_data(self, extraction: DocumentExtraction) -> List[Anomaly]:
-        """Validate structured data for logical consistency."""
-        anomalies = []
-        
-        # Example: Check if subtotal + tax = total for invoices
-        if hasattr(extraction.structured_data, 'subtotal') and hasattr(extraction.structured_data, 'total_amount'):
-            # Add validation logic here
-            pass
-        
+    @timed_operation("validation_batch")
+    def validate_batch(self, extractions: List[DocumentExtraction]) -> List[Anomaly]:
+        """Check many stored documents against the validation rules in one vectorized pass."""
+        anomalies = self.rules.validate(extractions)
+        for extraction in extractions:
+            anomalies.extend(reconcile_statement(extraction))
         return anomalies
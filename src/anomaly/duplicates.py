@@ -0,0 +1,351 @@
+"""
+Duplicate and near-duplicate detection at ingest time.
+
+Each processed document is checked two ways before it is added to the index.
+An exact key of normalized vendor, invoice number and total catches the same
+invoice extracted twice (resubmitted, emailed and uploaded, or rescanned).
+A MinHash signature of the document text, split into bands for
+locality-sensitive hashing (LSH), catches documents whose text is nearly
+identical even when OCR noise changed the extracted fields. Both are keyed
+lookups, so a check costs the same however many documents are indexed; LSH
+candidates are then confirmed by comparing their signatures. The index and
+the matches it raised live in SQLite shared by all workers.
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from prometheus_client import Counter
+
+from src.models.schemas import Anomaly, AnomalyType, DocumentExtraction, MonetaryAmount
+from src.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Prometheus metrics
+duplicate_matches = Counter(
+    'duplicate_matches_total', 'Duplicate documents found at ingest', ['match']
+)
+
+# Characters per text shingle (at most 8, so a shingle packs into one uint64)
+SHINGLE_SIZE = 7
+# Documents with fewer distinct shingles are too short to compare by text
+MIN_SHINGLES = 20
+# Hashes are computed modulo this Mersenne prime, so a * x + b fits in a uint64
+MERSENNE_PRIME = (1 << 31) - 1
+# Matches reported per document and kind
+MAX_MATCHES = 5
+
+
+class DuplicateIndex:
+    """Exact-key and MinHash/LSH index of ingested documents."""
+    
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        similarity_threshold: Optional[float] = None,
+        num_permutations: int = 128,
+        bands: int = 16
+    ):
+        """Open (or create) the shared index database."""
+        if num_permutations % bands:
+            raise ValueError("num_permutations must be a multiple of bands")
+        
+        self.path = path or settings.duplicate_index_path
+        self.similarity_threshold = similarity_threshold or settings.duplicate_similarity_threshold
+        self.num_permutations = num_permutations
+        self.bands = bands
+        
+        # Fixed seed: every worker and restart must hash identically
+        rng = np.random.default_rng(20251101)
+        self._a = rng.integers(1, MERSENNE_PRIME, num_permutations, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, num_permutations, dtype=np.uint64)
+        
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS indexed_documents (
+                document_id TEXT PRIMARY KEY,
+                indexed_at TEXT NOT NULL,
+                signature BLOB,
+                exact_key TEXT
+            );
+            CREATE TABLE IF NOT EXISTS exact_keys (
+                key TEXT NOT NULL,
+                document_id TEXT NOT NULL,
+                PRIMARY KEY (key, document_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_exact_keys_document ON exact_keys(document_id);
+            CREATE TABLE IF NOT EXISTS lsh_buckets (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                document_id TEXT NOT NULL,
+                PRIMARY KEY (band, bucket, document_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_lsh_buckets_document ON lsh_buckets(document_id);
+            CREATE TABLE IF NOT EXISTS matches (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                document_id TEXT NOT NULL,
+                detected_at TEXT NOT NULL,
+                anomaly TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_matches_document ON matches(document_id);
+        """)
+    
+    def observe(self, extraction: DocumentExtraction) -> List[Anomaly]:
+        """
+        Find earlier documents this one duplicates, then add it to the index.
+        
+        Observing a document again with the same key and text (e.g. a
+        retried job) returns the matches found the first time. If either
+        changed (e.g. it was reprocessed), its old entries are replaced.
+        """
+        key = exact_key(extraction)
+        signature = self.signature(extraction.raw_text)
+        blob = _signature_bytes(signature)
+        
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                indexed = self._conn.execute(
+                    "SELECT exact_key, signature FROM indexed_documents WHERE document_id = ?",
+                    (extraction.document_id,)
+                ).fetchone()
+                retried = indexed is not None and tuple(indexed) == (key, blob)
+                if retried:
+                    anomalies = []
+                else:
+                    if indexed is not None:
+                        self._remove([extraction.document_id])
+                    anomalies = self._observe(extraction, key, signature)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        
+        if retried:
+            return self.alerts(document_id=extraction.document_id)
+        
+        for anomaly in anomalies:
+            duplicate_matches.labels(match="exact" if anomaly.field_name == "invoice_number" else "near").inc()
+            logger.warning(f"Duplicate at ingest for {extraction.document_id}: {anomaly.description}")
+        return anomalies
+    
+    def _observe(
+        self,
+        extraction: DocumentExtraction,
+        key: Optional[str],
+        signature: Optional[np.ndarray]
+    ) -> List[Anomaly]:
+        """Match and index one document inside the caller's transaction."""
+        document_id = extraction.document_id
+        anomalies = []
+        exact_ids = set()
+        
+        if key is not None:
+            rows = self._conn.execute(
+                "SELECT document_id FROM exact_keys WHERE key = ? LIMIT ?", (key, MAX_MATCHES)
+            ).fetchall()
+            exact_ids = {row[0] for row in rows}
+            anomalies.extend(self._exact_anomaly(extraction, other) for other in sorted(exact_ids))
+            self._conn.execute("INSERT INTO exact_keys (key, document_id) VALUES (?, ?)", (key, document_id))
+        
+        if signature is not None:
+            buckets = self._buckets(signature)
+            near = [match for match in self._near_matches(signature, buckets) if match[0] not in exact_ids]
+            anomalies.extend(self._near_anomaly(document_id, other, similarity) for other, similarity in near)
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO lsh_buckets (band, bucket, document_id) VALUES (?, ?, ?)",
+                [(band, bucket, document_id) for band, bucket in enumerate(buckets)]
+            )
+        
+        now = datetime.utcnow().isoformat()
+        self._conn.execute(
+            "INSERT INTO indexed_documents (document_id, indexed_at, signature, exact_key) VALUES (?, ?, ?, ?)",
+            (document_id, now, _signature_bytes(signature), key)
+        )
+        self._conn.executemany(
+            "INSERT INTO matches (document_id, detected_at, anomaly) VALUES (?, ?, ?)",
+            [(document_id, now, anomaly.model_dump_json()) for anomaly in anomalies]
+        )
+        return anomalies
+    
+    def _near_matches(self, signature: np.ndarray, buckets: List[int]) -> List[Tuple[str, float]]:
+        """Indexed documents sharing an LSH bucket whose signatures agree enough, most similar first."""
+        candidates = set()
+        for band, bucket in enumerate(buckets):
+            rows = self._conn.execute(
+                "SELECT document_id FROM lsh_buckets WHERE band = ? AND bucket = ?", (band, bucket)
+            ).fetchall()
+            candidates.update(row[0] for row in rows)
+        if not candidates:
+            return []
+        
+        candidates = sorted(candidates)
+        placeholders = ", ".join("?" * len(candidates))
+        rows = self._conn.execute(
+            f"SELECT document_id, signature FROM indexed_documents WHERE document_id IN ({placeholders})",
+            candidates
+        ).fetchall()
+        
+        matches = []
+        for other, blob in rows:
+            # The fraction of agreeing MinHash values estimates Jaccard similarity
+            similarity = float(np.mean(np.frombuffer(blob, dtype=np.uint32) == signature))
+            if similarity >= self.similarity_threshold:
+                matches.append((other, similarity))
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches[:MAX_MATCHES]
+    
+    def remove(self, document_ids: Iterable[str]) -> int:
+        """Drop deleted documents so later ones are not matched against them; returns how many were indexed."""
+        document_ids = list(document_ids)
+        removed = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for start in range(0, len(document_ids), 500):
+                    removed += self._remove(document_ids[start:start + 500])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return removed
+    
+    def _remove(self, document_ids: List[str]) -> int:
+        """Delete documents' entries and matches inside the caller's transaction."""
+        placeholders = ", ".join("?" * len(document_ids))
+        for table in ("exact_keys", "lsh_buckets", "matches"):
+            self._conn.execute(f"DELETE FROM {table} WHERE document_id IN ({placeholders})", document_ids)
+        return self._conn.execute(
+            f"DELETE FROM indexed_documents WHERE document_id IN ({placeholders})", document_ids
+        ).rowcount
+    
+    def alerts(
+        self,
+        document_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        limit: int = 100
+    ) -> List[Anomaly]:
+        """Duplicates found at ingest, newest first."""
+        query = "SELECT anomaly FROM matches WHERE 1 = 1"
+        params: List[Any] = []
+        if document_id is not None:
+            query += " AND document_id = ?"
+            params.append(document_id)
+        if since is not None:
+            query += " AND detected_at >= ?"
+            params.append(since.isoformat())
+        query += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit)
+        
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [Anomaly.model_validate_json(row[0]) for row in rows]
+    
+    def close(self) -> None:
+        """Close the database connection."""
+        self._conn.close()
+    
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of the text's character shingles; None if the text is too short."""
+        shingles = _shingles(text)
+        if len(shingles) < MIN_SHINGLES:
+            return None
+        
+        signature = np.full(self.num_permutations, MERSENNE_PRIME, dtype=np.uint64)
+        # Chunked so the permutations x shingles matrix stays small for long documents
+        for start in range(0, len(shingles), 4096):
+            chunk = shingles[start:start + 4096]
+            hashes = (self._a[:, None] * chunk[None, :] + self._b[:, None]) % MERSENNE_PRIME
+            np.minimum(signature, hashes.min(axis=1), out=signature)
+        return signature
+    
+    def _buckets(self, signature: np.ndarray) -> List[int]:
+        """One bucket id per band of the signature."""
+        rows = self.num_permutations // self.bands
+        return [
+            int.from_bytes(
+                hashlib.blake2b(band.astype(np.uint32).tobytes(), digest_size=8).digest(), "big", signed=True
+            )
+            for band in signature.reshape(self.bands, rows)
+        ]
+    
+    def _exact_anomaly(self, extraction: DocumentExtraction, other: str) -> Anomaly:
+        data = extraction.structured_data
+        total = data.total_amount
+        return Anomaly(
+            anomaly_id=str(uuid.uuid4()),
+            document_id=extraction.document_id,
+            anomaly_type=AnomalyType.DUPLICATE,
+            severity="high",
+            description=(
+                f"Invoice {data.invoice_number} from {data.vendor_name} for "
+                f"{total.amount:,.2f} {total.currency.value} was already ingested as document {other}"
+            ),
+            field_name="invoice_number",
+            actual_value=data.invoice_number,
+            confidence_score=1.0
+        )
+    
+    def _near_anomaly(self, document_id: str, other: str, similarity: float) -> Anomaly:
+        return Anomaly(
+            anomaly_id=str(uuid.uuid4()),
+            document_id=document_id,
+            anomaly_type=AnomalyType.DUPLICATE,
+            severity="medium",
+            description=f"Text is {similarity:.0%} similar to document {other}",
+            field_name="raw_text",
+            actual_value=round(similarity, 4),
+            confidence_score=similarity
+        )
+
+
+def exact_key(extraction: DocumentExtraction) -> Optional[str]:
+    """Normalized vendor, invoice number and total; None unless all three were extracted."""
+    data = extraction.structured_data
+    vendor = getattr(data, 'vendor_name', None)
+    number = getattr(data, 'invoice_number', None)
+    total = getattr(data, 'total_amount', None)
+    if not vendor or not number or not isinstance(total, MonetaryAmount):
+        return None
+    
+    vendor = re.sub(r"[^0-9a-z]", "", vendor.casefold())
+    number = re.sub(r"[^0-9A-Z]", "", number.upper())
+    if not vendor or not number:
+        return None
+    return f"{vendor}|{number}|{total.amount:.2f}|{total.currency.value}"
+
+
+def _signature_bytes(signature: Optional[np.ndarray]) -> Optional[bytes]:
+    """Signature as stored in the index."""
+    return signature.astype(np.uint32).tobytes() if signature is not None else None
+
+
+def _shingles(text: str) -> np.ndarray:
+    """Distinct character shingles of the normalized text, as integers below MERSENNE_PRIME."""
+    normalized = " ".join(re.sub(r"[^\w]+", " ", text.casefold()).split()).encode()
+    if len(normalized) < SHINGLE_SIZE:
+        return np.empty(0, dtype=np.uint64)
+    
+    # Pack each window of SHINGLE_SIZE bytes into one integer
+    windows = np.lib.stride_tricks.sliding_window_view(
+        np.frombuffer(normalized, dtype=np.uint8), SHINGLE_SIZE
+    ).astype(np.uint64)
+    packed = np.zeros(len(windows), dtype=np.uint64)
+    for i in range(SHINGLE_SIZE):
+        packed = (packed << np.uint64(8)) | windows[:, i]
+    return np.unique(packed % np.uint64(MERSENNE_PRIME))
@@ -0,0 +1,180 @@
+"""
+Columnar feature store for anomaly detection.
+
+Keeps one row of numeric features per stored document in preallocated NumPy
+columns, so detection runs on an already-materialized matrix instead of
+rebuilding features from every extraction per request. Rows are appended or
+updated in place as the repository's change log advances; deletes tombstone
+their row and the columns are compacted once tombstones dominate. Each
+process keeps its own store and catches up from the shared change log, so
+writes made by other workers show up on the next sync.
+"""
+import logging
+import threading
+from typing import Dict, Iterable, NamedTuple, Optional
+
+import numpy as np
+
+from src.storage.repository import DocumentRepository, FeatureRow
+from src.utils.helpers import posix_seconds
+
+logger = logging.getLogger(__name__)
+
+# Feature matrix columns, in order
+FEATURE_NAMES = [
+    'processing_time', 'text_length', 'num_tables',
+    'num_entities', 'avg_confidence', 'total_amount'
+]
+
+
+class FeatureFrame(NamedTuple):
+    """Materialized features of live documents; row i of each array is one document."""
+    document_ids: np.ndarray
+    values: np.ndarray  # float64, len(FEATURE_NAMES) columns, NaN where unknown
+    document_types: np.ndarray
+    vendor_names: np.ndarray
+    currencies: np.ndarray
+    upload_timestamps: np.ndarray  # POSIX seconds, NaN where unknown
+    seq: int = 0  # Repository change seq the rows reflect
+    
+    def __len__(self) -> int:
+        return len(self.document_ids)
+    
+    def column(self, name: str) -> np.ndarray:
+        """One feature column by name."""
+        return self.values[:, FEATURE_NAMES.index(name)]
+
+
+class FeatureStore:
+    """Incrementally synced feature columns for all stored documents."""
+    
+    def __init__(
+        self,
+        repository: DocumentRepository,
+        initial_capacity: int = 1024,
+        compact_ratio: float = 0.5
+    ):
+        """Initialize empty columns; call sync() to load from the repository."""
+        self.repository = repository
+        self.compact_ratio = compact_ratio
+        self.seq = 0  # Last repository change applied
+        self.version = 0  # Bumped on every change to the live rows
+        
+        self._lock = threading.RLock()
+        self._size = 0
+        self._tombstones = 0
+        self._rows: Dict[str, int] = {}
+        self._frame: Optional[FeatureFrame] = None
+        self._allocate(max(initial_capacity, 1))
+    
+    def __len__(self) -> int:
+        return len(self._rows)
+    
+    def sync(self) -> int:
+        """Apply repository changes since the last sync; returns rows applied."""
+        with self._lock:
+            seq, rows = self.repository.changes_since(self.seq)
+            for row in rows:
+                if row.deleted:
+                    self.delete(row.document_id)
+                else:
+                    self.upsert(row)
+            self.seq = seq
+        
+        if rows:
+            logger.debug(f"Feature store synced {len(rows)} rows up to change {seq}")
+        return len(rows)
+    
+    def upsert(self, row: FeatureRow) -> None:
+        """Append a document's features, or overwrite its existing row."""
+        with self._lock:
+            index = self._rows.get(row.document_id)
+            if index is None:
+                if self._size == len(self._alive):
+                    self._allocate(len(self._alive) * 2)
+                index = self._size
+                self._size += 1
+                self._rows[row.document_id] = index
+            
+            self._values[index] = [
+                np.nan if getattr(row, name) is None else getattr(row, name) for name in FEATURE_NAMES
+            ]
+            self._document_ids[index] = row.document_id
+            self._document_types[index] = row.document_type
+            self._vendor_names[index] = row.vendor_name
+            self._currencies[index] = row.currency
+            self._upload_timestamps[index] = posix_seconds(row.upload_timestamp)
+            self._alive[index] = True
+            self._changed()
+    
+    def delete(self, document_id: str) -> bool:
+        """Tombstone a document's row; returns False if it was not stored."""
+        with self._lock:
+            index = self._rows.pop(document_id, None)
+            if index is None:
+                return False
+            
+            self._alive[index] = False
+            self._tombstones += 1
+            if self._tombstones > self.compact_ratio * self._size:
+                self._compact()
+            self._changed()
+            return True
+    
+    def frame(self, document_ids: Optional[Iterable[str]] = None) -> FeatureFrame:
+        """Sync, then return live rows (all, or the given ids that are stored)."""
+        self.sync()
+        
+        with self._lock:
+            if self._frame is None:
+                self._frame = self._materialize(np.flatnonzero(self._alive[:self._size]))
+            if document_ids is None:
+                return self._frame
+            
+            indices = [self._rows[doc_id] for doc_id in dict.fromkeys(document_ids) if doc_id in self._rows]
+            return self._materialize(np.asarray(indices, dtype=np.intp))
+    
+    def _materialize(self, indices: np.ndarray) -> FeatureFrame:
+        return FeatureFrame(
+            document_ids=self._document_ids[indices],
+            values=self._values[indices],
+            document_types=self._document_types[indices],
+            vendor_names=self._vendor_names[indices],
+            currencies=self._currencies[indices],
+            upload_timestamps=self._upload_timestamps[indices],
+            seq=self.seq
+        )
+    
+    def _changed(self) -> None:
+        self.version += 1
+        self._frame = None
+    
+    def _allocate(self, capacity: int) -> None:
+        """Grow (or create) every column to the given capacity, keeping existing rows."""
+        columns = {
+            "_values": np.full((capacity, len(FEATURE_NAMES)), np.nan),
+            "_document_ids": np.empty(capacity, dtype=object),
+            "_document_types": np.empty(capacity, dtype=object),
+            "_vendor_names": np.empty(capacity, dtype=object),
+            "_currencies": np.empty(capacity, dtype=object),
+            "_upload_timestamps": np.full(capacity, np.nan),
+            "_alive": np.zeros(capacity, dtype=bool),
+        }
+        for name, column in columns.items():
+            if hasattr(self, name):
+                column[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, column)
+    
+    def _compact(self) -> None:
+        """Drop tombstoned rows, preserving the order of live ones."""
+        live = np.flatnonzero(self._alive[:self._size])
+        for name in ("_values", "_document_ids", "_document_types", "_vendor_names", "_currencies",
+                     "_upload_timestamps"):
+            column = getattr(self, name)
+            column[:len(live)] = column[live]
+        
+        self._alive[:len(live)] = True
+        self._alive[len(live):] = False
+        self._size = len(live)
+        self._tombstones = 0
+        self._rows = {doc_id: index for index, doc_id in enumerate(self._document_ids[:self._size])}
@@ -0,0 +1,384 @@
+"""
+Online anomaly scoring at ingest time.
+
+Each processed document's total is scored against running statistics of
+comparable documents (same currency, vendor and type; or same currency and
+type for vendors with little history), then folded into them, in O(1) per
+document. Groups keep a Welford mean/variance and P² estimates of the
+quartiles, so scoring is robust (median and interquartile spread) without
+storing past amounts. State and raised alerts live in SQLite shared by all
+workers, so they survive restarts and every process scores against the same
+history. Each document's amount and groups are recorded, so a reprocessed
+or deleted document is taken back out of the means and variances. The P²
+quartile markers cannot un-observe a value, so they keep its influence,
+which fades as more documents arrive; the batch detector in detector.py
+recomputes exactly from live documents.
+"""
+import bisect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from prometheus_client import Counter
+
+from src.models.schemas import Anomaly, AnomalyType, DocumentExtraction, MonetaryAmount
+from src.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Prometheus metrics
+ingest_alerts = Counter(
+    'anomaly_ingest_alerts_total', 'Anomalies raised while ingesting documents', ['anomaly_type']
+)
+
+# Interquartile range of a normal distribution, in standard deviations
+IQR_SCALE = 1.349
+
+
+class P2Quantile:
+    """Streaming estimate of one quantile in constant space (Jain & Chlamtac's P² algorithm)."""
+    
+    def __init__(self, p: float, state: Optional[Dict[str, Any]] = None):
+        """Initialize estimator, optionally from to_dict() state."""
+        self.p = p
+        state = state or {}
+        self.heights: List[float] = state.get("heights", [])
+        self.positions: List[float] = state.get("positions", [1, 2, 3, 4, 5])
+        self.desired: List[float] = state.get("desired", [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5])
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+    
+    def add(self, x: float) -> None:
+        """Fold in one observation."""
+        heights, positions = self.heights, self.positions
+        if len(heights) < 5:
+            bisect.insort(heights, x)
+            return
+        
+        # Find the cell x falls in, stretching the extremes if needed
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(heights, x) - 1
+        
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        
+        # Move the middle markers toward their desired positions
+        for i in range(1, 4):
+            offset = self.desired[i] - positions[i]
+            if (offset >= 1 and positions[i + 1] - positions[i] > 1) or \
+               (offset <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (heights[i + step] - heights[i]) / (positions[i + step] - positions[i])
+                heights[i] = height
+                positions[i] += step
+    
+    def value(self) -> Optional[float]:
+        """Current estimate (exact while fewer than five observations)."""
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            return self.heights[round(self.p * (len(self.heights) - 1))]
+        return self.heights[2]
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {"heights": self.heights, "positions": self.positions, "desired": self.desired}
+    
+    def _parabolic(self, i: int, step: int) -> float:
+        heights, positions = self.heights, self.positions
+        return heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + step) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+            + (positions[i + 1] - positions[i] - step) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1])
+        )
+
+
+class RunningStats:
+    """Welford mean/variance and P² quartiles of one group's totals."""
+    
+    def __init__(self, state: Optional[Dict[str, Any]] = None):
+        """Initialize empty statistics, optionally from to_dict() state."""
+        state = state or {}
+        self.count: int = state.get("count", 0)
+        self.mean: float = state.get("mean", 0.0)
+        self.m2: float = state.get("m2", 0.0)
+        quartiles = state.get("quartiles", [None, None, None])
+        self.quartiles = [P2Quantile(p, q) for p, q in zip((0.25, 0.5, 0.75), quartiles)]
+    
+    @property
+    def std(self) -> float:
+        return (self.m2 / self.count) ** 0.5 if self.count else 0.0
+    
+    @property
+    def median(self) -> Optional[float]:
+        return self.quartiles[1].value()
+    
+    def add(self, x: float) -> None:
+        """Fold in one observation."""
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        for quartile in self.quartiles:
+            quartile.add(x)
+    
+    def remove(self, x: float) -> None:
+        """Take an observation back out of the count and moments (not the quartiles)."""
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        
+        mean = (self.count * self.mean - x) / (self.count - 1)
+        self.m2 = max(self.m2 - (x - mean) * (x - self.mean), 0.0)
+        self.mean = mean
+        self.count -= 1
+    
+    def score(self, x: float) -> Optional[float]:
+        """Robust z-score of x (distance from the median in estimated stds); None if no spread yet."""
+        if not self.count:
+            return None
+        
+        q1, median, q3 = (quartile.value() for quartile in self.quartiles)
+        # Fall back to the std while over half the group shares one value
+        spread = (q3 - q1) / IQR_SCALE if q3 > q1 else self.std
+        return (x - median) / spread if spread > 0 else None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count, "mean": self.mean, "m2": self.m2,
+            "quartiles": [quartile.to_dict() for quartile in self.quartiles]
+        }
+
+
+class OnlineAnomalyScorer:
+    """Scores documents against running per-vendor and per-type statistics as they are ingested."""
+    
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        threshold: Optional[float] = None,
+        min_observations: Optional[int] = None
+    ):
+        """Open (or create) the shared state database."""
+        self.path = path or settings.online_scorer_path
+        self.threshold = threshold or settings.online_anomaly_threshold
+        self.min_observations = min_observations or settings.online_anomaly_min_observations
+        
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS group_stats (
+                group_key TEXT PRIMARY KEY,
+                state TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS scored_documents (
+                document_id TEXT PRIMARY KEY,
+                scored_at TEXT NOT NULL,
+                amount REAL NOT NULL,
+                group_keys TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS alerts (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                document_id TEXT NOT NULL,
+                detected_at TEXT NOT NULL,
+                anomaly TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_alerts_document ON alerts(document_id);
+        """)
+    
+    def observe(self, extraction: DocumentExtraction) -> List[Anomaly]:
+        """
+        Score a newly processed document, then add it to the running statistics.
+        
+        Observing a document again with the same total and groups (e.g. a
+        retried job) returns the alerts raised the first time. If they
+        changed (e.g. it was reprocessed), its old amount is taken back out
+        of the statistics first and it is scored afresh.
+        """
+        total = getattr(extraction.structured_data, 'total_amount', None)
+        amount, currency, vendor, keys = None, None, None, None
+        if isinstance(total, MonetaryAmount):
+            amount = total.amount
+            currency = total.currency.value
+            vendor = getattr(extraction.structured_data, 'vendor_name', None) or ""
+            keys = _group_keys(currency, vendor, extraction.document_type.value)
+        
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                scored = self._conn.execute(
+                    "SELECT amount, group_keys FROM scored_documents WHERE document_id = ?",
+                    (extraction.document_id,)
+                ).fetchone()
+                retried = scored is not None and (scored[0], scored[1]) == (amount, json.dumps(keys))
+                anomaly = None
+                if not retried:
+                    if scored is not None:
+                        self._forget(extraction.document_id, scored[0], json.loads(scored[1]))
+                    if amount is not None:
+                        anomaly = self._observe(extraction, amount, currency, vendor, keys)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        
+        if retried:
+            return self.alerts(document_id=extraction.document_id)
+        if anomaly is None:
+            return []
+        
+        ingest_alerts.labels(anomaly_type=anomaly.anomaly_type.value).inc()
+        logger.warning(f"Ingest anomaly for {extraction.document_id}: {anomaly.description}")
+        return [anomaly]
+    
+    def _observe(
+        self,
+        extraction: DocumentExtraction,
+        amount: float,
+        currency: str,
+        vendor: str,
+        keys: Dict[str, str]
+    ) -> Optional[Anomaly]:
+        """Score and record one document inside the caller's transaction."""
+        stats = {level: self._load(key) for level, key in keys.items()}
+        level = "vendor" if stats["vendor"].count >= self.min_observations else "type"
+        anomaly = self._score(extraction, amount, currency, vendor, stats[level], level)
+        
+        now = datetime.utcnow().isoformat()
+        for name, key in keys.items():
+            stats[name].add(amount)
+            self._save(key, stats[name])
+        self._conn.execute(
+            "INSERT INTO scored_documents (document_id, scored_at, amount, group_keys) VALUES (?, ?, ?, ?)",
+            (extraction.document_id, now, amount, json.dumps(keys))
+        )
+        if anomaly:
+            self._conn.execute(
+                "INSERT INTO alerts (document_id, detected_at, anomaly) VALUES (?, ?, ?)",
+                (extraction.document_id, now, anomaly.model_dump_json())
+            )
+        return anomaly
+    
+    def remove(self, document_ids: Iterable[str]) -> int:
+        """Take deleted documents back out of the statistics and drop their alerts; returns how many were scored."""
+        removed = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for document_id in document_ids:
+                    scored = self._conn.execute(
+                        "SELECT amount, group_keys FROM scored_documents WHERE document_id = ?", (document_id,)
+                    ).fetchone()
+                    if scored is not None:
+                        self._forget(document_id, scored[0], json.loads(scored[1]))
+                        removed += 1
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return removed
+    
+    def _forget(self, document_id: str, amount: float, keys: Dict[str, str]) -> None:
+        """Remove a document's contribution and alerts inside the caller's transaction."""
+        for key in keys.values():
+            stats = self._load(key)
+            stats.remove(amount)
+            self._save(key, stats)
+        self._conn.execute("DELETE FROM scored_documents WHERE document_id = ?", (document_id,))
+        self._conn.execute("DELETE FROM alerts WHERE document_id = ?", (document_id,))
+    
+    def alerts(
+        self,
+        document_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        limit: int = 100
+    ) -> List[Anomaly]:
+        """Alerts raised at ingest, newest first."""
+        query = "SELECT anomaly FROM alerts WHERE 1 = 1"
+        params: List[Any] = []
+        if document_id is not None:
+            query += " AND document_id = ?"
+            params.append(document_id)
+        if since is not None:
+            query += " AND detected_at >= ?"
+            params.append(since.isoformat())
+        query += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit)
+        
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [Anomaly.model_validate_json(row[0]) for row in rows]
+    
+    def close(self) -> None:
+        """Close the database connection."""
+        self._conn.close()
+    
+    def _load(self, key: str) -> RunningStats:
+        row = self._conn.execute("SELECT state FROM group_stats WHERE group_key = ?", (key,)).fetchone()
+        return RunningStats(json.loads(row[0]) if row else None)
+    
+    def _save(self, key: str, stats: RunningStats) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO group_stats (group_key, state) VALUES (?, ?)", (key, json.dumps(stats.to_dict()))
+        )
+    
+    def _score(
+        self,
+        extraction: DocumentExtraction,
+        amount: float,
+        currency: str,
+        vendor: str,
+        stats: RunningStats,
+        level: str
+    ) -> Optional[Anomaly]:
+        """Build an anomaly if the amount is far from its group's history."""
+        if stats.count < self.min_observations:
+            return None
+        
+        z_score = stats.score(amount)
+        if z_score is None or abs(z_score) <= self.threshold:
+            return None
+        
+        magnitude = abs(z_score)
+        peers = vendor if level == "vendor" else f"{extraction.document_type.value}s"
+        return Anomaly(
+            anomaly_id=str(uuid.uuid4()),
+            document_id=extraction.document_id,
+            anomaly_type=AnomalyType.OUTLIER_AMOUNT,
+            severity="critical" if magnitude > 7 else "high" if magnitude > 5 else "medium",
+            description=(
+                f"Amount {amount:,.2f} {currency} is {magnitude:.1f} robust standard deviations "
+                f"{'above' if z_score > 0 else 'below'} the running median {stats.median:,.2f} {currency} "
+                f"for {peers} ({stats.count} prior documents)"
+            ),
+            field_name="total_amount",
+            expected_value=stats.median,
+            actual_value=amount,
+            confidence_score=min(magnitude / 7.0, 1.0)
+        )
+
+
+def _group_keys(currency: str, vendor: str, document_type: str) -> Dict[str, str]:
+    """State keys of the groups a document is scored against and folded into."""
+    return {
+        "vendor": json.dumps([currency, vendor, document_type]),
+        "type": json.dumps([currency, document_type]),
+    }
@@ -0,0 +1,161 @@
+"""
+Running-balance reconciliation for bank statements.
+
+A statement's transactions are loaded into NumPy arrays of amounts and
+reported balances, in statement order (oldest first). Along an unbroken
+chain, each reported balance minus the opening balance and the cumulative sum
+of amounts so far is the same constant, zero when the opening balance is
+right. The rows where that offset changes are exactly the rows whose balance
+does not follow from the previous balance and amount. This is one cumulative
+sum and a few array comparisons, so statements with tens of thousands of
+transactions reconcile in milliseconds. Rows without a reported balance are
+bridged, and a transaction whose amount cannot be read re-anchors the chain
+at the next reported balance instead of flagging every row after it.
+Balances are bookkeeping, so only a cent of rounding is tolerated.
+"""
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from src.anomaly.rules import AMOUNT_TOLERANCE
+from src.models.schemas import Anomaly, AnomalyType, DocumentExtraction, MonetaryAmount
+
+# Breaks reported per statement; the description of each gives the total
+MAX_REPORTED_BREAKS = 20
+
+
+class BalanceBreaks(NamedTuple):
+    """Where a statement's balance chain breaks."""
+    rows: np.ndarray  # Transaction indices whose reported balance is off
+    expected: np.ndarray  # Balance each of those rows should report
+    actual: np.ndarray  # Balance each of those rows reports
+    expected_closing: Optional[float]  # None if it cannot be derived
+
+
+def load_transactions(transactions: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Amount and reported balance of each transaction, NaN where missing or unreadable."""
+    amounts = np.fromiter((_transaction_amount(t) for t in transactions), dtype=float, count=len(transactions))
+    balances = np.fromiter((_number(t.get("balance")) for t in transactions), dtype=float, count=len(transactions))
+    return amounts, balances
+
+
+def find_balance_breaks(opening: Optional[float], amounts: np.ndarray, balances: np.ndarray) -> BalanceBreaks:
+    """
+    Compare the cumulative sum of amounts with the reported balances.
+    
+    Without an opening balance the first reported balance anchors the chain.
+    """
+    unreadable = np.isnan(amounts)
+    cumulative = np.cumsum(np.where(unreadable, 0.0, amounts))
+    # Unreadable amounts seen up to each row; the chain can only be checked across rows with none
+    gaps = np.cumsum(unreadable)
+    
+    known = np.flatnonzero(~np.isnan(balances))
+    offsets = balances[known] - cumulative[known]
+    anchor = opening if opening is not None else (offsets[0] if len(known) else np.nan)
+    previous = np.concatenate(([anchor], offsets[:-1]))
+    previous_gaps = np.concatenate(([0], gaps[known][:-1]))
+    
+    checked = (gaps[known] == previous_gaps) & ~np.isnan(previous)
+    broken = checked & (np.abs(offsets - previous) > AMOUNT_TOLERANCE + 1e-9)
+    # A single misread balance breaks the chain into and out of its row; report only the row
+    broken[1:] &= ~(broken[:-1] & (np.abs(offsets[1:] - previous[:-1]) <= AMOUNT_TOLERANCE + 1e-9))
+    
+    # The closing balance continues the chain from the last reported balance
+    expected_closing = None
+    if len(amounts):
+        last_offset, last_gaps = (offsets[-1], gaps[known[-1]]) if len(known) else (anchor, 0)
+        if gaps[-1] == last_gaps and not np.isnan(last_offset):
+            expected_closing = float(cumulative[-1] + last_offset)
+    
+    return BalanceBreaks(
+        rows=known[broken],
+        expected=(cumulative[known] + previous)[broken],
+        actual=balances[known][broken],
+        expected_closing=expected_closing
+    )
+
+
+def reconcile_statement(extraction: DocumentExtraction) -> List[Anomaly]:
+    """Validation errors for transactions whose balance breaks the chain, and for the closing balance."""
+    data = extraction.structured_data
+    transactions = getattr(data, 'transactions', None)
+    if not transactions:
+        return []
+    
+    opening = _balance(getattr(data, 'opening_balance', None))
+    closing = _balance(getattr(data, 'closing_balance', None))
+    amounts, balances = load_transactions(transactions)
+    breaks = find_balance_breaks(opening, amounts, balances)
+    
+    anomalies = []
+    for rank, (row, expected, actual) in enumerate(
+        zip(breaks.rows[:MAX_REPORTED_BREAKS], breaks.expected, breaks.actual), start=1
+    ):
+        transaction = transactions[row]
+        label = " ".join(str(transaction[key]) for key in ("date", "description") if transaction.get(key))
+        anomalies.append(Anomaly(
+            anomaly_id=str(uuid.uuid4()),
+            document_id=extraction.document_id,
+            anomaly_type=AnomalyType.VALIDATION_ERROR,
+            severity="high",
+            description=(
+                f"Balance {actual:,.2f} after transaction {row + 1}{f' ({label})' if label else ''} "
+                f"does not follow from the previous balance and amounts; expected {expected:,.2f} "
+                f"(break {rank} of {len(breaks.rows)})"
+            ),
+            field_name=f"transactions[{row}].balance",
+            expected_value=float(expected),
+            actual_value=float(actual),
+            confidence_score=1.0
+        ))
+    
+    expected_closing = breaks.expected_closing
+    if closing is not None and expected_closing is not None and \
+       abs(closing - expected_closing) > AMOUNT_TOLERANCE + 1e-9:
+        anomalies.append(Anomaly(
+            anomaly_id=str(uuid.uuid4()),
+            document_id=extraction.document_id,
+            anomaly_type=AnomalyType.VALIDATION_ERROR,
+            severity="high",
+            description=(
+                f"Closing balance {closing:,.2f} does not equal the last balance plus later transactions "
+                f"({expected_closing:,.2f})"
+            ),
+            field_name="closing_balance",
+            expected_value=expected_closing,
+            actual_value=closing,
+            confidence_score=1.0
+        ))
+    
+    return anomalies
+
+
+def _balance(value: Any) -> Optional[float]:
+    return value.amount if isinstance(value, MonetaryAmount) else None
+
+
+def _transaction_amount(transaction: Dict[str, Any]) -> float:
+    """Signed amount; credit minus debit for statements that split them."""
+    if transaction.get("amount") is not None:
+        return _number(transaction["amount"])
+    if transaction.get("credit") is not None or transaction.get("debit") is not None:
+        return _number(transaction.get("credit") or 0) - _number(transaction.get("debit") or 0)
+    return np.nan
+
+
+def _number(value: Any) -> float:
+    """Parse 1234.5, "1,234.50" or "(1,234.50)"; NaN if not a number."""
+    if value is None or isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    
+    text = str(value).strip().replace(",", "").replace("$", "")
+    negative = text.startswith("(") and text.endswith(")")
+    try:
+        number = float(text.strip("()"))
+    except ValueError:
+        return np.nan
+    return -number if negative else number
@@ -0,0 +1,327 @@
+"""
+Versioned anomaly models and background retraining.
+
+Fitted models are saved with joblib into a directory shared by all workers,
+one file per version next to a JSON copy of its metadata, and a LATEST
+pointer that is replaced atomically. Each process loads the newest version
+and a background thread keeps it current: it picks up versions saved by
+other workers and retrains when the model is older than the retrain interval
+or the stored documents have drifted from its training set. New models are
+trained off to the side and swapped into the detector with one assignment,
+so scoring requests never wait on training. Model files are unpickled on
+load, so the directory must only be writable by the service.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from prometheus_client import Counter, Gauge
+
+from src.anomaly.detector import AnomalyDetector, AnomalyModel
+from src.anomaly.features import FeatureStore
+from src.models.schemas import AnomalyModelMetadata
+from src.config import get_settings
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Prometheus metrics
+anomaly_model_version = Gauge(
+    'anomaly_model_version', 'Version of the anomaly model in use', multiprocess_mode='livemax'
+)
+anomaly_model_drift = Gauge(
+    'anomaly_model_drift', 'Feature drift of stored documents from the training set, in stds',
+    multiprocess_mode='livemax'
+)
+anomaly_model_retrains = Counter(
+    'anomaly_model_retrains_total', 'Anomaly models trained and saved', ['reason']
+)
+
+
+class ModelRegistry:
+    """Directory of versioned anomaly models."""
+    
+    def __init__(self, directory: Optional[str] = None, keep_versions: Optional[int] = None):
+        """Initialize registry, creating the directory if needed."""
+        self.directory = Path(directory or settings.anomaly_model_dir)
+        self.keep_versions = keep_versions or settings.anomaly_model_keep_versions
+        self.directory.mkdir(parents=True, exist_ok=True)
+    
+    def versions(self) -> List[int]:
+        """Saved versions, oldest first."""
+        return sorted(
+            int(path.stem.rsplit("-v", 1)[1]) for path in self.directory.glob("anomaly-model-v*.joblib")
+        )
+    
+    def latest_version(self) -> int:
+        """Newest saved version, or 0 if none."""
+        try:
+            return int((self.directory / "LATEST").read_text())
+        except (FileNotFoundError, ValueError):
+            versions = self.versions()
+            return versions[-1] if versions else 0
+    
+    def save(self, model: AnomalyModel) -> AnomalyModel:
+        """Save a model as the next version; returns it with the version assigned."""
+        import joblib
+        
+        with self.lock("registry"):
+            version = max(self.versions(), default=0) + 1
+            model = model._replace(metadata=model.metadata.model_copy(update={"version": version}))
+            
+            payload = {
+                "scaler": model.scaler,
+                "isolation_forest": model.isolation_forest,
+                "metadata": model.metadata.model_dump(mode="json"),
+            }
+            self._write(self._path(version, ".json"), model.metadata.model_dump_json(indent=2).encode())
+            temp = self._path(version, ".joblib.tmp")
+            joblib.dump(payload, temp)
+            os.replace(temp, self._path(version, ".joblib"))
+            self._write(self.directory / "LATEST", str(version).encode())
+            
+            for old in self.versions()[:-self.keep_versions]:
+                self._path(old, ".joblib").unlink(missing_ok=True)
+                self._path(old, ".json").unlink(missing_ok=True)
+        
+        logger.info(f"Saved anomaly model v{version} ({model.metadata.training_documents} documents)")
+        return model
+    
+    def load(self, version: Optional[int] = None) -> Optional[AnomalyModel]:
+        """Load a saved version (the newest by default); None if there is none."""
+        import joblib
+        
+        version = version or self.latest_version()
+        if not version:
+            return None
+        
+        try:
+            payload = joblib.load(self._path(version, ".joblib"))
+        except FileNotFoundError:
+            return None
+        
+        return AnomalyModel(
+            payload["scaler"],
+            payload["isolation_forest"],
+            AnomalyModelMetadata(**payload["metadata"])
+        )
+    
+    @contextmanager
+    def lock(self, name: str, blocking: bool = True) -> Iterator[bool]:
+        """Hold an inter-process lock; yields False if non-blocking and already held."""
+        with open(self.directory / f".{name}.lock", "w") as handle:
+            if not _lock_file(handle, blocking):
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                _unlock_file(handle)
+    
+    def _path(self, version: int, suffix: str) -> Path:
+        return self.directory / f"anomaly-model-v{version:06d}{suffix}"
+    
+    def _write(self, path: Path, data: bytes) -> None:
+        """Write a file so readers see either the old or the new content."""
+        temp = path.with_name(path.name + ".tmp")
+        temp.write_bytes(data)
+        os.replace(temp, path)
+
+
+class AnomalyModelManager:
+    """Keeps a detector on the newest model and retrains it in the background."""
+    
+    def __init__(
+        self,
+        detector: AnomalyDetector,
+        feature_store: FeatureStore,
+        registry: Optional[ModelRegistry] = None,
+        retrain_interval_seconds: Optional[float] = None,
+        drift_threshold: Optional[float] = None,
+        min_training_documents: Optional[int] = None,
+        check_interval_seconds: Optional[float] = None
+    ):
+        """Initialize manager (the background thread is started separately with start())."""
+        self.detector = detector
+        self.feature_store = feature_store
+        self.registry = registry or ModelRegistry()
+        self.retrain_interval_seconds = (
+            settings.anomaly_retrain_interval_seconds if retrain_interval_seconds is None else retrain_interval_seconds
+        )
+        self.drift_threshold = settings.anomaly_drift_threshold if drift_threshold is None else drift_threshold
+        self.min_training_documents = (
+            settings.anomaly_min_training_documents if min_training_documents is None else min_training_documents
+        )
+        self.check_interval_seconds = check_interval_seconds or settings.anomaly_retrain_check_seconds
+        
+        self._training = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self) -> None:
+        """Start the background refresh/retrain thread."""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="anomaly-model-manager", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the background thread (a retrain in progress is finished first)."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+    
+    def refresh(self) -> bool:
+        """Swap in the newest saved model if it is newer than the one in use."""
+        current = self.detector.model
+        latest = self.registry.latest_version()
+        if latest <= (current.metadata.version if current else 0):
+            return False
+        
+        model = self.registry.load(latest)
+        if model is None:
+            return False
+        
+        self.detector.swap(model)
+        anomaly_model_version.set(latest)
+        logger.info(f"Loaded anomaly model v{latest} (trained {model.metadata.trained_at:%Y-%m-%d %H:%M})")
+        return True
+    
+    def ensure_model(self, wait_seconds: Optional[float] = None) -> bool:
+        """
+        Load or train a model if the detector has none yet (first request after a cold start).
+        
+        If another thread or process is training the first model, waits up to
+        wait_seconds for it to be saved. Returns whether a model is in use.
+        """
+        if self.detector.model is not None or self.refresh() or self.retrain("initial") is not None:
+            return True
+        
+        wait_seconds = settings.anomaly_model_wait_seconds if wait_seconds is None else wait_seconds
+        deadline = time.monotonic() + wait_seconds
+        while self.detector.model is None and time.monotonic() < deadline:
+            time.sleep(min(0.5, max(deadline - time.monotonic(), 0)))
+            self.refresh()
+        return self.detector.model is not None
+    
+    def retrain_reason(self) -> Optional[str]:
+        """Why the model should be retrained now, or None."""
+        frame = self.feature_store.frame()
+        if len(frame) < self.min_training_documents:
+            return None
+        
+        model = self.detector.model
+        if model is None:
+            return "initial"
+        
+        age = (datetime.utcnow() - model.metadata.trained_at).total_seconds()
+        if self.retrain_interval_seconds and age > self.retrain_interval_seconds:
+            return "scheduled"
+        
+        drift = self.detector.drift(frame.values)
+        anomaly_model_drift.set(drift)
+        if self.drift_threshold and drift > self.drift_threshold:
+            return "drift"
+        return None
+    
+    def retrain(self, reason: str = "manual") -> Optional[AnomalyModel]:
+        """
+        Train on all stored documents, save a new version and swap it in.
+        
+        Returns None if another thread or process is already training, or
+        if (for automatic reasons) a model saved meanwhile made it unnecessary.
+        """
+        if not self._training.acquire(blocking=False):
+            return None
+        try:
+            with self.registry.lock("training", blocking=False) as acquired:
+                if not acquired:
+                    return None
+                
+                # Another worker may have retrained while we waited
+                if reason != "manual" and self.refresh() and self.retrain_reason() is None:
+                    return None
+                
+                frame = self.feature_store.frame()
+                if not len(frame):
+                    return None
+                
+                model = self.detector.train(frame.values, reason=reason, data_version=self.feature_store.seq)
+                model = self.registry.save(model)
+                self.detector.swap(model)
+        finally:
+            self._training.release()
+        
+        anomaly_model_version.set(model.metadata.version)
+        anomaly_model_retrains.labels(reason=reason).inc()
+        return model
+    
+    def check(self) -> Optional[AnomalyModel]:
+        """Pick up newer saved models, then retrain if due; returns a newly trained model."""
+        self.refresh()
+        reason = self.retrain_reason()
+        if reason is None:
+            return None
+        
+        logger.info(f"Retraining anomaly model ({reason})")
+        return self.retrain(reason)
+    
+    def status(self) -> Dict[str, Any]:
+        """Model in use, saved versions and current drift."""
+        model = self.detector.model
+        frame = self.feature_store.frame()
+        return {
+            "model": model.metadata.model_dump(mode="json") if model else None,
+            "saved_versions": self.registry.versions(),
+            "documents": len(frame),
+            "drift": round(self.detector.drift(frame.values), 4) if model else None,
+            "retraining": self._training.locked(),
+        }
+    
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Anomaly model check failed: {e}", exc_info=True)
+            self._stopping.wait(self.check_interval_seconds)
+
+
+def _lock_file(handle: Any, blocking: bool) -> bool:
+    """Take an exclusive lock on an open file; False if non-blocking and already held."""
+    if os.name != "nt":
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+    
+    # msvcrt locks a byte range and its blocking mode gives up after 10s, so poll instead
+    while True:
+        try:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.1)
+
+
+def _unlock_file(handle: Any) -> None:
+    if os.name != "nt":
+        fcntl.flock(handle, fcntl.LOCK_UN)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
@@ -15,6 +15,7 @@ from src.models.schemas import (
     MonetaryAmount, Currency, ExtractedEntity
 )
 from src.config import get_settings
+from src.utils.llm_usage import usage_config
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -82,7 +83,9 @@ class LLMExtractor:
         chain = prompt | self.llm
         
         try:
-            response = chain.invoke({"text": text[:4000], "tables_section": tables_section})
+            response = chain.invoke(
+                {"text": text[:4000], "tables_section": tables_section}, config=usage_config("invoice_extraction")
+            )
             result_text = response.content
             
             # Parse JSON response
@@ -138,7 +141,9 @@ class LLMExtractor:
         chain = prompt | self.llm
         
         try:
-            response = chain.invoke({"text": text[:4000], "tables_section": tables_section})
+            response = chain.invoke(
+                {"text": text[:4000], "tables_section": tables_section}, config=usage_config("statement_extraction")
+            )
             result_text = response.content
             
             # Parse JSON response
@@ -175,7 +180,9 @@ class LLMExtractor:
         chain = prompt | self.llm
         
         try:
-            response = chain.invoke({"text": text[:3000], "doc_type": doc_type.value})
+            response = chain.invoke(
+                {"text": text[:3000], "doc_type": doc_type.value}, config=usage_config("entity_extraction")
+            )
             result_text = response.content
             
             # Parse JSON response
@@ -208,7 +215,7 @@ class LLMExtractor:
         chain = prompt | self.llm
         
         try:
-            response = chain.invoke({"text": text[:1000]})
+            response = chain.invoke({"text": text[:1000]}, config=usage_config("classification"))
             doc_type_str = response.content.strip().lower()
             
             # Map to enum
@@ -0,0 +1,5 @@
+# Jobs package
+from src.jobs.job_queue import JobQueue
+from src.jobs.progress import ProgressBroker
+
+__all__ = ["JobQueue", "ProgressBroker"]
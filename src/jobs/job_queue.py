@@ -0,0 +1,443 @@
+"""
+Persistent background job queue for document processing.
+
+Jobs are stored in a local SQLite database and executed by a bounded pool
+of worker threads, so request handlers return immediately and queued or
+interrupted jobs survive a restart. Workers claim jobs with a lease; a job
+whose lease expires (e.g. its process died) is picked up again, and a job
+whose handler raises is re-queued with exponential backoff. Either way a job
+is marked failed once it has run max_attempts times.
+"""
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from src.models.schemas import BatchStatus, DocumentStatus, ProcessingJob, ProcessingStatus
+from src.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Called by job handlers to report (stage, progress_percentage, optional details)
+ProgressCallback = Callable[..., None]
+JobHandler = Callable[[ProcessingJob, ProgressCallback], None]
+# Called with a job's final row once it has been recorded as completed or failed
+JobFinishedCallback = Callable[[ProcessingJob], None]
+
+_COLUMNS = (
+    "job_id, document_id, file_path, filename, uploader, source_type, status, "
+    "current_stage, progress_percentage, error_message, attempts, batch_id, content_hash, "
+    "created_at, updated_at"
+)
+
+
+class JobQueue:
+    """SQLite-backed job queue with a bounded worker pool."""
+    
+    def __init__(
+        self,
+        handler: JobHandler,
+        path: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        lease_seconds: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        retry_backoff_seconds: Optional[float] = None,
+        on_finished: Optional[JobFinishedCallback] = None
+    ):
+        """Initialize queue (workers are started separately with start())."""
+        self.handler = handler
+        self.on_finished = on_finished
+        self.path = path or settings.job_queue_path
+        self.max_workers = max_workers or settings.job_workers
+        self.lease_seconds = lease_seconds or settings.job_lease_seconds
+        self.max_attempts = max_attempts or settings.job_max_attempts
+        self.retry_backoff_seconds = (
+            settings.job_retry_backoff_seconds if retry_backoff_seconds is None else retry_backoff_seconds
+        )
+        self.poll_interval = settings.job_poll_interval_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._workers: List[threading.Thread] = []
+        
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                uploader TEXT NOT NULL,
+                source_type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                current_stage TEXT NOT NULL,
+                progress_percentage INTEGER NOT NULL DEFAULT 0,
+                error_message TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                batch_id TEXT,
+                content_hash TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                owner TEXT,
+                lease_expires REAL,
+                available_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS ix_jobs_document ON jobs (document_id);
+            CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS ix_jobs_batch ON jobs (batch_id);
+            CREATE INDEX IF NOT EXISTS ix_jobs_content_hash ON jobs (content_hash);
+        """)
+    
+    def start(self) -> None:
+        """Recover orphaned jobs and start worker threads."""
+        if self._workers:
+            return
+        
+        self._requeue_orphaned()
+        self._stopping.clear()
+        
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        
+        logger.info(f"Job queue started with {self.max_workers} workers ({self.path})")
+    
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop worker threads; in-flight jobs are re-run after restart."""
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+        self._workers = []
+    
+    def submit(
+        self,
+        document_id: str,
+        file_path: str,
+        filename: str,
+        uploader: str,
+        source_type: str = "upload",
+        batch_id: Optional[str] = None,
+        content_hash: Optional[str] = None
+    ) -> ProcessingJob:
+        """Persist a new job and wake a worker."""
+        job = ProcessingJob(
+            job_id=str(uuid.uuid4()),
+            document_id=document_id,
+            file_path=file_path,
+            filename=filename,
+            uploader=uploader,
+            source_type=source_type,
+            batch_id=batch_id,
+            content_hash=content_hash
+        )
+        
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.job_id, job.document_id, job.file_path, job.filename, job.uploader,
+                    job.source_type, job.status.value, job.current_stage, job.progress_percentage,
+                    job.error_message, job.attempts, job.batch_id, job.content_hash,
+                    job.created_at.isoformat(), job.updated_at.isoformat()
+                )
+            )
+        
+        with self._wakeup:
+            self._wakeup.notify()
+        
+        logger.info(f"Queued job {job.job_id} for document {document_id}")
+        return job
+    
+    def get(self, job_id: str) -> Optional[ProcessingJob]:
+        """Get a job by id."""
+        return self._fetch_one("WHERE job_id = ?", (job_id,))
+    
+    def get_for_document(self, document_id: str) -> Optional[ProcessingJob]:
+        """Get the most recent job for a document."""
+        return self._fetch_one("WHERE document_id = ? ORDER BY created_at DESC", (document_id,))
+    
+    def find_by_content_hash(self, content_hash: str) -> Optional[ProcessingJob]:
+        """Get the most recent job that has not failed for identical file content."""
+        return self._fetch_one(
+            "WHERE content_hash = ? AND status != ? ORDER BY created_at DESC",
+            (content_hash, ProcessingStatus.FAILED.value)
+        )
+    
+    def get_batch(self, batch_id: str) -> List[ProcessingJob]:
+        """Get all jobs submitted as part of a batch, in submission order."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE batch_id = ? ORDER BY created_at, rowid", (batch_id,)
+            ).fetchall()
+        return [ProcessingJob(**dict(row)) for row in rows]
+    
+    def get_batch_status(self, batch_id: str) -> Optional[BatchStatus]:
+        """Summarize per-document status and throughput of a batch."""
+        jobs = self.get_batch(batch_id)
+        if not jobs:
+            return None
+        
+        counts = {status.value: 0 for status in ProcessingStatus}
+        for job in jobs:
+            counts[job.status.value] += 1
+        
+        terminal = (ProcessingStatus.COMPLETED, ProcessingStatus.FAILED)
+        started_at = min(job.created_at for job in jobs)
+        finished = all(job.status in terminal for job in jobs)
+        finished_at = max(job.updated_at for job in jobs) if finished else None
+        elapsed = ((finished_at or datetime.utcnow()) - started_at).total_seconds()
+        completed = counts[ProcessingStatus.COMPLETED.value]
+        
+        return BatchStatus(
+            batch_id=batch_id,
+            total=len(jobs),
+            status_counts=counts,
+            documents=[self._to_status(job) for job in jobs],
+            started_at=started_at,
+            finished_at=finished_at,
+            elapsed_seconds=elapsed,
+            documents_per_minute=completed * 60 / elapsed if elapsed > 0 else 0.0
+        )
+    
+    def pending_count(self) -> int:
+        """Number of jobs queued and not yet claimed by a worker."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (ProcessingStatus.UPLOADED.value,)
+            ).fetchone()[0]
+    
+    def get_status(self, document_id: str) -> Optional[DocumentStatus]:
+        """Get processing status of a document from its most recent job."""
+        job = self.get_for_document(document_id)
+        return self._to_status(job) if job else None
+    
+    def _to_status(self, job: ProcessingJob) -> DocumentStatus:
+        """Convert a job to the document status model."""
+        return DocumentStatus(
+            document_id=job.document_id,
+            status=job.status,
+            progress_percentage=job.progress_percentage,
+            current_stage=job.current_stage,
+            error_message=job.error_message,
+            updated_at=job.updated_at,
+            job_id=job.job_id,
+            filename=job.filename
+        )
+    
+    def delete_for_documents(self, document_ids: List[str]) -> int:
+        """Forget every job of deleted documents; returns jobs removed."""
+        removed = 0
+        with self._lock:
+            for start in range(0, len(document_ids), 500):
+                chunk = document_ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                removed += self._conn.execute(
+                    f"DELETE FROM jobs WHERE document_id IN ({placeholders})", chunk
+                ).rowcount
+        return removed
+    
+    def update_progress(self, job_id: str, stage: str, progress: int) -> None:
+        """Record job progress and renew its lease."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET current_stage = ?, progress_percentage = ?, updated_at = ?, "
+                "lease_expires = ? WHERE job_id = ?",
+                (stage, progress, datetime.utcnow().isoformat(), time.time() + self.lease_seconds, job_id)
+            )
+    
+    def _fetch_one(self, clause: str, params: tuple) -> Optional[ProcessingJob]:
+        """Fetch a single job row as a model."""
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM jobs {clause} LIMIT 1", params).fetchone()
+        return ProcessingJob(**dict(row)) if row else None
+    
+    def _claim_next(self) -> Optional[ProcessingJob]:
+        """Atomically claim the oldest queued job that is due, or one whose lease expired."""
+        now = time.time()
+        abandoned = None
+        
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    f"SELECT {_COLUMNS} FROM jobs "
+                    "WHERE (status = ? AND (available_at IS NULL OR available_at <= ?)) "
+                    "OR (status = ? AND lease_expires < ?) ORDER BY created_at LIMIT 1",
+                    (ProcessingStatus.UPLOADED.value, now, ProcessingStatus.PROCESSING.value, now)
+                ).fetchone()
+                
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                
+                job = ProcessingJob(**dict(row))
+                job.attempts += 1
+                
+                if job.attempts > self.max_attempts:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, error_message = ?, updated_at = ?, "
+                        "lease_expires = NULL WHERE job_id = ?",
+                        (
+                            ProcessingStatus.FAILED.value,
+                            f"Gave up after {self.max_attempts} attempts",
+                            datetime.utcnow().isoformat(),
+                            job.job_id
+                        )
+                    )
+                    abandoned = job.job_id
+                else:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = ?, owner = ?, lease_expires = ?, "
+                        "available_at = NULL, updated_at = ? WHERE job_id = ?",
+                        (
+                            ProcessingStatus.PROCESSING.value, job.attempts, self.owner,
+                            now + self.lease_seconds, datetime.utcnow().isoformat(), job.job_id
+                        )
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        
+        if abandoned:
+            self._notify_finished(abandoned)
+            return None
+        
+        job.status = ProcessingStatus.PROCESSING
+        return job
+    
+    def _finish(self, job_id: str, status: ProcessingStatus, stage: str, progress: int, error: Optional[str] = None) -> None:
+        """Record final job state."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, current_stage = ?, progress_percentage = ?, "
+                "error_message = ?, updated_at = ?, lease_expires = NULL WHERE job_id = ?",
+                (status.value, stage, progress, error, datetime.utcnow().isoformat(), job_id)
+            )
+    
+    def _retry_later(self, job: ProcessingJob, error: str) -> float:
+        """Put a failed attempt back in the queue after a backoff delay; returns the delay."""
+        delay = self.retry_backoff_seconds * 2 ** (job.attempts - 1)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, current_stage = ?, error_message = ?, updated_at = ?, "
+                "owner = NULL, lease_expires = NULL, available_at = ? WHERE job_id = ?",
+                (
+                    ProcessingStatus.UPLOADED.value, "queued", error,
+                    datetime.utcnow().isoformat(), time.time() + delay, job.job_id
+                )
+            )
+        return delay
+    
+    def _requeue_orphaned(self) -> None:
+        """Requeue jobs left processing by a dead process on this host (POSIX; elsewhere leases expire)."""
+        host = socket.gethostname()
+        
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, owner FROM jobs WHERE status = ?",
+                (ProcessingStatus.PROCESSING.value,)
+            ).fetchall()
+            
+            for row in rows:
+                owner_host, _, owner_pid = (row["owner"] or "").rpartition(":")
+                if owner_host == host and owner_pid.isdigit() and not _pid_alive(int(owner_pid)):
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, current_stage = ?, lease_expires = NULL WHERE job_id = ?",
+                        (ProcessingStatus.UPLOADED.value, "queued", row["job_id"])
+                    )
+                    logger.info(f"Requeued orphaned job {row['job_id']}")
+    
+    def _worker_loop(self) -> None:
+        """Claim and run jobs until stopped."""
+        while not self._stopping.is_set():
+            try:
+                job = self._claim_next()
+            except Exception as e:
+                logger.error(f"Failed to claim job: {e}")
+                job = None
+            
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=self.poll_interval)
+                continue
+            
+            self._run(job)
+    
+    def _run(self, job: ProcessingJob) -> None:
+        """Run a claimed job through the handler."""
+        logger.info(f"Running job {job.job_id} (attempt {job.attempts})")
+        
+        def report(stage: str, progress: int, details: Optional[Dict[str, Any]] = None) -> None:
+            self.update_progress(job.job_id, stage, progress)
+        
+        try:
+            self.handler(job, report)
+            self._finish(job.job_id, ProcessingStatus.COMPLETED, "completed", 100)
+            logger.info(f"Job {job.job_id} completed")
+        except Exception as e:
+            if job.attempts < self.max_attempts:
+                delay = self._retry_later(job, str(e))
+                logger.warning(
+                    f"Job {job.job_id} attempt {job.attempts}/{self.max_attempts} failed: {e}; "
+                    f"retrying in {delay:.0f}s"
+                )
+                return
+            
+            logger.error(f"Job {job.job_id} failed after {job.attempts} attempts: {e}", exc_info=True)
+            current = self.get(job.job_id)
+            self._finish(
+                job.job_id, ProcessingStatus.FAILED,
+                current.current_stage if current else "failed",
+                current.progress_percentage if current else 0,
+                error=str(e)
+            )
+        
+        self._notify_finished(job.job_id)
+    
+    def _notify_finished(self, job_id: str) -> None:
+        """Pass a finished job's recorded row to the on_finished callback."""
+        if self.on_finished is None:
+            return
+        
+        job = self.get(job_id)
+        if job is None:
+            return
+        
+        try:
+            self.on_finished(job)
+        except Exception as e:
+            logger.error(f"on_finished callback failed for job {job_id}: {e}")
+
+
+def _pid_alive(pid: int) -> bool:
+    """Check whether a process id is running on this host (always True on Windows)."""
+    if os.name == "nt":
+        # os.kill(pid, 0) terminates the process on Windows; leave its jobs to lease expiry
+        return True
+    
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
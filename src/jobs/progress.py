@@ -0,0 +1,79 @@
+"""
+In-process fan-out of document processing events to stream subscribers.
+
+Workers publish from their own threads; subscribers are asyncio queues read
+by SSE handlers on the event loop. Recent events are kept per document so a
+client that connects mid-run (or reconnects) can catch up.
+"""
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.cache import TTLCache
+
+# Events after which a document's stream ends
+TERMINAL_EVENTS = ("completed", "failed")
+
+
+class ProgressBroker:
+    """Publish/subscribe hub for per-document processing events."""
+    
+    def __init__(self, history_documents: int = 1024, history_ttl_seconds: float = 3600):
+        """Initialize broker."""
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = defaultdict(list)
+        self._history = TTLCache("progress_history", max_entries=history_documents, ttl_seconds=history_ttl_seconds)
+        self._sequence: Dict[str, int] = defaultdict(int)
+    
+    def publish(self, document_id: str, event: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Record an event and deliver it to current subscribers (thread-safe)."""
+        with self._lock:
+            self._sequence[document_id] += 1
+            payload = {
+                "document_id": document_id,
+                "seq": self._sequence[document_id],
+                "timestamp": time.time(),
+                **(data or {})
+            }
+            
+            # A new run (sequence restarted) replaces the previous run's history
+            history = [] if payload["seq"] == 1 else self._history.get(document_id) or []
+            history.append((event, payload))
+            self._history.set(document_id, history[-100:])
+            
+            if event in TERMINAL_EVENTS:
+                self._sequence.pop(document_id, None)
+            
+            subscribers = list(self._subscribers.get(document_id, ()))
+        
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, (event, payload))
+        
+        return payload
+    
+    def subscribe(self, document_id: str) -> asyncio.Queue:
+        """Subscribe the running event loop to a document's events."""
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers[document_id].append((asyncio.get_running_loop(), queue))
+        return queue
+    
+    def unsubscribe(self, document_id: str, queue: asyncio.Queue) -> None:
+        """Remove a subscriber."""
+        with self._lock:
+            subscribers = self._subscribers.get(document_id, [])
+            self._subscribers[document_id] = [entry for entry in subscribers if entry[1] is not queue]
+            if not self._subscribers[document_id]:
+                del self._subscribers[document_id]
+    
+    def reset(self, document_id: str) -> None:
+        """Forget a document's events, e.g. before a new run is queued, so streams wait for that run."""
+        with self._lock:
+            self._history.pop(document_id)
+            self._sequence.pop(document_id, None)
+    
+    def history(self, document_id: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """Recent events for a document, oldest first."""
+        return list(self._history.get(document_id) or [])
@@ -9,6 +9,10 @@ from src.models.schemas import (
     QueryResponse,
     Anomaly,
     Insight,
+    DocumentStatus,
+    ProcessingJob,
+    BatchUploadResponse,
+    BatchStatus,
 )
 
 __all__ = [
@@ -21,4 +25,8 @@ __all__ = [
     "QueryResponse",
     "Anomaly",
     "Insight",
+    "DocumentStatus",
+    "ProcessingJob",
+    "BatchUploadResponse",
+    "BatchStatus",
 ]
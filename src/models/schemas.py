@@ -37,6 +37,7 @@ class DocumentMetadata(BaseModel):
     uploader: str
     source_type: str = "upload"  # upload, email, sftp, shared_drive
     s3_key: Optional[str] = None
+    content_hash: Optional[str] = None  # SHA-256 of the file bytes
 
 
 class BoundingBox(BaseModel):
@@ -122,6 +123,15 @@ class DocumentExtraction(BaseModel):
     processing_time_seconds: float = 0.0
 
 
+class DocumentChunk(BaseModel):
+    """Chunk of document content for vector indexing, with page provenance."""
+    text: str
+    chunk_type: str = "text"  # text, table
+    page_start: int
+    page_end: int
+    chunk_index: int = 0
+
+
 class AnomalyType(str, Enum):
     """Types of anomalies detected."""
     OUTLIER_AMOUNT = "outlier_amount"
@@ -146,6 +156,18 @@ class Anomaly(BaseModel):
     detected_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class AnomalyModelMetadata(BaseModel):
+    """Version and training-set summary of a fitted anomaly model."""
+    version: int = 0  # 0 until saved to the model registry
+    trained_at: datetime = Field(default_factory=datetime.utcnow)
+    reason: str = "initial"  # initial, scheduled, drift, manual
+    training_documents: int
+    data_version: int = 0  # Repository change seq the training set was read at
+    feature_names: List[str]
+    feature_means: List[float]
+    feature_stds: List[float]
+
+
 class InsightType(str, Enum):
     """Types of insights generated."""
     SUMMARY = "summary"
@@ -192,6 +214,8 @@ class UploadResponse(BaseModel):
     status: str
     message: str
     metadata: DocumentMetadata
+    job_id: Optional[str] = None
+    deduplicated: bool = False  # True if identical content was already uploaded
 
 
 class ProcessingStatus(str, Enum):
@@ -210,3 +234,43 @@ class DocumentStatus(BaseModel):
     current_stage: str
     error_message: Optional[str] = None
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    job_id: Optional[str] = None
+    filename: Optional[str] = None
+
+
+class ProcessingJob(BaseModel):
+    """Queued document processing job."""
+    job_id: str
+    document_id: str
+    file_path: str
+    filename: str
+    uploader: str
+    source_type: str = "upload"
+    status: ProcessingStatus = ProcessingStatus.UPLOADED
+    current_stage: str = "queued"
+    progress_percentage: int = 0
+    error_message: Optional[str] = None
+    attempts: int = 0
+    batch_id: Optional[str] = None
+    content_hash: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class BatchUploadResponse(BaseModel):
+    """Response after a batch upload."""
+    batch_id: str
+    accepted: List[UploadResponse]
+    rejected: List[Dict[str, str]] = Field(default_factory=list)  # filename, reason
+
+
+class BatchStatus(BaseModel):
+    """Aggregate processing status of a batch upload."""
+    batch_id: str
+    total: int
+    status_counts: Dict[str, int]
+    documents: List[DocumentStatus]
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    elapsed_seconds: float
+    documents_per_minute: float
@@ -3,22 +3,29 @@ OCR and preprocessing pipeline for document extraction.
 """
 import io
 import logging
+import re
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 import cv2
 import numpy as np
 import pytesseract
 from pdf2image import convert_from_bytes, convert_from_path
 from PIL import Image
-import camelot
-import pdfplumber
 
 from src.models.schemas import OCRResult, TableData, BoundingBox
 from src.config import get_settings
+from src.utils.helpers import timed_stage
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Page separator written into full text by DocumentPreprocessor.process_pdf
+PAGE_MARKER = "--- Page {page} ---"
+PAGE_MARKER_PATTERN = re.compile(r"^--- Page (\d+) ---$", re.MULTILINE)
+
+# Called with (event, page, total_pages) as pages are rasterized and OCR'd
+PageCallback = Callable[[str, int, int], None]
+
 
 class OCREngine:
     """OCR engine using Tesseract."""
@@ -96,6 +103,8 @@ class TableExtractor:
     def extract_with_camelot(pdf_path: str, pages: str = 'all') -> List[TableData]:
         """Extract tables using Camelot (lattice method for bordered tables)."""
         try:
+            import camelot  # Heavy (OpenCV/Ghostscript bindings); loaded on first table extraction
+            
             tables = camelot.read_pdf(pdf_path, pages=pages, flavor='lattice')
             results = []
             
@@ -123,6 +132,8 @@ class TableExtractor:
     def extract_with_pdfplumber(pdf_path: str) -> List[TableData]:
         """Extract tables using pdfplumber (better for borderless tables)."""
         try:
+            import pdfplumber
+            
             results = []
             with pdfplumber.open(pdf_path) as pdf:
                 for page_num, page in enumerate(pdf.pages):
@@ -135,7 +146,7 @@ class TableExtractor:
                             table_data = TableData(
                                 headers=headers,
                                 rows=rows,
-                                page_number=page_num,
+                                page_number=page_num + 1,  # 1-based, as Camelot and page markers
                                 confidence=0.85  # pdfplumber doesn't provide confidence
                             )
                             results.append(table_data)
@@ -180,54 +191,104 @@ class DocumentPreprocessor:
             logger.error(f"PDF bytes to image conversion failed: {e}")
             return []
     
-    def process_document(self, file_path: str) -> Tuple[List[OCRResult], List[TableData], str]:
+    @staticmethod
+    def split_pages(full_text: str) -> List[Tuple[int, str]]:
+        """
+        Split full text from process_document into pages.
+        
+        Returns:
+            List of (page_number, page_text) with 1-based page numbers. Text
+            without page markers (e.g. single images) is returned as page 1.
+        """
+        markers = list(PAGE_MARKER_PATTERN.finditer(full_text))
+        if not markers:
+            return [(1, full_text.strip())] if full_text.strip() else []
+        
+        pages = []
+        for i, marker in enumerate(markers):
+            end = markers[i + 1].start() if i + 1 < len(markers) else len(full_text)
+            pages.append((int(marker.group(1)), full_text[marker.end():end].strip()))
+        
+        return pages
+    
+    def process_document(
+        self,
+        file_path: str,
+        page_callback: Optional[PageCallback] = None
+    ) -> Tuple[List[OCRResult], List[TableData], str]:
         """
         Process document and extract OCR results, tables, and full text.
         
+        Args:
+            file_path: Path to the document file
+            page_callback: Called with (event, page, total_pages) as pages are
+                rasterized ("rasterized", 0, n) and OCR'd ("ocr", i, n)
+        
         Returns:
             Tuple of (ocr_results, tables, full_text)
         """
         path = Path(file_path)
         
         if path.suffix.lower() == '.pdf':
-            return self.process_pdf(file_path)
+            return self.process_pdf(file_path, page_callback)
         elif path.suffix.lower() in ['.png', '.jpg', '.jpeg', '.tiff', '.bmp']:
-            return self.process_image(file_path)
+            return self.process_image(file_path, page_callback)
         else:
             logger.error(f"Unsupported file type: {path.suffix}")
             return [], [], ""
     
-    def process_pdf(self, pdf_path: str) -> Tuple[List[OCRResult], List[TableData], str]:
+    def process_pdf(
+        self,
+        pdf_path: str,
+        page_callback: Optional[PageCallback] = None
+    ) -> Tuple[List[OCRResult], List[TableData], str]:
         """Process PDF document."""
         logger.info(f"Processing PDF: {pdf_path}")
         
         # Extract tables
-        tables = self.table_extractor.extract_tables(pdf_path)
+        with timed_stage("table_extraction"):
+            tables = self.table_extractor.extract_tables(pdf_path)
         
         # Convert to images and run OCR
-        images = self.pdf_to_images(pdf_path)
+        with timed_stage("rasterize"):
+            images = self.pdf_to_images(pdf_path)
         ocr_results = []
         full_text_parts = []
         
+        if page_callback:
+            page_callback("rasterized", 0, len(images))
+        
         for i, image in enumerate(images):
-            page_results = self.ocr_engine.extract_text_with_boxes(image, page_num=i)
+            with timed_stage("ocr", per_page=True):
+                page_results = self.ocr_engine.extract_text_with_boxes(image, page_num=i)
+                page_text = self.ocr_engine.extract_full_text(image)
+            
             ocr_results.extend(page_results)
+            full_text_parts.append(f"{PAGE_MARKER.format(page=i + 1)}\n{page_text}")
             
-            page_text = self.ocr_engine.extract_full_text(image)
-            full_text_parts.append(f"--- Page {i+1} ---\n{page_text}")
+            if page_callback:
+                page_callback("ocr", i + 1, len(images))
         
         full_text = "\n\n".join(full_text_parts)
         
         logger.info(f"Extracted {len(ocr_results)} text blocks and {len(tables)} tables")
         return ocr_results, tables, full_text
     
-    def process_image(self, image_path: str) -> Tuple[List[OCRResult], List[TableData], str]:
+    def process_image(
+        self,
+        image_path: str,
+        page_callback: Optional[PageCallback] = None
+    ) -> Tuple[List[OCRResult], List[TableData], str]:
         """Process image document."""
         logger.info(f"Processing image: {image_path}")
         
         image = Image.open(image_path)
-        ocr_results = self.ocr_engine.extract_text_with_boxes(image, page_num=0)
-        full_text = self.ocr_engine.extract_full_text(image)
+        with timed_stage("ocr", per_page=True):
+            ocr_results = self.ocr_engine.extract_text_with_boxes(image, page_num=0)
+            full_text = self.ocr_engine.extract_full_text(image)
+        
+        if page_callback:
+            page_callback("ocr", 1, 1)
         
         logger.info(f"Extracted {len(ocr_results)} text blocks")
         return ocr_results, [], full_text
@@ -1,4 +1,21 @@
 # RAG package
 from src.rag.rag_engine import VectorStore, RAGEngine
+from src.rag.chunking import LayoutChunker
+from src.rag.embeddings import (
+    EmbeddingBackend,
+    OpenAIEmbeddingBackend,
+    SentenceTransformerBackend,
+    HashingEmbeddingBackend,
+    get_embedding_backend,
+)
 
-__all__ = ["VectorStore", "RAGEngine"]
+__all__ = [
+    "VectorStore",
+    "RAGEngine",
+    "LayoutChunker",
+    "EmbeddingBackend",
+    "OpenAIEmbeddingBackend",
+    "SentenceTransformerBackend",
+    "HashingEmbeddingBackend",
+    "get_embedding_backend",
+]
@@ -0,0 +1,118 @@
+"""
+Layout-aware chunking of document extractions for vector indexing.
+"""
+import logging
+from typing import List, Optional
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from src.models.schemas import DocumentChunk, DocumentExtraction, TableData
+from src.ocr.preprocessor import DocumentPreprocessor
+from src.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class LayoutChunker:
+    """
+    Chunker that respects page and table boundaries.
+    
+    Consecutive short pages are packed into one chunk, oversized pages are
+    split on paragraph boundaries, and each table becomes its own chunk.
+    Overlap is only applied between pieces of the same oversized page.
+    """
+    
+    def __init__(self, chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None):
+        """Initialize chunker."""
+        self.chunk_size = chunk_size or settings.chunk_size
+        self.chunk_overlap = settings.chunk_overlap if chunk_overlap is None else chunk_overlap
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            length_function=len
+        )
+    
+    def chunk(self, extraction: DocumentExtraction) -> List[DocumentChunk]:
+        """Split a document extraction into page-aligned text and table chunks."""
+        chunks = self.chunk_text(extraction.raw_text)
+        for table in extraction.tables:
+            chunks.extend(self.chunk_table(table))
+        
+        for i, chunk in enumerate(chunks):
+            chunk.chunk_index = i
+        
+        return chunks
+    
+    def chunk_text(self, full_text: str) -> List[DocumentChunk]:
+        """Chunk full document text along page boundaries."""
+        chunks = []
+        pending_pages = []
+        pending_text = []
+        
+        def flush():
+            if pending_text:
+                chunks.append(DocumentChunk(
+                    text="\n\n".join(pending_text),
+                    page_start=pending_pages[0],
+                    page_end=pending_pages[-1]
+                ))
+                pending_pages.clear()
+                pending_text.clear()
+        
+        for page_number, page_text in DocumentPreprocessor.split_pages(full_text):
+            if not page_text:
+                continue
+            
+            if len(page_text) > self.chunk_size:
+                flush()
+                for piece in self.text_splitter.split_text(page_text):
+                    chunks.append(DocumentChunk(
+                        text=piece,
+                        page_start=page_number,
+                        page_end=page_number
+                    ))
+                continue
+            
+            packed_length = sum(len(t) + 2 for t in pending_text) + len(page_text)
+            if pending_text and packed_length > self.chunk_size:
+                flush()
+            
+            pending_pages.append(page_number)
+            pending_text.append(page_text)
+        
+        flush()
+        return chunks
+    
+    def chunk_table(self, table: TableData) -> List[DocumentChunk]:
+        """Render a table as text, one chunk per table (row groups for very large tables)."""
+        title = f"Table (page {table.page_number})"
+        header_line = " | ".join(str(h or "") for h in table.headers)
+        row_lines = [" | ".join(str(cell or "") for cell in row) for row in table.rows]
+        
+        chunks = []
+        group = []
+        group_length = len(title) + len(header_line) + 2
+        
+        for line in row_lines:
+            if group and group_length + len(line) + 1 > self.chunk_size:
+                chunks.append(self._table_chunk(title, header_line, group, table.page_number))
+                group = []
+                group_length = len(title) + len(header_line) + 2
+            group.append(line)
+            group_length += len(line) + 1
+        
+        if group or not chunks:
+            chunks.append(self._table_chunk(title, header_line, group, table.page_number))
+        
+        return chunks
+    
+    @staticmethod
+    def _table_chunk(title: str, header_line: str, rows: List[str], page_number: int) -> DocumentChunk:
+        """Build a table chunk; headers are repeated in every row group."""
+        return DocumentChunk(
+            text="\n".join([title, header_line] + rows),
+            chunk_type="table",
+            page_start=page_number,
+            page_end=page_number
+        )
@@ -0,0 +1,179 @@
+"""
+Pluggable text embedding backends for the vector store.
+"""
+import hashlib
+import logging
+import re
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import numpy as np
+from langchain_openai import OpenAIEmbeddings
+
+from src.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# The single collection used before collections were split per model; it holds
+# vectors of the default OpenAI model, so that backend keeps reading and writing it
+LEGACY_COLLECTION_NAME = "financial_documents"
+LEGACY_EMBEDDING_MODEL = "text-embedding-3-small"
+
+
+class EmbeddingBackend(ABC):
+    """Interface for text embedding backends."""
+    
+    name: str = "base"
+    model_name: str = ""
+    
+    @property
+    @abstractmethod
+    def dimension(self) -> int:
+        """Size of the vectors produced by this backend."""
+    
+    @abstractmethod
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts."""
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a single query text."""
+        return self.embed_documents([text])[0]
+    
+    @property
+    def collection_name(self) -> str:
+        """Vector collection name, unique per model and dimension so vectors never mix."""
+        slug = re.sub(r"[^a-zA-Z0-9]+", "-", self.model_name or self.name).strip("-")[:32]
+        return f"financial_documents_{self.name}_{slug}_{self.dimension}"
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """Embeddings from the OpenAI API."""
+    
+    name = "openai"
+    
+    KNOWN_DIMENSIONS = {
+        "text-embedding-3-small": 1536,
+        "text-embedding-3-large": 3072,
+        "text-embedding-ada-002": 1536,
+    }
+    
+    def __init__(self, model_name: Optional[str] = None):
+        """Initialize OpenAI embedding client."""
+        self.model_name = model_name or settings.embedding_model
+        self.client = OpenAIEmbeddings(
+            model=self.model_name,
+            openai_api_key=settings.openai_api_key
+        )
+    
+    @property
+    def dimension(self) -> int:
+        return self.KNOWN_DIMENSIONS.get(self.model_name, 1536)
+    
+    @property
+    def collection_name(self) -> str:
+        if self.model_name == LEGACY_EMBEDDING_MODEL:
+            return LEGACY_COLLECTION_NAME
+        return super().collection_name
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.embed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.embed_query(text)
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """Local sentence-transformers model, batched on CPU with a thread cap."""
+    
+    name = "local"
+    
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        num_threads: Optional[int] = None
+    ):
+        """Load the model from a local path or model hub name."""
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "sentence-transformers is required for the local embedding backend"
+            ) from e
+        
+        self.model_name = model_path or settings.embedding_model_path
+        self.batch_size = batch_size or settings.embedding_batch_size
+        self.num_threads = num_threads or settings.embedding_num_threads
+        
+        # Cap intra-op threads so embedding doesn't starve OCR and request handling
+        torch.set_num_threads(self.num_threads)
+        
+        self.model = SentenceTransformer(self.model_name, device="cpu")
+        self._dimension = self.model.get_sentence_embedding_dimension()
+        self._lock = threading.Lock()
+        
+        logger.info(
+            f"Loaded local embedding model {self.model_name} "
+            f"(dim={self._dimension}, threads={self.num_threads})"
+        )
+    
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Serialize calls so concurrent requests share the thread cap instead of multiplying it
+        with self._lock:
+            vectors = self.model.encode(
+                texts,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+        return vectors.tolist()
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """Deterministic feature-hashing embedder with no model or network (for tests)."""
+    
+    name = "hashing"
+    
+    def __init__(self, dimension: int = 256):
+        """Initialize hashing embedder."""
+        self.model_name = f"hashing-{dimension}"
+        self._dimension = dimension
+    
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self._dimension), dtype=np.float32)
+        
+        for row, text in enumerate(texts):
+            for token in re.findall(r"\w+", text.lower()):
+                digest = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+                sign = 1.0 if digest >> 63 else -1.0
+                vectors[row, digest % self._dimension] += sign
+        
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).tolist()
+
+
+def get_embedding_backend(backend: Optional[str] = None) -> EmbeddingBackend:
+    """Create the configured embedding backend (openai, local or hashing)."""
+    name = (backend or settings.embedding_backend).lower()
+    
+    if name == "openai":
+        return OpenAIEmbeddingBackend()
+    elif name in ("local", "sentence_transformers"):
+        return SentenceTransformerBackend()
+    elif name == "hashing":
+        return HashingEmbeddingBackend()
+    else:
+        raise ValueError(f"Unknown embedding backend: {name}")
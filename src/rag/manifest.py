@@ -0,0 +1,148 @@
+"""
+Per-document chunk manifest kept alongside the vector index.
+
+Records which chunk ids (and content hashes) each document has in the
+collection, so re-ingestion can diff instead of re-embedding and deletes
+can target known ids instead of scanning collection metadata. It also holds
+the corpus version, so every worker process sharing the index sees the same
+value.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkManifest:
+    """SQLite-backed manifest of indexed chunks per document."""
+    
+    def __init__(self, path: str = ":memory:"):
+        """Open (or create) manifest database."""
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS manifest_documents (
+                document_id TEXT PRIMARY KEY,
+                document_type TEXT,
+                uploader TEXT,
+                upload_timestamp TEXT
+            );
+            CREATE INDEX IF NOT EXISTS ix_manifest_uploader ON manifest_documents (uploader);
+            CREATE INDEX IF NOT EXISTS ix_manifest_uploaded ON manifest_documents (upload_timestamp);
+            CREATE TABLE IF NOT EXISTS manifest_chunks (
+                chunk_id TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_manifest_chunks_document ON manifest_chunks (document_id);
+            CREATE TABLE IF NOT EXISTS manifest_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO manifest_meta VALUES ('version', 0);
+        """)
+        self._conn.commit()
+    
+    def get_chunks(self, document_id: str) -> Optional[Dict[str, str]]:
+        """Get {chunk_id: content_hash} for a document, or None if not indexed."""
+        with self._lock:
+            known = self._conn.execute(
+                "SELECT 1 FROM manifest_documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+            if not known:
+                return None
+            
+            rows = self._conn.execute(
+                "SELECT chunk_id, content_hash FROM manifest_chunks WHERE document_id = ?",
+                (document_id,)
+            ).fetchall()
+            return dict(rows)
+    
+    def put(
+        self,
+        document_id: str,
+        chunks: Dict[str, str],
+        document_type: str,
+        uploader: str,
+        upload_timestamp: datetime
+    ) -> None:
+        """Replace the manifest entry for a document."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO manifest_documents VALUES (?, ?, ?, ?)",
+                (document_id, document_type, uploader, upload_timestamp.isoformat())
+            )
+            self._conn.execute("DELETE FROM manifest_chunks WHERE document_id = ?", (document_id,))
+            self._conn.executemany(
+                "INSERT INTO manifest_chunks VALUES (?, ?, ?)",
+                [(chunk_id, document_id, content_hash) for chunk_id, content_hash in chunks.items()]
+            )
+    
+    def remove(self, document_id: str) -> Optional[List[str]]:
+        """Remove a document and return its chunk ids, or None if not indexed."""
+        chunks = self.get_chunks(document_id)
+        if chunks is None:
+            return None
+        
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM manifest_chunks WHERE document_id = ?", (document_id,))
+            self._conn.execute("DELETE FROM manifest_documents WHERE document_id = ?", (document_id,))
+        
+        return list(chunks)
+    
+    def find_documents(
+        self,
+        uploader: Optional[str] = None,
+        document_type: Optional[str] = None,
+        uploaded_before: Optional[datetime] = None,
+        uploaded_after: Optional[datetime] = None
+    ) -> List[str]:
+        """Find indexed document ids matching all given filters."""
+        clauses = []
+        params = []
+        
+        if uploader is not None:
+            clauses.append("uploader = ?")
+            params.append(uploader)
+        if document_type is not None:
+            clauses.append("document_type = ?")
+            params.append(document_type)
+        if uploaded_before is not None:
+            clauses.append("upload_timestamp < ?")
+            params.append(uploaded_before.isoformat())
+        if uploaded_after is not None:
+            clauses.append("upload_timestamp >= ?")
+            params.append(uploaded_after.isoformat())
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT document_id FROM manifest_documents {where}", params
+            ).fetchall()
+        return [row[0] for row in rows]
+    
+    def version(self) -> int:
+        """Current corpus version."""
+        with self._lock:
+            return self._conn.execute("SELECT value FROM manifest_meta WHERE key = 'version'").fetchone()[0]
+    
+    def bump_version(self) -> int:
+        """Increment the corpus version (atomically across processes) and return it."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE manifest_meta SET value = value + 1 WHERE key = 'version'")
+            return self._conn.execute("SELECT value FROM manifest_meta WHERE key = 'version'").fetchone()[0]
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM manifest_documents").fetchone()[0]
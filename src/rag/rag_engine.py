@@ -1,14 +1,17 @@
 """
 Vector database and RAG (Retrieval Augmented Generation) system.
 """
+import hashlib
 import logging
-from typing import Dict, List, Optional, Any
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 import uuid
 
 import chromadb
 from chromadb.config import Settings as ChromaSettings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 
 from src.models.schemas import (
@@ -16,6 +19,14 @@ from src.models.schemas import (
     Insight, InsightType
 )
 from src.config import get_settings
+from src.rag.chunking import LayoutChunker
+from src.rag.embeddings import (
+    LEGACY_COLLECTION_NAME, LEGACY_EMBEDDING_MODEL, EmbeddingBackend, get_embedding_backend
+)
+from src.rag.manifest import ChunkManifest
+from src.utils.cache import TTLCache
+from src.utils.helpers import chunks_indexed, texts_embedded, timed_operation, timed_stage
+from src.utils.llm_usage import usage_config
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -24,83 +35,188 @@ settings = get_settings()
 class VectorStore:
     """Vector database wrapper using ChromaDB."""
     
-    def __init__(self, persist_directory: Optional[str] = None):
+    def __init__(
+        self,
+        persist_directory: Optional[str] = None,
+        embedding_backend: Optional[EmbeddingBackend] = None
+    ):
         """Initialize vector store."""
         persist_dir = persist_directory or settings.vector_db_path
         
-        self.client = chromadb.Client(
-            ChromaSettings(
-                persist_directory=persist_dir,
-                anonymized_telemetry=False
+        if settings.chroma_host:
+            # Shared Chroma server; required when several worker processes serve the API
+            self.client = chromadb.HttpClient(
+                host=settings.chroma_host,
+                port=settings.chroma_port,
+                settings=ChromaSettings(anonymized_telemetry=False)
+            )
+        else:
+            self.client = chromadb.PersistentClient(
+                path=persist_dir,
+                settings=ChromaSettings(anonymized_telemetry=False)
             )
-        )
         
-        # Create or get collection
+        self.embeddings = embedding_backend or get_embedding_backend()
+        
+        # Create or get collection; one per embedding model/dimension
         self.collection = self.client.get_or_create_collection(
-            name="financial_documents",
-            metadata={"hnsw:space": "cosine"}
+            name=self.embeddings.collection_name,
+            metadata={
+                "hnsw:space": "cosine",
+                "embedding_model": self.embeddings.model_name,
+                "embedding_dimension": self.embeddings.dimension,
+            }
         )
         
-        self.embeddings = OpenAIEmbeddings(
-            model=settings.embedding_model,
-            openai_api_key=settings.openai_api_key
+        self._check_legacy_collection()
+        
+        self.chunker = LayoutChunker()
+        
+        # Chunk ids and content hashes per document, persisted next to the collection
+        self.manifest = ChunkManifest(
+            os.path.join(persist_dir, f"{self.collection.name}.manifest.sqlite3")
         )
     
-    def add_document(self, extraction: DocumentExtraction) -> None:
-        """Add document extraction to vector store."""
+    def _check_legacy_collection(self) -> None:
+        """Warn when documents indexed before per-model collections are not searched."""
+        if self.collection.name == LEGACY_COLLECTION_NAME:
+            return
         try:
-            # Chunk the text
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                length_function=len
+            legacy = self.client.get_collection(LEGACY_COLLECTION_NAME)
+        except Exception:
+            return
+        
+        chunks = legacy.count()
+        if chunks:
+            logger.warning(
+                f"Collection '{LEGACY_COLLECTION_NAME}' holds {chunks} chunks indexed by an earlier version "
+                f"that collection '{self.collection.name}' does not search; re-upload those documents with "
+                f"force_reprocess=true, or use the OpenAI {LEGACY_EMBEDDING_MODEL} model to keep searching them"
             )
+    
+    @property
+    def version(self) -> int:
+        """Corpus version, bumped on every add/delete so dependent caches can invalidate."""
+        return self.manifest.version()
+    
+    def embed_query(self, query: str) -> List[float]:
+        """Generate embedding for a search query."""
+        texts_embedded.labels(kind="query").inc()
+        with timed_stage("query_embedding"):
+            return self.embeddings.embed_query(query)
+    
+    def add_document(self, extraction: DocumentExtraction) -> Dict[str, int]:
+        """
+        Add or re-index a document extraction in the vector store.
+        
+        Chunk ids are derived from content hashes, so on re-ingest only new or
+        changed chunks are embedded and added, and chunks that no longer exist
+        are deleted. Returns counts of added, removed and unchanged chunks;
+        indexing errors are logged, not raised, and return all-zero counts.
+        """
+        stats = {"added": 0, "removed": 0, "unchanged": 0}
+        
+        try:
+            document_id = extraction.document_id
             
-            chunks = text_splitter.split_text(extraction.raw_text)
+            # Chunk along page and table boundaries
+            chunks = {}
+            for chunk in self.chunker.chunk(extraction):
+                content_hash = hashlib.sha256(chunk.text.encode("utf-8")).hexdigest()
+                chunks.setdefault(f"{document_id}_{content_hash[:16]}", (chunk, content_hash))
             
-            # Generate embeddings
-            embeddings = self.embeddings.embed_documents(chunks)
+            # Diff against what is already indexed for this document
+            previous = self.manifest.get_chunks(document_id) or {}
+            new_ids = [chunk_id for chunk_id in chunks if chunk_id not in previous]
+            kept_ids = [chunk_id for chunk_id in chunks if chunk_id in previous]
+            stale_ids = [chunk_id for chunk_id in previous if chunk_id not in chunks]
             
             # Prepare metadata
             base_metadata = {
-                "document_id": extraction.document_id,
+                "document_id": document_id,
                 "document_type": extraction.document_type.value,
                 "filename": extraction.metadata.filename,
+                "uploader": extraction.metadata.uploader,
                 "upload_timestamp": extraction.metadata.upload_timestamp.isoformat(),
             }
             
-            # Add to ChromaDB
-            ids = [f"{extraction.document_id}_{i}" for i in range(len(chunks))]
-            metadatas = [base_metadata for _ in chunks]
-            
-            self.collection.add(
-                embeddings=embeddings,
-                documents=chunks,
-                metadatas=metadatas,
-                ids=ids
+            def chunk_metadata(chunk_id):
+                chunk = chunks[chunk_id][0]
+                return {
+                    **base_metadata,
+                    "chunk_type": chunk.chunk_type,
+                    "chunk_index": chunk.chunk_index,
+                    "page_start": chunk.page_start,
+                    "page_end": chunk.page_end,
+                }
+            
+            # Stale chunks go last, so a failure before then leaves the old version served
+            if new_ids:
+                # Only new or changed chunks are embedded
+                texts = [chunks[chunk_id][0].text for chunk_id in new_ids]
+                texts_embedded.labels(kind="document").inc(len(texts))
+                with timed_stage("embedding"):
+                    embeddings = self.embeddings.embed_documents(texts)
+                self.collection.add(
+                    embeddings=embeddings,
+                    documents=texts,
+                    metadatas=[chunk_metadata(chunk_id) for chunk_id in new_ids],
+                    ids=new_ids
+                )
+            
+            if kept_ids:
+                # Positions or document metadata may have changed; no re-embedding needed
+                self.collection.update(
+                    ids=kept_ids,
+                    metadatas=[chunk_metadata(chunk_id) for chunk_id in kept_ids]
+                )
+            
+            self.manifest.put(
+                document_id,
+                {chunk_id: content_hash for chunk_id, (_, content_hash) in chunks.items()},
+                document_type=extraction.document_type.value,
+                uploader=extraction.metadata.uploader,
+                upload_timestamp=extraction.metadata.upload_timestamp
             )
             
-            logger.info(f"Added {len(chunks)} chunks for document {extraction.document_id}")
+            if stale_ids:
+                self.collection.delete(ids=stale_ids)
+            
+            if new_ids or stale_ids:
+                self.manifest.bump_version()
+            
+            stats = {"added": len(new_ids), "removed": len(stale_ids), "unchanged": len(kept_ids)}
+            for outcome, count in stats.items():
+                chunks_indexed.labels(outcome=outcome).inc(count)
+            logger.info(
+                f"Indexed document {document_id}: {stats['added']} chunks added, "
+                f"{stats['removed']} removed, {stats['unchanged']} unchanged"
+            )
         except Exception as e:
             logger.error(f"Failed to add document to vector store: {e}")
+        
+        return stats
     
     def search(
         self, 
         query: str, 
         top_k: int = 5,
-        filter_metadata: Optional[Dict[str, Any]] = None
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """Search vector store for relevant documents."""
         try:
-            # Generate query embedding
-            query_embedding = self.embeddings.embed_query(query)
+            # Generate query embedding unless the caller already has one
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
             
             # Search
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k,
-                where=filter_metadata
-            )
+            with timed_stage("vector_search"):
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=top_k,
+                    where=filter_metadata
+                )
             
             # Format results
             formatted_results = []
@@ -119,17 +235,56 @@ class VectorStore:
     
     def delete_document(self, document_id: str) -> None:
         """Delete document from vector store."""
+        self.delete_documents([document_id])
+    
+    def delete_documents(self, document_ids: List[str]) -> int:
+        """Delete documents from vector store; returns the number of chunks deleted."""
         try:
-            # Find all chunks for this document
-            results = self.collection.get(
-                where={"document_id": document_id}
-            )
-            
-            if results['ids']:
-                self.collection.delete(ids=results['ids'])
-                logger.info(f"Deleted {len(results['ids'])} chunks for document {document_id}")
+            chunk_ids = []
+            unindexed = []
+            for document_id in document_ids:
+                chunks = self.manifest.remove(document_id)
+                if chunks is None:
+                    unindexed.append(document_id)
+                else:
+                    chunk_ids.extend(chunks)
+            
+            # Not in the manifest (indexed before it existed); fall back to a metadata scan
+            for start in range(0, len(unindexed), 500):
+                chunk_ids.extend(
+                    self.collection.get(where={"document_id": {"$in": unindexed[start:start + 500]}})['ids']
+                )
+            
+            if chunk_ids:
+                self.collection.delete(ids=chunk_ids)
+                self.manifest.bump_version()
+                logger.info(f"Deleted {len(chunk_ids)} chunks for {len(document_ids)} documents")
+            return len(chunk_ids)
         except Exception as e:
-            logger.error(f"Failed to delete document from vector store: {e}")
+            logger.error(f"Failed to delete documents from vector store: {e}")
+            return 0
+    
+    def purge(
+        self,
+        uploader: Optional[str] = None,
+        document_type: Optional[str] = None,
+        uploaded_before: Optional[datetime] = None,
+        uploaded_after: Optional[datetime] = None
+    ) -> List[str]:
+        """Delete all indexed documents matching the given filters; returns their document ids."""
+        if uploader is None and document_type is None and uploaded_before is None and uploaded_after is None:
+            raise ValueError("At least one purge filter is required")
+        
+        document_ids = self.manifest.find_documents(
+            uploader=uploader,
+            document_type=document_type,
+            uploaded_before=uploaded_before,
+            uploaded_after=uploaded_after
+        )
+        deleted = self.delete_documents(document_ids)
+        
+        logger.info(f"Purged {len(document_ids)} documents ({deleted} chunks) from vector store")
+        return document_ids
 
 
 class RAGEngine:
@@ -143,63 +298,122 @@ class RAGEngine:
             temperature=0.7,
             openai_api_key=settings.openai_api_key
         )
+        
+        # Two-level query cache: query text -> embedding, normalized request -> response
+        self.embedding_cache = TTLCache(
+            "query_embedding",
+            max_entries=settings.query_cache_max_entries,
+            ttl_seconds=settings.query_cache_ttl_seconds
+        )
+        self.response_cache = TTLCache(
+            "query_response",
+            max_entries=settings.query_cache_max_entries,
+            ttl_seconds=settings.query_cache_ttl_seconds
+        )
+        
+        # Runs insight generation alongside answer generation
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.rag_generation_workers,
+            thread_name_prefix="rag-generation"
+        )
     
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Normalize query text for cache lookups (case and whitespace)."""
+        return " ".join(query.lower().split())
+    
+    def _response_cache_key(self, request: QueryRequest) -> tuple:
+        """Build response cache key from query, filters, top_k and corpus version."""
+        # The version is read from the manifest shared by all workers, so ingests
+        # in other worker processes invalidate this process's cached responses
+        return (
+            self.normalize_query(request.query),
+            tuple(sorted(request.document_ids)) if request.document_ids else None,
+            tuple(sorted(t.value for t in request.document_types)) if request.document_types else None,
+            request.date_range_start.isoformat() if request.date_range_start else None,
+            request.date_range_end.isoformat() if request.date_range_end else None,
+            request.top_k,
+            self.vector_store.manifest.version(),
+        )
+    
+    def get_query_embedding(self, query: str) -> List[float]:
+        """Get the embedding of the query as written, reusing a cached one for repeated queries."""
+        embedding = self.embedding_cache.get(query)
+        if embedding is None:
+            embedding = self.vector_store.embed_query(query)
+            self.embedding_cache.set(query, embedding)
+        return embedding
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Get hit statistics for both query cache levels."""
+        return {
+            "embedding": self.embedding_cache.stats(),
+            "response": self.response_cache.stats(),
+            "corpus_version": self.vector_store.manifest.version(),
+        }
+    
+    def _retrieve(self, request: QueryRequest) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], str]:
+        """Search vector store and build sources and context for a query."""
+        # Build filter metadata
+        filter_metadata = {}
+        if request.document_ids:
+            # ChromaDB doesn't support 'in' operator directly, so we'll filter manually
+            pass
+        
+        # Search vector store
+        search_results = self.vector_store.search(
+            query=request.query,
+            top_k=request.top_k,
+            filter_metadata=filter_metadata if filter_metadata else None,
+            query_embedding=self.get_query_embedding(request.query)
+        )
+        
+        # Build context from search results
+        context_parts = []
+        sources = []
+        
+        for result in search_results:
+            context_parts.append(result['document'])
+            sources.append({
+                "document_id": result['metadata']['document_id'],
+                "filename": result['metadata']['filename'],
+                "excerpt": result['document'][:200] + "...",
+                "page_start": result['metadata'].get('page_start'),
+                "page_end": result['metadata'].get('page_end'),
+                "relevance_score": 1.0 - result['distance'] if result['distance'] else 0.9
+            })
+        
+        context = "\n\n".join(context_parts)
+        return search_results, sources, context
+    
+    @timed_operation("rag_query")
     def query(self, request: QueryRequest) -> QueryResponse:
         """Process query and generate response with RAG."""
+        cache_key = self._response_cache_key(request)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Serving query from response cache")
+            return cached
+        
         try:
-            # Build filter metadata
-            filter_metadata = {}
-            if request.document_ids:
-                # ChromaDB doesn't support 'in' operator directly, so we'll filter manually
-                pass
-            
-            # Search vector store
-            search_results = self.vector_store.search(
-                query=request.query,
-                top_k=request.top_k,
-                filter_metadata=filter_metadata if filter_metadata else None
-            )
-            
-            # Build context from search results
-            context_parts = []
-            sources = []
-            
-            for result in search_results:
-                context_parts.append(result['document'])
-                sources.append({
-                    "document_id": result['metadata']['document_id'],
-                    "filename": result['metadata']['filename'],
-                    "excerpt": result['document'][:200] + "...",
-                    "relevance_score": 1.0 - result['distance'] if result['distance'] else 0.9
-                })
-            
-            context = "\n\n".join(context_parts)
-            
-            # Generate answer using LLM
-            answer_prompt = ChatPromptTemplate.from_template("""
-            You are a financial document analysis assistant. Answer the user's question based on the provided context from financial documents.
-            
-            Context:
-            {context}
+            search_results, sources, context = self._retrieve(request)
             
-            Question: {question}
-            
-            Provide a detailed, accurate answer based on the context. If the context doesn't contain enough information to answer fully, state what information is available and what is missing.
-            """)
-            
-            chain = answer_prompt | self.llm
-            response = chain.invoke({"context": context, "question": request.query})
-            answer = response.content
-            
-            # Generate insights
-            insights = self.generate_insights(request.query, search_results)
+            # Answer and insights are independent LLM calls over the same results
+            insights_future = self._executor.submit(
+                self.generate_insights, request.query, search_results
+            )
+            answer = self._generate_answer(context, request.query)
+            insights = insights_future.result()
             
-            return QueryResponse(
+            response = QueryResponse(
                 answer=answer,
                 confidence=0.85,  # Could be calculated based on search scores
                 sources=sources,
                 insights=insights
             )
+            self.response_cache.set(cache_key, response)
+            
+            return response
         except Exception as e:
             logger.error(f"RAG query failed: {e}")
             return QueryResponse(
@@ -209,6 +423,85 @@ class RAGEngine:
                 insights=[]
             )
     
+    def stream_query(self, request: QueryRequest) -> Iterator[Tuple[str, Any]]:
+        """
+        Process query and stream the answer as it is generated.
+        
+        Yields (event, data) pairs: "sources" once, "token" per answer chunk,
+        "insights" once, then "done" with the complete QueryResponse
+        (or "error" if the query fails).
+        """
+        cache_key = self._response_cache_key(request)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Serving streamed query from response cache")
+            yield "sources", cached.sources
+            yield "token", cached.answer
+            yield "insights", cached.insights
+            yield "done", cached
+            return
+        
+        try:
+            search_results, sources, context = self._retrieve(request)
+            yield "sources", sources
+            
+            insights_future = self._executor.submit(
+                self.generate_insights, request.query, search_results
+            )
+            
+            answer_parts = []
+            for token in self._stream_answer(context, request.query):
+                answer_parts.append(token)
+                yield "token", token
+            
+            insights = insights_future.result()
+            yield "insights", insights
+            
+            response = QueryResponse(
+                answer="".join(answer_parts),
+                confidence=0.85,
+                sources=sources,
+                insights=insights
+            )
+            self.response_cache.set(cache_key, response)
+            
+            yield "done", response
+        except Exception as e:
+            logger.error(f"Streaming RAG query failed: {e}")
+            yield "error", {"detail": str(e)}
+    
+    def _answer_chain(self):
+        """Build prompt | LLM chain for answering questions from context."""
+        answer_prompt = ChatPromptTemplate.from_template("""
+        You are a financial document analysis assistant. Answer the user's question based on the provided context from financial documents.
+        
+        Context:
+        {context}
+        
+        Question: {question}
+        
+        Provide a detailed, accurate answer based on the context. If the context doesn't contain enough information to answer fully, state what information is available and what is missing.
+        """)
+        
+        return answer_prompt | self.llm
+    
+    def _generate_answer(self, context: str, question: str) -> str:
+        """Generate an answer to the question from retrieved context."""
+        with timed_stage("answer_generation"):
+            response = self._answer_chain().invoke(
+                {"context": context, "question": question}, config=usage_config("answer")
+            )
+        return response.content
+    
+    def _stream_answer(self, context: str, question: str) -> Iterator[str]:
+        """Stream answer tokens for the question from retrieved context."""
+        chunks = self._answer_chain().stream(
+            {"context": context, "question": question}, config=usage_config("answer")
+        )
+        for chunk in chunks:
+            if chunk.content:
+                yield chunk.content
+    
     def generate_insights(self, query: str, search_results: List[Dict]) -> List[Insight]:
         """Generate insights from search results."""
         try:
@@ -240,7 +533,8 @@ class RAGEngine:
             """)
             
             chain = insight_prompt | self.llm
-            response = chain.invoke({"query": query, "context": context})
+            with timed_stage("insight_generation"):
+                response = chain.invoke({"query": query, "context": context}, config=usage_config("insights"))
             
             # Parse insights (simplified - in production, use proper JSON parsing)
             insights = []
@@ -283,7 +577,7 @@ class RAGEngine:
             response = chain.invoke({
                 "doc_type": extraction.document_type.value,
                 "text": extraction.raw_text[:2000]
-            })
+            }, config=usage_config("summary"))
             
             return response.content
         except Exception as e:
@@ -0,0 +1,14 @@
+# Storage package
+from src.storage.repository import (
+    DocumentRepository,
+    FeatureRow,
+    SQLDocumentRepository,
+    SerializedDocument,
+)
+
+__all__ = [
+    "DocumentRepository",
+    "FeatureRow",
+    "SQLDocumentRepository",
+    "SerializedDocument",
+]
@@ -0,0 +1,494 @@
+"""
+Persistent document repository.
+
+Extractions are stored as one row of indexed summary columns (type, upload
+time, vendor, total, content hash) plus a separate compressed JSON blob, so
+filtering and listing never load OCR payloads. The blob is the exact JSON
+the API returns, so reads can serve it without re-serializing, and its
+digest doubles as the document's ETag. A bounded LRU keeps hot documents in
+process. Every save and delete is appended to a change log so per-process
+derived state (such as the anomaly feature store) can catch up incrementally.
+"""
+import gzip
+import hashlib
+import logging
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import (
+    Column, DateTime, Float, ForeignKey, Integer, LargeBinary, String,
+    create_engine, delete, event, func, select
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from src.models.schemas import (
+    BankStatementExtraction, DocumentExtraction, DocumentType,
+    ExtractedEntity, InvoiceExtraction
+)
+from src.utils.cache import TTLCache
+from src.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+Base = declarative_base()
+
+
+class DocumentRecord(Base):
+    """Indexed summary columns for a document."""
+    __tablename__ = "documents"
+    
+    document_id = Column(String(64), primary_key=True)
+    document_type = Column(String(32), nullable=False, index=True)
+    filename = Column(String(512), nullable=False)
+    uploader = Column(String(255), index=True)
+    upload_timestamp = Column(DateTime, index=True)
+    vendor_name = Column(String(255), index=True)
+    total_amount = Column(Float, index=True)
+    currency = Column(String(8))
+    content_hash = Column(String(64), index=True)
+    extraction_timestamp = Column(DateTime)
+    processing_time_seconds = Column(Float)
+    etag = Column(String(32))  # Digest of the serialized extraction
+    # Anomaly features, so they can be read without loading the blob
+    text_length = Column(Integer)
+    num_tables = Column(Integer)
+    num_entities = Column(Integer)
+    avg_confidence = Column(Float)
+
+
+class DocumentBlob(Base):
+    """Full extraction payload, gzip-compressed JSON."""
+    __tablename__ = "document_blobs"
+    
+    document_id = Column(
+        String(64), ForeignKey("documents.document_id", ondelete="CASCADE"), primary_key=True
+    )
+    payload = Column(LargeBinary, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+
+
+class DocumentChangeRecord(Base):
+    """Append-only log of saves and deletes, in commit order."""
+    __tablename__ = "document_changes"
+    
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    document_id = Column(String(64), nullable=False, index=True)
+    operation = Column(String(8), nullable=False)  # save | delete
+    changed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SerializedDocument(NamedTuple):
+    """Pre-serialized extraction as stored."""
+    etag: str
+    body: bytes  # gzip-compressed JSON
+
+
+class FeatureRow(NamedTuple):
+    """Current summary and anomaly features of a document; deleted rows carry only the id."""
+    document_id: str
+    deleted: bool = False
+    document_type: Optional[str] = None
+    vendor_name: Optional[str] = None
+    currency: Optional[str] = None
+    upload_timestamp: Optional[datetime] = None
+    processing_time: Optional[float] = None
+    text_length: Optional[int] = None
+    num_tables: Optional[int] = None
+    num_entities: Optional[int] = None
+    avg_confidence: Optional[float] = None
+    total_amount: Optional[float] = None
+
+
+class DocumentRepository(ABC):
+    """Storage interface for processed document extractions."""
+    
+    @abstractmethod
+    def save(self, extraction: DocumentExtraction) -> None:
+        """Insert or replace a document."""
+    
+    @abstractmethod
+    def get(self, document_id: str) -> Optional[DocumentExtraction]:
+        """Get a document by id."""
+    
+    @abstractmethod
+    def get_etag(self, document_id: str) -> Optional[str]:
+        """Get the current ETag of a document without loading it."""
+    
+    @abstractmethod
+    def get_serialized(self, document_id: str) -> Optional[SerializedDocument]:
+        """Get the stored JSON of a document as-is, without decoding it."""
+    
+    @abstractmethod
+    def exists(self, document_id: str) -> bool:
+        """Check whether a document is stored."""
+    
+    @abstractmethod
+    def delete(self, document_id: str) -> bool:
+        """Delete a document; returns False if it was not stored."""
+    
+    @abstractmethod
+    def list(
+        self,
+        document_ids: Optional[Iterable[str]] = None,
+        document_type: Optional[str] = None,
+        vendor_name: Optional[str] = None,
+        uploaded_after: Optional[datetime] = None,
+        uploaded_before: Optional[datetime] = None,
+        limit: Optional[int] = None
+    ) -> List[DocumentExtraction]:
+        """List documents matching all given filters, oldest upload first."""
+    
+    @abstractmethod
+    def find_ids(
+        self,
+        uploader: Optional[str] = None,
+        document_type: Optional[str] = None,
+        uploaded_before: Optional[datetime] = None,
+        uploaded_after: Optional[datetime] = None
+    ) -> List[str]:
+        """Ids of documents matching all given filters, without loading them."""
+    
+    @abstractmethod
+    def find_by_content_hash(self, content_hash: str) -> Optional[str]:
+        """Get the id of a stored document with identical file content."""
+    
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored documents."""
+    
+    @abstractmethod
+    def changes_since(self, seq: int) -> Tuple[int, List[FeatureRow]]:
+        """
+        Feature rows of documents saved or deleted after change seq.
+        
+        Returns the latest change seq and the current state of each affected
+        document; seq 0 returns every stored document.
+        """
+
+
+class SQLDocumentRepository(DocumentRepository):
+    """SQLAlchemy repository (SQLite locally, PostgreSQL in production)."""
+    
+    def __init__(self, database_url: Optional[str] = None, cache_size: Optional[int] = None):
+        """Connect and create tables if needed."""
+        self.database_url = database_url or settings.database_url
+        url = make_url(self.database_url)
+        
+        engine_args = {}
+        if url.get_backend_name() == "sqlite":
+            engine_args["connect_args"] = {"check_same_thread": False}
+            if url.database and url.database != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+        
+        self.engine = create_engine(self.database_url, **engine_args)
+        
+        if url.get_backend_name() == "sqlite":
+            event.listen(self.engine, "connect", _configure_sqlite)
+        
+        Base.metadata.create_all(self.engine)
+        self._session = sessionmaker(bind=self.engine, expire_on_commit=False)
+        # Caches are per process; the TTL bounds how long another worker's write can go unseen
+        cache_ttl = settings.document_cache_ttl_seconds or None
+        self.cache = TTLCache(
+            "documents", max_entries=cache_size or settings.document_cache_size, ttl_seconds=cache_ttl
+        )
+        self.serialized_cache = TTLCache(
+            "document_payloads", max_entries=cache_size or settings.document_cache_size, ttl_seconds=cache_ttl
+        )
+        
+        logger.info(f"Document repository ready ({url.get_backend_name()})")
+    
+    def save(self, extraction: DocumentExtraction) -> None:
+        body = extraction.model_dump_json().encode("utf-8")
+        payload = gzip.compress(body, compresslevel=6)
+        etag = _etag(body)
+        vendor_name, total_amount, currency = _summary_fields(extraction.structured_data)
+        text_length, num_tables, num_entities, avg_confidence = _feature_fields(extraction)
+        metadata = extraction.metadata
+        
+        with self._session.begin() as session:
+            session.merge(DocumentRecord(
+                document_id=extraction.document_id,
+                document_type=extraction.document_type.value,
+                filename=metadata.filename,
+                uploader=metadata.uploader,
+                upload_timestamp=metadata.upload_timestamp,
+                vendor_name=vendor_name,
+                total_amount=total_amount,
+                currency=currency,
+                content_hash=metadata.content_hash,
+                extraction_timestamp=extraction.extraction_timestamp,
+                processing_time_seconds=extraction.processing_time_seconds,
+                etag=etag,
+                text_length=text_length,
+                num_tables=num_tables,
+                num_entities=num_entities,
+                avg_confidence=avg_confidence
+            ))
+            session.merge(DocumentBlob(
+                document_id=extraction.document_id,
+                payload=payload,
+                size_bytes=len(payload)
+            ))
+            session.add(DocumentChangeRecord(document_id=extraction.document_id, operation="save"))
+        
+        self.cache.set(extraction.document_id, extraction)
+        self.serialized_cache.set(extraction.document_id, SerializedDocument(etag, payload))
+    
+    def get(self, document_id: str) -> Optional[DocumentExtraction]:
+        cached = self.cache.get(document_id)
+        if cached is not None:
+            return cached
+        
+        with self._session() as session:
+            payload = session.scalar(
+                select(DocumentBlob.payload).where(DocumentBlob.document_id == document_id)
+            )
+        
+        if payload is None:
+            return None
+        
+        extraction = _load(payload)
+        self.cache.set(document_id, extraction)
+        return extraction
+    
+    def get_etag(self, document_id: str) -> Optional[str]:
+        cached = self.serialized_cache.get(document_id)
+        if cached is not None:
+            return cached.etag
+        
+        with self._session() as session:
+            etag = session.scalar(
+                select(DocumentRecord.etag).where(DocumentRecord.document_id == document_id)
+            )
+        
+        # Rows written before ETags were stored get one computed from the blob
+        if etag is None and self.exists(document_id):
+            serialized = self.get_serialized(document_id)
+            return serialized.etag if serialized else None
+        return etag
+    
+    def get_serialized(self, document_id: str) -> Optional[SerializedDocument]:
+        cached = self.serialized_cache.get(document_id)
+        if cached is not None:
+            return cached
+        
+        with self._session() as session:
+            row = session.execute(
+                select(DocumentBlob.payload, DocumentRecord.etag)
+                .join(DocumentRecord, DocumentRecord.document_id == DocumentBlob.document_id)
+                .where(DocumentBlob.document_id == document_id)
+            ).first()
+        
+        if row is None:
+            return None
+        
+        payload, etag = row
+        serialized = SerializedDocument(etag or _etag(gzip.decompress(payload)), payload)
+        self.serialized_cache.set(document_id, serialized)
+        return serialized
+    
+    def exists(self, document_id: str) -> bool:
+        if document_id in self.cache:
+            return True
+        
+        with self._session() as session:
+            return session.get(DocumentRecord, document_id) is not None
+    
+    def delete(self, document_id: str) -> bool:
+        return self.delete_many([document_id]) > 0
+    
+    def delete_many(self, document_ids: Iterable[str]) -> int:
+        """Delete documents by id; returns how many were stored."""
+        document_ids = list(document_ids)
+        if not document_ids:
+            return 0
+        
+        for document_id in document_ids:
+            self.cache.pop(document_id)
+            self.serialized_cache.pop(document_id)
+        
+        with self._session.begin() as session:
+            session.execute(delete(DocumentBlob).where(DocumentBlob.document_id.in_(document_ids)))
+            result = session.execute(delete(DocumentRecord).where(DocumentRecord.document_id.in_(document_ids)))
+            if result.rowcount:
+                session.add_all([
+                    DocumentChangeRecord(document_id=document_id, operation="delete")
+                    for document_id in document_ids
+                ])
+            return result.rowcount
+    
+    def list(
+        self,
+        document_ids: Optional[Iterable[str]] = None,
+        document_type: Optional[str] = None,
+        vendor_name: Optional[str] = None,
+        uploaded_after: Optional[datetime] = None,
+        uploaded_before: Optional[datetime] = None,
+        limit: Optional[int] = None
+    ) -> List[DocumentExtraction]:
+        query = select(DocumentRecord.document_id).order_by(DocumentRecord.upload_timestamp)
+        
+        if document_ids is not None:
+            query = query.where(DocumentRecord.document_id.in_(list(document_ids)))
+        if document_type is not None:
+            query = query.where(DocumentRecord.document_type == document_type)
+        if vendor_name is not None:
+            query = query.where(DocumentRecord.vendor_name == vendor_name)
+        if uploaded_after is not None:
+            query = query.where(DocumentRecord.upload_timestamp >= uploaded_after)
+        if uploaded_before is not None:
+            query = query.where(DocumentRecord.upload_timestamp < uploaded_before)
+        if limit is not None:
+            query = query.limit(limit)
+        
+        with self._session() as session:
+            ids = session.scalars(query).all()
+        
+        # Serve hot documents from the LRU; load the rest in one query
+        found = {doc_id: self.cache.get(doc_id) for doc_id in ids}
+        missing = [doc_id for doc_id, extraction in found.items() if extraction is None]
+        
+        if missing:
+            with self._session() as session:
+                rows = session.execute(
+                    select(DocumentBlob.document_id, DocumentBlob.payload)
+                    .where(DocumentBlob.document_id.in_(missing))
+                ).all()
+            for doc_id, payload in rows:
+                found[doc_id] = _load(payload)
+        
+        return [found[doc_id] for doc_id in ids if found[doc_id] is not None]
+    
+    def find_ids(
+        self,
+        uploader: Optional[str] = None,
+        document_type: Optional[str] = None,
+        uploaded_before: Optional[datetime] = None,
+        uploaded_after: Optional[datetime] = None
+    ) -> List[str]:
+        query = select(DocumentRecord.document_id).order_by(DocumentRecord.upload_timestamp)
+        
+        if uploader is not None:
+            query = query.where(DocumentRecord.uploader == uploader)
+        if document_type is not None:
+            query = query.where(DocumentRecord.document_type == document_type)
+        if uploaded_before is not None:
+            query = query.where(DocumentRecord.upload_timestamp < uploaded_before)
+        if uploaded_after is not None:
+            query = query.where(DocumentRecord.upload_timestamp >= uploaded_after)
+        
+        with self._session() as session:
+            return list(session.scalars(query).all())
+    
+    def find_by_content_hash(self, content_hash: str) -> Optional[str]:
+        with self._session() as session:
+            return session.scalar(
+                select(DocumentRecord.document_id)
+                .where(DocumentRecord.content_hash == content_hash)
+                .order_by(DocumentRecord.upload_timestamp.desc())
+                .limit(1)
+            )
+    
+    def count(self) -> int:
+        with self._session() as session:
+            return session.scalar(select(func.count()).select_from(DocumentRecord))
+    
+    def changes_since(self, seq: int) -> Tuple[int, List[FeatureRow]]:
+        with self._session() as session:
+            # Read the high-water mark first: anything committed after it is
+            # replayed next time, and replaying a document's current state is idempotent
+            latest = session.scalar(select(func.max(DocumentChangeRecord.seq))) or 0
+            if latest <= seq:
+                return seq, []
+            
+            query = select(*FEATURE_QUERY_COLUMNS)
+            changed = None
+            if seq > 0:
+                changed = set(session.scalars(
+                    select(DocumentChangeRecord.document_id)
+                    .where(DocumentChangeRecord.seq > seq, DocumentChangeRecord.seq <= latest)
+                ).all())
+                query = query.where(DocumentRecord.document_id.in_(changed))
+            
+            rows = [FeatureRow(row[0], False, *row[1:]) for row in session.execute(query).all()]
+        
+        if changed is not None:
+            stored = {row.document_id for row in rows}
+            rows.extend(FeatureRow(document_id, deleted=True) for document_id in changed - stored)
+        
+        return latest, rows
+
+
+# Column order matches FeatureRow after its deleted flag
+FEATURE_QUERY_COLUMNS = (
+    DocumentRecord.document_id,
+    DocumentRecord.document_type,
+    DocumentRecord.vendor_name,
+    DocumentRecord.currency,
+    DocumentRecord.upload_timestamp,
+    DocumentRecord.processing_time_seconds,
+    DocumentRecord.text_length,
+    DocumentRecord.num_tables,
+    DocumentRecord.num_entities,
+    DocumentRecord.avg_confidence,
+    DocumentRecord.total_amount,
+)
+
+
+def _etag(body: bytes) -> str:
+    """Content digest of a serialized extraction."""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def _configure_sqlite(dbapi_connection: Any, connection_record: Any) -> None:
+    """Enable WAL so readers don't block the writer, and enforce foreign keys."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+def _summary_fields(structured_data: Any) -> tuple:
+    """Extract (vendor_name, total_amount, currency) for indexing."""
+    if isinstance(structured_data, InvoiceExtraction):
+        total = structured_data.total_amount
+        return (
+            structured_data.vendor_name,
+            total.amount if total else None,
+            total.currency.value if total else None
+        )
+    if isinstance(structured_data, BankStatementExtraction):
+        return structured_data.bank_name, None, None
+    return None, None, None
+
+
+def _feature_fields(extraction: DocumentExtraction) -> tuple:
+    """Extract (text_length, num_tables, num_entities, avg_confidence) for anomaly detection."""
+    entities = extraction.extracted_entities
+    avg_confidence = sum(entity.confidence for entity in entities) / len(entities) if entities else 0.0
+    return len(extraction.raw_text), len(extraction.tables), len(entities), avg_confidence
+
+
+def _load(payload: bytes) -> DocumentExtraction:
+    """Decode a stored blob, restoring the typed structured data."""
+    extraction = DocumentExtraction.model_validate_json(gzip.decompress(payload))
+    data = extraction.structured_data
+    
+    # structured_data is untyped on the model, so JSON round-trips return plain dicts
+    if isinstance(data, dict):
+        if extraction.document_type == DocumentType.INVOICE:
+            extraction.structured_data = InvoiceExtraction(**data)
+        elif extraction.document_type == DocumentType.BANK_STATEMENT:
+            extraction.structured_data = BankStatementExtraction(**data)
+    elif isinstance(data, list):
+        extraction.structured_data = [
+            ExtractedEntity(**item) if isinstance(item, dict) else item for item in data
+        ]
+    
+    return extraction
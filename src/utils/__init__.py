@@ -4,13 +4,20 @@ from src.utils.helpers import (
     SecurityUtils,
     MetricsCollector,
     timed_operation,
+    timed_stage,
     validate_environment,
 )
+from src.utils.cache import TTLCache
+from src.utils.uploads import FileTooLargeError, save_stream
 
 __all__ = [
     "StructuredLogger",
     "SecurityUtils",
     "MetricsCollector",
     "timed_operation",
+    "timed_stage",
     "validate_environment",
+    "TTLCache",
+    "FileTooLargeError",
+    "save_stream",
 ]
@@ -0,0 +1,147 @@
+"""
+Admission control for expensive endpoints.
+
+Each controller allows a fixed number of requests to run at once and parks
+up to a bounded number more in a FIFO wait queue. Requests beyond that, or
+that wait too long, are rejected immediately with a retry hint instead of
+piling onto memory, CPU and LLM rate limits. Controllers live on the event
+loop and are not thread-safe.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque
+
+from prometheus_client import Counter, Gauge
+
+
+# Prometheus metrics
+admission_in_flight = Gauge(
+    'admission_in_flight', 'Requests currently admitted', ['endpoint'], multiprocess_mode='livesum'
+)
+admission_queue_depth = Gauge(
+    'admission_queue_depth', 'Requests waiting for admission', ['endpoint'], multiprocess_mode='livesum'
+)
+admission_wait_seconds = Gauge(
+    'admission_wait_seconds', 'Queue wait of the most recently admitted request', ['endpoint'],
+    multiprocess_mode='livemax'
+)
+admission_rejections = Counter(
+    'admission_rejected_total', 'Requests rejected by admission control', ['endpoint', 'reason']
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; retry_after is in seconds."""
+    
+    def __init__(self, endpoint: str, reason: str, retry_after: int):
+        super().__init__(f"{endpoint} is at capacity ({reason}); retry in {retry_after}s")
+        self.endpoint = endpoint
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded FIFO wait queue for one endpoint."""
+    
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int,
+        max_queue: int,
+        queue_timeout_seconds: float,
+        initial_service_seconds: float = 1.0
+    ):
+        """Initialize controller."""
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max(max_queue, 0)
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Moving average of how long admitted requests hold a slot, for Retry-After
+        self._service_seconds = initial_service_seconds
+        
+        admission_in_flight.labels(endpoint=name).set(0)
+        admission_queue_depth.labels(endpoint=name).set(0)
+    
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+    
+    def retry_after(self) -> int:
+        """Estimated seconds until a slot frees up for a new arrival."""
+        backlog = self.queue_depth + 1
+        return max(1, math.ceil(self._service_seconds * backlog / self.max_concurrent))
+    
+    async def acquire(self) -> None:
+        """Take a slot, waiting in the queue if needed; raises AdmissionRejected."""
+        if self.in_flight < self.max_concurrent and not self._waiters:
+            self._admit(0.0)
+            return
+        
+        if len(self._waiters) >= self.max_queue:
+            self._reject("queue_full")
+        
+        start = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        admission_queue_depth.labels(endpoint=self.name).set(len(self._waiters))
+        
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as we gave up; pass it on
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            admission_queue_depth.labels(endpoint=self.name).set(len(self._waiters))
+            
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject("timeout")
+        
+        # release() handed its slot straight to us, so in_flight is unchanged
+        admission_queue_depth.labels(endpoint=self.name).set(len(self._waiters))
+        admission_wait_seconds.labels(endpoint=self.name).set(time.perf_counter() - start)
+    
+    def release(self) -> None:
+        """Free a slot, handing it to the oldest live waiter if there is one."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        
+        self.in_flight -= 1
+        admission_in_flight.labels(endpoint=self.name).set(self.in_flight)
+    
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """Hold a slot for the duration of the block."""
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_service_time(time.perf_counter() - start)
+            self.release()
+    
+    def record_service_time(self, seconds: float, weight: float = 0.2) -> None:
+        """Fold a slot hold time into the moving average used for Retry-After."""
+        self._service_seconds += weight * (seconds - self._service_seconds)
+    
+    def _admit(self, waited: float) -> None:
+        self.in_flight += 1
+        admission_in_flight.labels(endpoint=self.name).set(self.in_flight)
+        admission_wait_seconds.labels(endpoint=self.name).set(waited)
+    
+    def _reject(self, reason: str) -> None:
+        admission_rejections.labels(endpoint=self.name, reason=reason).inc()
+        raise AdmissionRejected(self.name, reason, self.retry_after())
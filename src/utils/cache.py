@@ -0,0 +1,106 @@
+"""
+In-process caching utilities with LRU eviction, TTL expiry and hit metrics.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from prometheus_client import Counter
+
+
+# Prometheus metrics
+cache_lookups = Counter('cache_lookups_total', 'Cache lookups by result', ['cache', 'result'])
+cache_evictions = Counter('cache_evictions_total', 'Cache entries evicted or expired', ['cache'])
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache with an optional per-entry time-to-live."""
+    
+    def __init__(self, name: str, max_entries: int = 1024, ttl_seconds: Optional[float] = None):
+        """Initialize cache."""
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return cached value for key, or default if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is not None and expires_at <= time.monotonic():
+                    del self._entries[key]
+                    self._record_eviction()
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    cache_lookups.labels(cache=self.name, result="hit").inc()
+                    return value
+            
+            self.misses += 1
+            cache_lookups.labels(cache=self.name, result="miss").inc()
+            return default
+    
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store value under key, evicting the least recently used entry if full."""
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._record_eviction()
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove key from the cache and return its value."""
+        with self._lock:
+            entry = self._entries.pop(key, _MISSING)
+            return default if entry is _MISSING else entry[0]
+    
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+    
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            return entry is not _MISSING and (entry[1] is None or entry[1] > time.monotonic())
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+    
+    def _record_eviction(self) -> None:
+        """Record an evicted or expired entry (caller holds the lock)."""
+        self.evictions += 1
+        cache_evictions.labels(cache=self.name).inc()
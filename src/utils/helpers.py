@@ -1,11 +1,14 @@
 """
 Utility functions for logging, monitoring, and security.
 """
+import inspect
 import logging
 import json
-from datetime import datetime
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from functools import wraps
-from typing import Any, Callable
+from typing import Any, Callable, Iterator, Optional
 import hashlib
 import secrets
 
@@ -18,6 +21,28 @@ request_count = Counter('app_requests_total', 'Total requests', ['method', 'endp
 request_duration = Histogram('app_request_duration_seconds', 'Request duration', ['method', 'endpoint'])
 active_users = Gauge('app_active_users', 'Number of active users')
 
+# Pipeline metrics; stages are e.g. ocr, classification, extraction, vectorization
+stage_duration = Histogram(
+    'pipeline_stage_duration_seconds', 'Time spent in each pipeline stage', ['stage'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+stage_failures = Counter('pipeline_stage_failures_total', 'Pipeline stage failures', ['stage'])
+page_duration = Histogram(
+    'pipeline_page_duration_seconds', 'Time spent per page in page-level stages', ['stage'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+pages_processed = Counter('pipeline_pages_total', 'Pages processed by page-level stages', ['stage'])
+llm_tokens = Counter('llm_tokens_total', 'LLM tokens used', ['operation', 'kind'])
+chunks_indexed = Counter('vector_chunks_total', 'Chunks seen when indexing, by outcome', ['outcome'])
+texts_embedded = Counter('embedding_texts_total', 'Texts sent to the embedding backend', ['kind'])
+
+# Operations wrapped by timed_operation (queries, model fits, uploads); kept apart from pipeline stages
+operation_duration = Histogram(
+    'app_operation_duration_seconds', 'Time spent in timed operations', ['operation'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+operation_failures = Counter('app_operation_failures_total', 'Timed operations that raised', ['operation'])
+
 
 class StructuredLogger:
     """Structured JSON logger for better log aggregation."""
@@ -49,27 +74,62 @@ class StructuredLogger:
         self.logger.warning(message, extra=kwargs)
 
 
+@contextmanager
+def timed_stage(stage: str, per_page: bool = False) -> Iterator[None]:
+    """Time a block into the stage (or per-page) histogram; failures are also counted."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_failures.labels(stage=stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if per_page:
+            page_duration.labels(stage=stage).observe(elapsed)
+            pages_processed.labels(stage=stage).inc()
+        else:
+            stage_duration.labels(stage=stage).observe(elapsed)
+
+
 def timed_operation(metric_name: str = "operation"):
-    """Decorator to time operations and record metrics."""
+    """Decorator to time sync or async operations, log them and record the operation histogram."""
     def decorator(func: Callable) -> Callable:
+        logger = logging.getLogger(func.__module__)
+        
+        def log_duration(start: float, error: Optional[Exception] = None) -> None:
+            duration = time.perf_counter() - start
+            operation_duration.labels(operation=metric_name).observe(duration)
+            if error is None:
+                logger.info(f"{metric_name} completed in {duration:.2f}s")
+            else:
+                operation_failures.labels(operation=metric_name).inc()
+                logger.error(f"{metric_name} failed after {duration:.2f}s: {error}")
+        
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    log_duration(start, e)
+                    raise
+                log_duration(start)
+                return result
+            
+            return async_wrapper
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = datetime.utcnow()
-            
+            start = time.perf_counter()
             try:
                 result = func(*args, **kwargs)
-                duration = (datetime.utcnow() - start_time).total_seconds()
-                
-                # Log success
-                logger = logging.getLogger(func.__module__)
-                logger.info(f"{metric_name} completed in {duration:.2f}s")
-                
-                return result
             except Exception as e:
-                duration = (datetime.utcnow() - start_time).total_seconds()
-                logger = logging.getLogger(func.__module__)
-                logger.error(f"{metric_name} failed after {duration:.2f}s: {e}")
+                log_duration(start, e)
                 raise
+            log_duration(start)
+            return result
         
         return wrapper
     return decorator
@@ -164,6 +224,15 @@ class MetricsCollector:
         return '\n'.join(lines)
 
 
+def posix_seconds(timestamp: Optional[datetime]) -> float:
+    """Seconds since the epoch (NaN for None); naive timestamps are UTC, as stored by the repository."""
+    if timestamp is None:
+        return float("nan")
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
 def validate_environment():
     """Validate that all required environment variables are set."""
     from src.config import get_settings
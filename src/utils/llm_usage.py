@@ -0,0 +1,81 @@
+"""
+LLM token usage accounting, shared by extraction and RAG chains.
+"""
+import logging
+from typing import Any, Dict, List
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+
+from src.utils.helpers import llm_tokens
+
+logger = logging.getLogger(__name__)
+
+# Tokens OpenAI adds around each chat message and to prime the reply
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+class TokenUsageRecorder(BaseCallbackHandler):
+    """
+    LangChain callback counting OpenAI token usage per operation.
+    
+    Streamed responses carry no usage report, so when a stream finishes (or
+    is cut off) its completion is counted as the streamed tokens and its
+    prompt with the model's tokenizer.
+    """
+    
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._messages: List[BaseMessage] = []
+        self._model = ""
+        self._streamed = 0
+    
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], **kwargs: Any
+    ) -> None:
+        params = kwargs.get("invocation_params") or {}
+        self._messages = [message for prompt in messages for message in prompt]
+        self._model = params.get("model") or params.get("model_name") or ""
+        self._streamed = 0
+    
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self._streamed += 1
+    
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            self._record(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        elif self._streamed:
+            self._record(count_prompt_tokens(self._messages, self._model), self._streamed)
+    
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        # An interrupted stream was still billed for what it produced
+        if self._streamed:
+            self._record(count_prompt_tokens(self._messages, self._model), self._streamed)
+    
+    def _record(self, prompt_tokens: Any, completion_tokens: Any) -> None:
+        for kind, tokens in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+            if tokens:
+                llm_tokens.labels(operation=self.operation, kind=kind).inc(tokens)
+
+
+def usage_config(operation: str) -> Dict[str, Any]:
+    """Runnable config that records token usage under the given operation label."""
+    return {"callbacks": [TokenUsageRecorder(operation)]}
+
+
+def count_prompt_tokens(messages: List[BaseMessage], model: str) -> int:
+    """Prompt tokens of chat messages for an OpenAI model; 0 if the tokenizer is unavailable."""
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        content = sum(len(encoding.encode(str(message.content))) for message in messages)
+    except Exception as e:
+        logger.debug(f"Could not count prompt tokens for {model}: {e}")
+        return 0
+    return content + TOKENS_PER_MESSAGE * len(messages) + TOKENS_PER_REPLY
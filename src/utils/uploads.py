@@ -0,0 +1,91 @@
+"""
+Streaming upload persistence with size limits and on-the-fly hashing.
+"""
+import hashlib
+import inspect
+import os
+from typing import Any, AsyncIterator, Tuple
+
+import aiofiles
+
+
+class FileTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured size limit."""
+    
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File exceeds maximum size of {max_bytes // (1024 * 1024)} MB")
+        self.max_bytes = max_bytes
+
+
+async def read_chunks(source: Any, chunk_size: int) -> AsyncIterator[bytes]:
+    """Yield fixed-size chunks from a file-like object with a sync or async read()."""
+    while True:
+        chunk = source.read(chunk_size)
+        if inspect.isawaitable(chunk):
+            chunk = await chunk
+        if not chunk:
+            break
+        yield chunk
+
+
+async def save_stream(
+    chunks: AsyncIterator[bytes],
+    destination: str,
+    max_bytes: int
+) -> Tuple[int, str]:
+    """
+    Write chunks to destination, enforcing max_bytes while copying.
+    
+    Returns:
+        Tuple of (size in bytes, SHA-256 hex digest). The partial file is
+        removed if the limit is exceeded or the copy fails.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+    
+    try:
+        async with aiofiles.open(destination, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise FileTooLargeError(max_bytes)
+                
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        if os.path.exists(destination):
+            os.remove(destination)
+        raise
+    
+    return size, digest.hexdigest()
+
+
+def copy_file(source: Any, destination: str, max_bytes: int, chunk_size: int) -> Tuple[int, str]:
+    """
+    Blocking counterpart of save_stream for sync file-like objects.
+    
+    Used for sources that must be read off the event loop, such as members
+    of an uploaded archive, whose reads decompress.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+    
+    try:
+        with open(destination, "wb") as f:
+            for chunk in iter(lambda: source.read(chunk_size), b""):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise FileTooLargeError(max_bytes)
+                
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(destination):
+            os.remove(destination)
+        raise
+    
+    return size, digest.hexdigest()
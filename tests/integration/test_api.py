@@ -1,12 +1,26 @@
 """
 Integration tests for API endpoints.
 """
+import asyncio
+import hashlib
+import io
+import time
+import zipfile
+from datetime import datetime
+
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import Mock, patch
 
-from api import app
-from src.models.schemas import DocumentType
+from api import app, publish_job_result, settings, warm_up
+from src.jobs.job_queue import JobQueue
+from src.jobs.progress import ProgressBroker
+from src.storage.repository import SQLDocumentRepository
+from src.utils.admission import AdmissionController
+from src.utils.uploads import copy_file
+from src.models.schemas import (
+    DocumentExtraction, DocumentMetadata, DocumentType, OCRResult, ProcessingStatus
+)
 
 
 @pytest.fixture
@@ -37,27 +51,364 @@ class TestAPIEndpoints:
         assert response.status_code == 200
         assert response.json()["status"] == "healthy"
     
+    def test_ready_only_after_warm_up(self, client, tmp_path):
+        """Test readiness is reported only once the worker has warmed up."""
+        repository = SQLDocumentRepository(f"sqlite:///{tmp_path / 'documents.sqlite3'}")
+        pipeline = Mock()
+        pipeline.vector_store.version = 0
+        
+        with patch('api.worker_ready', False), \
+             patch('api.get_pipeline', return_value=pipeline), \
+             patch('api.get_job_queue') as get_queue, \
+             patch('api.get_anomaly_models') as get_models, \
+             patch('api.document_repository', repository):
+            assert client.get("/ready").status_code == 503
+            
+            warm_up()
+            
+            response = client.get("/ready")
+            assert response.status_code == 200
+            assert response.json()["status"] == "ready"
+            get_queue.assert_called_once()
+            get_models.assert_called_once()
+    
+    def test_warm_up_endpoint_loads_subsystems(self, client, mock_pipeline):
+        """Test the warm-up endpoint preloads modules and builds pipeline components."""
+        with patch('api.preload_subsystems', return_value={"prophet": 1.5}) as preload:
+            response = client.post("/api/v1/admin/warm-up")
+        
+        assert response.status_code == 200
+        assert response.json()["import_seconds"] == {"prophet": 1.5}
+        preload.assert_called_once()
+        mock_pipeline.return_value.load_components.assert_called_once()
+    
     def test_metrics_endpoint(self, client):
         """Test Prometheus metrics endpoint."""
         response = client.get("/metrics")
         assert response.status_code == 200
     
-    @patch('api.get_pipeline')
-    def test_upload_document(self, mock_pipeline, client):
-        """Test document upload endpoint."""
-        # Mock pipeline response
-        mock_extraction = Mock()
-        mock_extraction.document_id = "test-123"
-        mock_extraction.metadata.document_id = "test-123"
-        mock_extraction.metadata.filename = "test.pdf"
+    def test_upload_document(self, client, tmp_path):
+        """Test upload is queued and returns a job id without processing inline."""
+        queue = JobQueue(handler=Mock(), path=str(tmp_path / "jobs.sqlite3"))
+        
+        with patch('api.job_queue', queue):
+            # Create test file
+            files = {"file": ("test.pdf", b"fake pdf content", "application/pdf")}
+            response = client.post("/api/v1/documents/upload", files=files)
+            
+            assert response.status_code == 200
+            data = response.json()
+            assert data["status"] == "uploaded"
+            assert data["job_id"]
+            
+            status = client.get(f"/api/v1/documents/{data['document_id']}/status")
+            assert status.json()["current_stage"] == "queued"
+            
+            pending = client.get(f"/api/v1/documents/{data['document_id']}")
+            assert pending.status_code == 409
+            
+            content_hash = hashlib.sha256(b"fake pdf content").hexdigest()
+            assert data["metadata"]["content_hash"] == content_hash
+            assert queue.get(data["job_id"]).content_hash == content_hash
+    
+    def test_saturated_endpoint_returns_429(self, client, mock_pipeline):
+        """Test requests beyond the concurrency limit and queue get 429 with Retry-After."""
+        controller = AdmissionController("query", max_concurrent=1, max_queue=0, queue_timeout_seconds=1)
+        controller.in_flight = 1  # Slot held by another request
+        
+        with patch.dict('api.admission', {"query": controller}):
+            response = client.post("/api/v1/query", json={"query": "What is the total?"})
+        
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        mock_pipeline.return_value.rag_engine.query.assert_not_called()
+    
+    def test_upload_rejected_when_backlog_full(self, client, tmp_path):
+        """Test uploads get 429 while the processing backlog is at its limit."""
+        queue = JobQueue(handler=Mock(), path=str(tmp_path / "jobs.sqlite3"))
+        queue.submit("doc-1", "/tmp/a.pdf", "a.pdf", "api_user")
+        
+        with patch('api.job_queue', queue), patch.object(settings, 'job_queue_max_pending', 1):
+            files = {"file": ("test.pdf", b"backlogged bytes", "application/pdf")}
+            response = client.post("/api/v1/documents/upload", files=files)
+        
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+        assert queue.pending_count() == 1
+    
+    def test_duplicate_upload_returns_existing_document(self, client, tmp_path):
+        """Test identical bytes alias the existing document unless reprocessing is forced."""
+        queue = JobQueue(handler=Mock(), path=str(tmp_path / "jobs.sqlite3"))
+        files = {"file": ("invoice.pdf", b"same invoice bytes", "application/pdf")}
+        
+        repository = SQLDocumentRepository(f"sqlite:///{tmp_path / 'documents.sqlite3'}")
+        broker = ProgressBroker()
+        
+        with patch('api.job_queue', queue), patch('api.document_repository', repository), \
+             patch('api.progress_broker', broker):
+            first = client.post("/api/v1/documents/upload", files=files).json()
+            
+            # In-flight duplicate is aliased to the queued job
+            second = client.post("/api/v1/documents/upload", files=files).json()
+            assert second["deduplicated"] is True
+            assert second["document_id"] == first["document_id"]
+            assert second["job_id"] == first["job_id"]
+            
+            # Forcing does not start a second run while the first is in flight
+            forced = client.post("/api/v1/documents/upload?force_reprocess=true", files=files).json()
+            assert forced["job_id"] == first["job_id"]
+            
+            queue._finish(first["job_id"], ProcessingStatus.COMPLETED, "completed", 100)
+            broker.publish(first["document_id"], "completed", {"progress": 100})
+            repository.exists = Mock(return_value=True)
+            
+            third = client.post("/api/v1/documents/upload", files=files).json()
+            assert third["deduplicated"] is True
+            assert third["status"] == "completed"
+            
+            # Reprocessing keeps the document id but runs a new job
+            forced = client.post("/api/v1/documents/upload?force_reprocess=true", files=files).json()
+            assert forced["deduplicated"] is False
+            assert forced["document_id"] == first["document_id"]
+            assert forced["job_id"] != first["job_id"]
+            
+            # The previous run's completion is not replayed to streams of the new run
+            assert broker.history(first["document_id"]) == []
+    
+    def test_document_projection_and_ocr_pages(self, client, tmp_path):
+        """Test field projection, per-page OCR access and gzip compression."""
+        repository = SQLDocumentRepository(f"sqlite:///{tmp_path / 'documents.sqlite3'}")
+        repository.save(DocumentExtraction(
+            document_id="doc-1",
+            document_type=DocumentType.INVOICE,
+            metadata=DocumentMetadata(
+                document_id="doc-1", filename="invoice.pdf", file_size=1024,
+                mime_type="application/pdf", upload_timestamp=datetime(2025, 11, 1), uploader="tester"
+            ),
+            ocr_results=[
+                OCRResult(text=f"word{i}", confidence=0.9, page_number=i % 2) for i in range(400)
+            ],
+            raw_text="Invoice total $1,500"
+        ))
+        
+        with patch('api.document_repository', repository):
+            response = client.get("/api/v1/documents/doc-1?fields=document_type,metadata")
+            assert response.status_code == 200
+            assert set(response.json()) == {"document_type", "metadata"}
+            
+            full = client.get("/api/v1/documents/doc-1", headers={"Accept-Encoding": "gzip"})
+            assert len(full.json()["ocr_results"]) == 400
+            assert full.headers["content-encoding"] == "gzip"
+            
+            assert client.get("/api/v1/documents/doc-1?fields=bogus").status_code == 400
+            
+            page = client.get("/api/v1/documents/doc-1/ocr?page=2").json()
+            assert page["total_pages"] == 2
+            assert len(page["ocr_results"]) == 200
+            assert page["ocr_results"][0]["text"] == "word1"
+            
+            assert client.get("/api/v1/documents/doc-1/ocr?page=3").status_code == 404
+    
+    def test_document_etag_returns_304(self, client, tmp_path):
+        """Test stored bytes are served with an ETag and revalidation returns 304."""
+        repository = SQLDocumentRepository(f"sqlite:///{tmp_path / 'documents.sqlite3'}")
+        extraction = DocumentExtraction(
+            document_id="doc-1",
+            document_type=DocumentType.INVOICE,
+            metadata=DocumentMetadata(
+                document_id="doc-1", filename="invoice.pdf", file_size=1024,
+                mime_type="application/pdf", upload_timestamp=datetime(2025, 11, 1), uploader="tester"
+            ),
+            raw_text="Invoice total $1,500"
+        )
+        repository.save(extraction)
+        
+        with patch('api.document_repository', repository):
+            response = client.get("/api/v1/documents/doc-1")
+            etag = response.headers["etag"]
+            assert response.json()["raw_text"] == "Invoice total $1,500"
+            
+            cached = client.get("/api/v1/documents/doc-1", headers={"If-None-Match": etag})
+            assert cached.status_code == 304
+            
+            # Projections have their own ETag
+            projected = client.get("/api/v1/documents/doc-1?fields=raw_text", headers={"If-None-Match": etag})
+            assert projected.status_code == 200
+            assert projected.headers["etag"] != etag
+            
+            extraction.raw_text = "Invoice total $1,750"
+            repository.save(extraction)
+            changed = client.get("/api/v1/documents/doc-1", headers={"If-None-Match": etag})
+            assert changed.status_code == 200
+            assert changed.json()["raw_text"] == "Invoice total $1,750"
+    
+    def test_deleted_document_is_not_found(self, client, mock_pipeline, tmp_path):
+        """Test a deleted document returns 404, not its finished job's status."""
+        queue = JobQueue(handler=Mock(), path=str(tmp_path / "jobs.sqlite3"))
+        repository = SQLDocumentRepository(f"sqlite:///{tmp_path / 'documents.sqlite3'}")
+        job = queue.submit("doc-1", "/tmp/a.pdf", "a.pdf", "tester", content_hash="abc")
+        repository.save(DocumentExtraction(
+            document_id="doc-1",
+            document_type=DocumentType.INVOICE,
+            metadata=DocumentMetadata(
+                document_id="doc-1", filename="a.pdf", file_size=1024,
+                mime_type="application/pdf", upload_timestamp=datetime(2025, 11, 1), uploader="tester"
+            ),
+            raw_text="Invoice"
+        ))
+        queue._finish(job.job_id, ProcessingStatus.COMPLETED, "completed", 100)
         
-        mock_pipeline.return_value.process_document.return_value = mock_extraction
+        with patch('api.job_queue', queue), patch('api.document_repository', repository):
+            assert client.get("/api/v1/documents/doc-1").status_code == 200
+            assert client.delete("/api/v1/documents/doc-1").status_code == 200
+            
+            assert client.get("/api/v1/documents/doc-1").status_code == 404
+            assert client.get("/api/v1/documents/doc-1/status").status_code == 404
+            assert queue.find_by_content_hash("abc") is None
+    
+    def test_purge_selects_from_repository(self, client, mock_pipeline, tmp_path):
+        """Test purge removes stored documents matching the filters, indexed or not."""
+        queue = JobQueue(handler=Mock(), path=str(tmp_path / "jobs.sqlite3"))
+        repository = SQLDocumentRepository(f"sqlite:///{tmp_path / 'documents.sqlite3'}")
+        for document_id, uploader in (("doc-1", "sftp"), ("doc-2", "sftp"), ("doc-3", "web_ui")):
+            queue.submit(document_id, f"/tmp/{document_id}.pdf", f"{document_id}.pdf", uploader)
+            repository.save(DocumentExtraction(
+                document_id=document_id,
+                document_type=DocumentType.INVOICE,
+                metadata=DocumentMetadata(
+                    document_id=document_id, filename=f"{document_id}.pdf", file_size=1024,
+                    mime_type="application/pdf", upload_timestamp=datetime(2025, 11, 1), uploader=uploader
+                ),
+                raw_text="Invoice"
+            ))
         
-        # Create test file
-        files = {"file": ("test.pdf", b"fake pdf content", "application/pdf")}
-        response = client.post("/api/v1/documents/upload", files=files)
+        with patch('api.job_queue', queue), patch('api.document_repository', repository):
+            assert client.post("/api/v1/documents/purge").status_code == 400
+            response = client.post("/api/v1/documents/purge", params={"uploader": "sftp"})
         
-        assert response.status_code in [200, 500]  # May fail without real dependencies
+        assert response.status_code == 200
+        assert response.json()["document_ids"] == ["doc-1", "doc-2"]
+        mock_pipeline.return_value.vector_store.delete_documents.assert_called_once_with(["doc-1", "doc-2"])
+        mock_pipeline.return_value.duplicate_index.remove.assert_called_once_with(["doc-1", "doc-2"])
+        assert [extraction.document_id for extraction in repository.list()] == ["doc-3"]
+        assert queue.get_for_document("doc-1") is None and queue.get_for_document("doc-3") is not None
+    
+    def test_document_events_stream(self, client, tmp_path):
+        """Test progress events are streamed, with the job store as fallback."""
+        queue = JobQueue(handler=Mock(), path=str(tmp_path / "jobs.sqlite3"))
+        broker = ProgressBroker()
+        streamed = queue.submit("doc-1", "/tmp/a.pdf", "a.pdf", "tester")
+        polled = queue.submit("doc-2", "/tmp/b.pdf", "b.pdf", "tester")
+        
+        broker.publish("doc-1", "progress", {"stage": "ocr", "progress": 22, "details": {"page": 2, "total_pages": 4}})
+        broker.publish("doc-1", "completed", {"stage": "completed", "progress": 100})
+        queue._finish(polled.job_id, ProcessingStatus.FAILED, "ocr", 5, error="unreadable")
+        
+        with patch('api.job_queue', queue), patch('api.progress_broker', broker):
+            response = client.get("/api/v1/documents/doc-1/events")
+            assert response.headers["content-type"].startswith("text/event-stream")
+            assert "content-encoding" not in response.headers
+            events = [line[7:] for line in response.text.splitlines() if line.startswith("event: ")]
+            assert events == ["progress", "completed"]
+            assert '"total_pages": 4' in response.text
+            
+            # No in-process events (e.g. another worker): status comes from the job store
+            response = client.get("/api/v1/documents/doc-2/events")
+            assert "event: failed" in response.text
+            assert "unreadable" in response.text
+            
+            assert client.get("/api/v1/documents/unknown/events").status_code == 404
+    
+    def test_terminal_event_published_after_job_is_finalized(self, tmp_path):
+        """Test completed/failed events go out only once the job row holds its final status."""
+        broker = ProgressBroker()
+        recorded = {}
+        
+        def publish(job):
+            recorded[job.document_id] = queue.get(job.job_id).status
+            publish_job_result(job)
+        
+        handler = Mock(side_effect=[None, RuntimeError("unreadable")])
+        queue = JobQueue(
+            handler=handler, path=str(tmp_path / "jobs.sqlite3"), max_workers=1, max_attempts=1, on_finished=publish
+        )
+        with patch('api.progress_broker', broker):
+            queue.start()
+            try:
+                queue.submit("doc-1", "/tmp/a.pdf", "a.pdf", "tester")
+                queue.submit("doc-2", "/tmp/b.pdf", "b.pdf", "tester")
+                deadline = time.time() + 5
+                while len(recorded) < 2 and time.time() < deadline:
+                    time.sleep(0.02)
+            finally:
+                queue.stop()
+        
+        assert recorded == {"doc-1": ProcessingStatus.COMPLETED, "doc-2": ProcessingStatus.FAILED}
+        assert [event for event, _ in broker.history("doc-1")] == ["completed"]
+        failed = broker.history("doc-2")
+        assert [event for event, _ in failed] == ["failed"]
+        assert failed[0][1]["error_message"] == "unreadable"
+    
+    def test_upload_too_large(self, client, tmp_path):
+        """Test oversized uploads get 413 and are never queued."""
+        queue = JobQueue(handler=Mock(), path=str(tmp_path / "jobs.sqlite3"))
+        queue.submit = Mock()
+        
+        with patch('api.job_queue', queue), patch.object(settings, 'max_file_size_mb', 0):
+            # Passes the Content-Length guard, rejected while streaming
+            files = {"file": ("big.pdf", b"x" * 1024, "application/pdf")}
+            response = client.post("/api/v1/documents/upload", files=files)
+            assert response.status_code == 413
+            
+            # Rejected from Content-Length before the body is read
+            files = {"file": ("huge.pdf", b"x" * 200 * 1024, "application/pdf")}
+            response = client.post("/api/v1/documents/upload", files=files)
+            assert response.status_code == 413
+        
+        queue.submit.assert_not_called()
+    
+    def test_batch_upload_with_zip(self, client, tmp_path):
+        """Test batch upload queues loose files and zip members under one batch id."""
+        queue = JobQueue(handler=Mock(), path=str(tmp_path / "jobs.sqlite3"))
+        
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("march/invoice-1.pdf", b"fake invoice pdf")
+            zf.writestr("march/receipt.png", b"fake png")
+            zf.writestr("march/notes.txt", b"not a document")
+        
+        files = [
+            ("files", ("statement.pdf", b"fake pdf", "application/pdf")),
+            ("files", ("march.zip", archive.getvalue(), "application/zip")),
+        ]
+        
+        # Archive members are decompressed off the event loop
+        on_event_loop = []
+        def copy(*args):
+            try:
+                asyncio.get_running_loop()
+                on_event_loop.append(True)
+            except RuntimeError:
+                on_event_loop.append(False)
+            return copy_file(*args)
+        
+        with patch('api.job_queue', queue), patch('api.copy_file', side_effect=copy):
+            response = client.post("/api/v1/documents/batch", files=files)
+            
+            assert response.status_code == 200
+            assert on_event_loop == [False, False]
+            data = response.json()
+            assert [doc["metadata"]["filename"] for doc in data["accepted"]] == [
+                "statement.pdf", "invoice-1.pdf", "receipt.png"
+            ]
+            assert data["rejected"] == [{"filename": "notes.txt", "reason": "Unsupported file type"}]
+            
+            status = client.get(f"/api/v1/batches/{data['batch_id']}")
+            assert status.status_code == 200
+            assert status.json()["total"] == 3
+            assert status.json()["status_counts"]["uploaded"] == 3
+            
+            assert client.get("/api/v1/batches/unknown").status_code == 404
     
     def test_query_endpoint_structure(self, client):
         """Test query endpoint structure."""
@@ -69,3 +420,97 @@ class TestAPIEndpoints:
         response = client.post("/api/v1/query", json=query_data)
         # May return error without real data, but endpoint should exist
         assert response.status_code in [200, 500]
+    
+    @patch('api.get_pipeline')
+    def test_query_stream_endpoint(self, mock_pipeline, client):
+        """Test streaming query endpoint emits server-sent events."""
+        mock_pipeline.return_value.rag_engine.stream_query.return_value = iter([
+            ("sources", []),
+            ("token", "Hello"),
+            ("done", {"answer": "Hello"}),
+        ])
+        
+        response = client.post("/api/v1/query/stream", json={"query": "What is the total?"})
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert 'event: token\ndata: "Hello"' in response.text
+        assert "event: done" in response.text
+    
+    def test_validation_rules_over_stored_documents(self, client, mock_pipeline, tmp_path):
+        """Test stored invoices are re-checked against the validation rules in one batch."""
+        from src.anomaly.detector import ValidationEngine
+        from src.models.schemas import Currency, InvoiceExtraction, MonetaryAmount
+        
+        repository = SQLDocumentRepository(f"sqlite:///{tmp_path / 'documents.sqlite3'}")
+        for document_id, total in (("doc-1", 110.0), ("doc-2", 150.0)):
+            repository.save(DocumentExtraction(
+                document_id=document_id,
+                document_type=DocumentType.INVOICE,
+                metadata=DocumentMetadata(
+                    document_id=document_id, filename="invoice.pdf", file_size=1,
+                    mime_type="application/pdf", upload_timestamp=datetime(2025, 11, 1), uploader="tester"
+                ),
+                structured_data=InvoiceExtraction(
+                    invoice_number="INV-1", vendor_name="Acme",
+                    subtotal=MonetaryAmount(amount=100.0, currency=Currency.USD),
+                    tax_amount=MonetaryAmount(amount=10.0, currency=Currency.USD),
+                    total_amount=MonetaryAmount(amount=total, currency=Currency.USD)
+                ),
+                raw_text="Invoice"
+            ))
+        mock_pipeline.return_value.validator = ValidationEngine()
+        
+        with patch('api.document_repository', repository):
+            response = client.get("/api/v1/anomalies/validation")
+        
+        assert response.status_code == 200
+        assert [(a["document_id"], a["field_name"], a["expected_value"]) for a in response.json()] == [
+            ("doc-2", "total_amount", 110.0)
+        ]
+    
+    def test_anomaly_alerts_raised_at_ingest(self, client, mock_pipeline, tmp_path):
+        """Test alerts recorded by the online scorer and duplicate index are listed newest first."""
+        from src.anomaly.duplicates import DuplicateIndex
+        from src.anomaly.online import OnlineAnomalyScorer
+        from src.models.schemas import Currency, InvoiceExtraction, MonetaryAmount
+        
+        scorer = OnlineAnomalyScorer(str(tmp_path / "state.sqlite3"), min_observations=5)
+        for i, amount in enumerate([100.0, 102.0, 98.0, 101.0, 99.0, 5000.0]):
+            scorer.observe(DocumentExtraction(
+                document_id=f"doc-{i}",
+                document_type=DocumentType.INVOICE,
+                metadata=DocumentMetadata(
+                    document_id=f"doc-{i}", filename="invoice.pdf", file_size=1,
+                    mime_type="application/pdf", upload_timestamp=datetime(2025, 11, 1), uploader="tester"
+                ),
+                structured_data=InvoiceExtraction(
+                    vendor_name="Acme", total_amount=MonetaryAmount(amount=amount, currency=Currency.USD)
+                ),
+                raw_text="Invoice"
+            ))
+        mock_pipeline.return_value.online_scorer = scorer
+        
+        duplicates = DuplicateIndex(str(tmp_path / "duplicates.sqlite3"))
+        for document_id in ("doc-6", "doc-7"):
+            duplicates.observe(DocumentExtraction(
+                document_id=document_id,
+                document_type=DocumentType.INVOICE,
+                metadata=DocumentMetadata(
+                    document_id=document_id, filename="invoice.pdf", file_size=1,
+                    mime_type="application/pdf", upload_timestamp=datetime(2025, 11, 2), uploader="tester"
+                ),
+                structured_data=InvoiceExtraction(
+                    vendor_name="Acme", invoice_number="INV-7",
+                    total_amount=MonetaryAmount(amount=100.0, currency=Currency.USD)
+                ),
+                raw_text="Invoice"
+            ))
+        mock_pipeline.return_value.duplicate_index = duplicates
+        
+        response = client.get("/api/v1/anomalies/alerts")
+        
+        assert response.status_code == 200
+        assert [(alert["document_id"], alert["anomaly_type"]) for alert in response.json()] == [
+            ("doc-7", "duplicate"), ("doc-5", "outlier_amount")
+        ]
@@ -1,7 +1,20 @@
 """
 Comprehensive test suite for document processing pipeline.
 """
+import asyncio
+import gzip
+import hashlib
+import io
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
 import pytest
+from langchain_core.messages import HumanMessage
+from langchain_core.outputs import LLMResult
+from prometheus_client import REGISTRY
 from unittest.mock import Mock, patch, MagicMock
 from pathlib import Path
 from datetime import datetime
@@ -9,12 +22,30 @@ from datetime import datetime
 from src.models.schemas import (
     DocumentType, DocumentExtraction, DocumentMetadata,
     InvoiceExtraction, BankStatementExtraction, OCRResult,
-    TableData, ExtractedEntity, MonetaryAmount, Currency
+    TableData, ExtractedEntity, MonetaryAmount, Currency, AnomalyType
 )
 from src.ocr.preprocessor import DocumentPreprocessor, OCREngine, TableExtractor
 from src.extraction.llm_extractor import LLMExtractor
+from src.utils.llm_usage import TokenUsageRecorder
 from src.rag.rag_engine import VectorStore, RAGEngine
-from src.anomaly.detector import AnomalyDetector, TrendAnalyzer
+from src.rag.chunking import LayoutChunker
+from src.rag.embeddings import LEGACY_COLLECTION_NAME, HashingEmbeddingBackend, OpenAIEmbeddingBackend
+from src.anomaly.detector import AnomalyDetector, TrendAnalyzer, ValidationEngine, daily_totals
+from src.anomaly.duplicates import DuplicateIndex, _shingles
+from src.anomaly.features import FeatureStore
+from src.anomaly.online import OnlineAnomalyScorer, P2Quantile, RunningStats, _group_keys
+from src.anomaly.reconciliation import find_balance_breaks, reconcile_statement
+from src.anomaly.registry import AnomalyModelManager, ModelRegistry
+from src.anomaly.rules import Rule, RuleEngine
+from src.models.schemas import QueryRequest, QueryResponse
+from src.utils.admission import AdmissionController, AdmissionRejected
+from src.utils.cache import TTLCache
+from src.utils.helpers import timed_operation, timed_stage
+from src.storage.repository import SQLDocumentRepository
+from src.utils.uploads import FileTooLargeError, read_chunks, save_stream
+from src.jobs.job_queue import JobQueue, _pid_alive
+from src.jobs.progress import ProgressBroker
+from src.models.schemas import ProcessingStatus
 from poc_pipeline import DocumentPipeline
 
 
@@ -105,7 +136,7 @@ class TestVectorStore:
         assert temp_vector_store is not None
         assert temp_vector_store.collection is not None
     
-    @patch('src.rag.rag_engine.OpenAIEmbeddings')
+    @patch('src.rag.embeddings.OpenAIEmbeddings')
     def test_add_document(self, mock_embeddings, temp_vector_store):
         """Test adding document to vector store."""
         # Mock embeddings
@@ -131,6 +162,832 @@ class TestVectorStore:
         
         # Should not raise exception
         temp_vector_store.add_document(extraction)
+    
+    def test_hashing_embedder_is_deterministic(self):
+        """Test hashing embedder returns stable, normalized vectors."""
+        backend = HashingEmbeddingBackend(dimension=64)
+        first, second = backend.embed_documents(["Invoice total $100", "Invoice total $100"])
+        
+        assert first == second
+        assert len(first) == 64
+        assert abs(sum(v * v for v in first) - 1.0) < 1e-5
+    
+    def test_collections_separated_by_dimension(self, tmp_path):
+        """Test backends with different dimensions get their own collections."""
+        small = VectorStore(str(tmp_path / "vectordb"), embedding_backend=HashingEmbeddingBackend(64))
+        large = VectorStore(str(tmp_path / "vectordb"), embedding_backend=HashingEmbeddingBackend(128))
+        
+        assert small.collection.name != large.collection.name
+        assert small.collection.metadata["embedding_dimension"] == 64
+    
+    @patch('src.rag.embeddings.OpenAIEmbeddings')
+    def test_default_model_keeps_legacy_collection(self, mock_embeddings, tmp_path, caplog):
+        """Test the default OpenAI model reuses the original collection, and other models warn about it."""
+        assert OpenAIEmbeddingBackend("text-embedding-3-small").collection_name == LEGACY_COLLECTION_NAME
+        assert OpenAIEmbeddingBackend("text-embedding-3-large").collection_name != LEGACY_COLLECTION_NAME
+        
+        legacy = VectorStore(str(tmp_path / "vectordb"), embedding_backend=HashingEmbeddingBackend())
+        legacy.client.create_collection(LEGACY_COLLECTION_NAME).add(ids=["chunk-1"], embeddings=[[0.1] * 8])
+        
+        with caplog.at_level("WARNING", logger="src.rag.rag_engine"):
+            VectorStore(str(tmp_path / "vectordb"), embedding_backend=HashingEmbeddingBackend())
+        assert "1 chunks indexed by an earlier version" in caplog.text
+    
+    def test_add_and_search_with_local_backend(self, tmp_path):
+        """Test indexing and search end to end without network embeddings."""
+        store = VectorStore(str(tmp_path / "vectordb"), embedding_backend=HashingEmbeddingBackend())
+        metadata = DocumentMetadata(
+            document_id="test-123",
+            filename="test.pdf",
+            file_size=1000,
+            mime_type="application/pdf",
+            upload_timestamp=datetime.utcnow(),
+            uploader="test_user",
+            source_type="upload"
+        )
+        extraction = DocumentExtraction(
+            document_id="test-123",
+            document_type=DocumentType.INVOICE,
+            metadata=metadata,
+            raw_text="--- Page 1 ---\nAcme Corp invoice\n\n--- Page 2 ---\nTotal due $1,500"
+        )
+        
+        store.add_document(extraction)
+        results = store.search("Acme Corp invoice", top_k=1)
+        
+        assert results[0]["metadata"]["document_id"] == "test-123"
+        assert results[0]["metadata"]["page_start"] == 1
+    
+    
+    @staticmethod
+    def _extraction(document_id, raw_text, uploader="test_user"):
+        metadata = DocumentMetadata(
+            document_id=document_id,
+            filename=f"{document_id}.pdf",
+            file_size=1000,
+            mime_type="application/pdf",
+            upload_timestamp=datetime.utcnow(),
+            uploader=uploader,
+            source_type="upload"
+        )
+        return DocumentExtraction(
+            document_id=document_id,
+            document_type=DocumentType.INVOICE,
+            metadata=metadata,
+            raw_text=raw_text
+        )
+    
+    def test_reindex_only_embeds_changed_chunks(self, tmp_path):
+        """Test re-ingesting a document embeds only new or changed chunks."""
+        backend = HashingEmbeddingBackend()
+        backend.embed_documents = Mock(side_effect=backend.embed_documents)
+        store = VectorStore(str(tmp_path / "vectordb"), embedding_backend=backend)
+        store.chunker.chunk_size = 20  # One chunk per page
+        
+        original = "--- Page 1 ---\nAcme Corp invoice\n\n--- Page 2 ---\nTotal due $1,500"
+        assert store.add_document(self._extraction("doc-1", original))["added"] == 2
+        
+        unchanged = store.add_document(self._extraction("doc-1", original))
+        assert unchanged == {"added": 0, "removed": 0, "unchanged": 2}
+        
+        revised = original.replace("$1,500", "$1,750")
+        changed = store.add_document(self._extraction("doc-1", revised))
+        assert changed == {"added": 1, "removed": 1, "unchanged": 1}
+        
+        assert backend.embed_documents.call_count == 2
+        assert store.collection.count() == 2
+    
+    def test_delete_uses_manifest_ids(self, tmp_path):
+        """Test deletes go straight to known chunk ids without a metadata scan."""
+        store = VectorStore(str(tmp_path / "vectordb"), embedding_backend=HashingEmbeddingBackend())
+        store.add_document(self._extraction("doc-1", "Acme Corp invoice"))
+        version = store.version
+        
+        with patch.object(type(store.collection), 'get') as mock_get:
+            store.delete_document("doc-1")
+            mock_get.assert_not_called()
+        
+        assert store.collection.count() == 0
+        assert store.version > version
+    
+    def test_version_shared_between_stores(self, tmp_path):
+        """Test the corpus version is shared by stores (worker processes) on one index."""
+        first = VectorStore(str(tmp_path / "vectordb"), embedding_backend=HashingEmbeddingBackend())
+        second = VectorStore(str(tmp_path / "vectordb"), embedding_backend=HashingEmbeddingBackend())
+        version = second.version
+        
+        first.add_document(self._extraction("doc-1", "Acme Corp invoice"))
+        
+        assert second.version == first.version > version
+    
+    def test_failed_indexing_returns_zero_counts(self, tmp_path):
+        """Test an embedding failure is logged and still reports index changes."""
+        backend = HashingEmbeddingBackend()
+        store = VectorStore(str(tmp_path / "vectordb"), embedding_backend=backend)
+        
+        with patch.object(backend, 'embed_documents', side_effect=RuntimeError("rate limited")):
+            changes = store.add_document(self._extraction("doc-1", "Acme invoice"))
+        
+        assert changes == {"added": 0, "removed": 0, "unchanged": 0}
+        assert store.collection.count() == 0
+    
+    def test_failed_reindex_keeps_previous_version(self, tmp_path):
+        """Test a re-index that fails to embed leaves the old chunks indexed and in the manifest."""
+        backend = HashingEmbeddingBackend()
+        store = VectorStore(str(tmp_path / "vectordb"), embedding_backend=backend)
+        store.add_document(self._extraction("doc-1", "Acme invoice"))
+        indexed = store.manifest.get_chunks("doc-1")
+        
+        with patch.object(backend, 'embed_documents', side_effect=RuntimeError("rate limited")):
+            store.add_document(self._extraction("doc-1", "Acme invoice, corrected"))
+        
+        assert store.manifest.get_chunks("doc-1") == indexed
+        assert sorted(store.collection.get()["ids"]) == sorted(indexed)
+    
+    def test_purge_by_uploader(self, tmp_path):
+        """Test bulk purge removes only documents matching the filter."""
+        store = VectorStore(str(tmp_path / "vectordb"), embedding_backend=HashingEmbeddingBackend())
+        store.add_document(self._extraction("doc-1", "Acme invoice", uploader="sftp"))
+        store.add_document(self._extraction("doc-2", "Globex invoice", uploader="sftp"))
+        store.add_document(self._extraction("doc-3", "Initech invoice", uploader="web_ui"))
+        
+        purged = store.purge(uploader="sftp")
+        
+        assert sorted(purged) == ["doc-1", "doc-2"]
+        assert store.collection.count() == 1
+        with pytest.raises(ValueError):
+            store.purge()
+
+
+class TestLayoutChunker:
+    """Tests for page- and table-aware chunking."""
+    
+    @staticmethod
+    def _extraction(raw_text, tables=None):
+        metadata = DocumentMetadata(
+            document_id="test-123",
+            filename="test.pdf",
+            file_size=1000,
+            mime_type="application/pdf",
+            upload_timestamp=datetime.utcnow(),
+            uploader="test_user",
+            source_type="upload"
+        )
+        return DocumentExtraction(
+            document_id="test-123",
+            document_type=DocumentType.INVOICE,
+            metadata=metadata,
+            raw_text=raw_text,
+            tables=tables or []
+        )
+    
+    def test_split_pages(self):
+        """Test full text is split on page markers with 1-based numbers."""
+        text = "--- Page 1 ---\nFirst page\n\n--- Page 2 ---\nSecond page"
+        
+        assert DocumentPreprocessor.split_pages(text) == [(1, "First page"), (2, "Second page")]
+        assert DocumentPreprocessor.split_pages("No markers") == [(1, "No markers")]
+    
+    def test_short_pages_packed_with_page_range(self):
+        """Test short consecutive pages share a chunk that records its page range."""
+        text = "\n\n".join(f"--- Page {i} ---\n" + "x" * 300 for i in range(1, 6))
+        chunks = LayoutChunker(chunk_size=1000).chunk(self._extraction(text))
+        
+        assert [(c.page_start, c.page_end) for c in chunks] == [(1, 3), (4, 5)]
+        assert all(len(c.text) <= 1000 for c in chunks)
+    
+    def test_chunks_never_span_oversized_page(self):
+        """Test a page larger than the chunk size is split without crossing pages."""
+        text = "--- Page 1 ---\n" + "word " * 500 + "\n\n--- Page 2 ---\nTotal: $100"
+        chunks = LayoutChunker(chunk_size=1000, chunk_overlap=0).chunk(self._extraction(text))
+        
+        assert all(c.page_start == c.page_end == 1 for c in chunks[:-1])
+        assert chunks[-1].page_start == 2
+        assert chunks[-1].text == "Total: $100"
+    
+    def test_one_chunk_per_table(self):
+        """Test each table becomes its own chunk with its page number."""
+        table = TableData(
+            headers=["Item", "Amount"],
+            rows=[["Widget", "100"], ["Gadget", "250"]],
+            page_number=2,
+            confidence=0.9
+        )
+        chunks = LayoutChunker().chunk(self._extraction("--- Page 1 ---\nInvoice", [table]))
+        
+        table_chunks = [c for c in chunks if c.chunk_type == "table"]
+        assert len(table_chunks) == 1
+        assert table_chunks[0].page_start == 2
+        assert "Widget | 100" in table_chunks[0].text
+        assert [c.chunk_index for c in chunks] == [0, 1]
+
+
+class TestQueryCache:
+    """Tests for RAG query caching."""
+    
+    def test_ttl_cache_lru_eviction(self):
+        """Test least recently used entries are evicted first."""
+        cache = TTLCache("test", max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        
+        assert "a" in cache
+        assert "b" not in cache
+        assert cache.stats()['evictions'] == 1
+    
+    def test_ttl_cache_expiry(self):
+        """Test entries expire after their TTL."""
+        cache = TTLCache("test", max_entries=10, ttl_seconds=30)
+        
+        with patch('src.utils.cache.time.monotonic', return_value=1000.0):
+            cache.set("a", 1)
+        with patch('src.utils.cache.time.monotonic', return_value=1010.0):
+            assert cache.get("a") == 1
+        with patch('src.utils.cache.time.monotonic', return_value=1031.0):
+            assert cache.get("a") is None
+        
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+    
+    @pytest.fixture
+    def rag_engine(self):
+        """RAG engine with mocked vector store and LLM calls."""
+        vector_store = Mock()
+        vector_store.manifest.version.return_value = 0
+        vector_store.embed_query.return_value = [0.1, 0.2]
+        vector_store.search.return_value = [{
+            "id": "doc-1_0",
+            "document": "Invoice total is $1,000",
+            "metadata": {"document_id": "doc-1", "filename": "invoice.pdf"},
+            "distance": 0.2
+        }]
+        
+        engine = RAGEngine(vector_store)
+        engine._generate_answer = Mock(return_value="The total is $1,000")
+        engine.generate_insights = Mock(return_value=[])
+        return engine
+    
+    def test_repeated_query_served_from_cache(self, rag_engine):
+        """Test identical queries skip embedding, search and LLM calls."""
+        first = rag_engine.query(QueryRequest(query="What is the total?"))
+        second = rag_engine.query(QueryRequest(query="  what is  the TOTAL? "))
+        
+        assert second is first
+        rag_engine.vector_store.embed_query.assert_called_once_with("What is the total?")
+        assert rag_engine.vector_store.search.call_count == 1
+        assert rag_engine._generate_answer.call_count == 1
+        assert rag_engine.cache_stats()['response']['hits'] == 1
+    
+    def test_corpus_version_invalidates_responses(self, rag_engine):
+        """Test a new corpus version misses the response cache but reuses the embedding."""
+        rag_engine.query(QueryRequest(query="What is the total?"))
+        # Another worker indexed a document; the version comes from the shared manifest
+        rag_engine.vector_store.manifest.version.return_value = 1
+        rag_engine.query(QueryRequest(query="What is the total?"))
+        
+        assert rag_engine._generate_answer.call_count == 2
+        assert rag_engine.vector_store.embed_query.call_count == 1
+    
+    def test_ingest_by_another_worker_invalidates_responses(self, tmp_path):
+        """Test the response cache key follows the corpus version of the shared index."""
+        worker = VectorStore(str(tmp_path / "vectordb"), embedding_backend=HashingEmbeddingBackend())
+        other = VectorStore(str(tmp_path / "vectordb"), embedding_backend=HashingEmbeddingBackend())
+        engine = RAGEngine(worker)
+        request = QueryRequest(query="What is the total?")
+        
+        before = engine._response_cache_key(request)
+        other.add_document(TestVectorStore._extraction("doc-1", "Acme Corp invoice"))
+        
+        assert engine._response_cache_key(request) != before
+    
+    def test_failed_query_not_cached(self, rag_engine):
+        """Test error responses are not cached."""
+        rag_engine._generate_answer.side_effect = [RuntimeError("LLM down"), "Recovered"]
+        
+        failed = rag_engine.query(QueryRequest(query="What is the total?"))
+        recovered = rag_engine.query(QueryRequest(query="What is the total?"))
+        
+        assert failed.confidence == 0.0
+        assert recovered.answer == "Recovered"
+    
+    def test_answer_and_insights_run_concurrently(self, rag_engine):
+        """Test answer and insight generation overlap instead of running in sequence."""
+        barrier = threading.Barrier(2, timeout=5)
+        
+        def answer(context, question):
+            barrier.wait()
+            return "The total is $1,000"
+        
+        def insights(query, search_results):
+            barrier.wait()
+            return []
+        
+        rag_engine._generate_answer = Mock(side_effect=answer)
+        rag_engine.generate_insights = Mock(side_effect=insights)
+        
+        response = rag_engine.query(QueryRequest(query="What is the total?"))
+        
+        assert response.answer == "The total is $1,000"
+        assert response.confidence > 0
+    
+    def test_stream_query_events(self, rag_engine):
+        """Test streamed queries emit sources, tokens, insights and a final response."""
+        rag_engine._stream_answer = Mock(return_value=iter(["The total ", "is $1,000"]))
+        
+        events = list(rag_engine.stream_query(QueryRequest(query="What is the total?")))
+        names = [event for event, _ in events]
+        
+        assert names == ["sources", "token", "token", "insights", "done"]
+        assert events[-1][1].answer == "The total is $1,000"
+        
+        # Second stream is replayed from the response cache
+        cached = list(rag_engine.stream_query(QueryRequest(query="What is the total?")))
+        assert [event for event, _ in cached] == ["sources", "token", "insights", "done"]
+        assert rag_engine._stream_answer.call_count == 1
+
+
+class TestJobQueue:
+    """Tests for persistent background job queue."""
+    
+    def _wait_for(self, queue, job_id, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = queue.get(job_id)
+            if job.status in (ProcessingStatus.COMPLETED, ProcessingStatus.FAILED):
+                return job
+            time.sleep(0.02)
+        raise AssertionError(f"Job {job_id} did not finish")
+    
+    def test_pid_probe_skipped_on_windows(self):
+        """Test liveness is not probed with os.kill on Windows, where it would terminate the process."""
+        with patch('src.jobs.job_queue.os.name', 'nt'), patch('src.jobs.job_queue.os.kill') as kill:
+            assert _pid_alive(12345) is True
+        kill.assert_not_called()
+    
+    def test_job_runs_and_reports_progress(self, tmp_path):
+        """Test submitted jobs run on a worker and record reported progress."""
+        stages = []
+        
+        def handler(job, report_progress):
+            report_progress("ocr", 5)
+            stages.append(queue.get(job.job_id).current_stage)
+        
+        queue = JobQueue(handler, path=str(tmp_path / "jobs.sqlite3"), max_workers=1)
+        queue.start()
+        try:
+            job = queue.submit("doc-1", "/tmp/doc.pdf", "doc.pdf", "tester")
+            finished = self._wait_for(queue, job.job_id)
+        finally:
+            queue.stop()
+        
+        assert stages == ["ocr"]
+        assert finished.progress_percentage == 100
+        assert queue.get_status("doc-1").status == ProcessingStatus.COMPLETED
+    
+    def test_failed_job_records_error(self, tmp_path):
+        """Test a job whose handler keeps raising is failed with its message after max_attempts runs."""
+        handler = Mock(side_effect=RuntimeError("OCR crashed"))
+        queue = JobQueue(handler, path=str(tmp_path / "jobs.sqlite3"), max_attempts=2, retry_backoff_seconds=0)
+        queue.start()
+        try:
+            job = queue.submit("doc-1", "/tmp/doc.pdf", "doc.pdf", "tester")
+            finished = self._wait_for(queue, job.job_id)
+        finally:
+            queue.stop()
+        
+        assert finished.status == ProcessingStatus.FAILED
+        assert finished.error_message == "OCR crashed"
+        assert finished.attempts == 2
+        assert handler.call_count == 2
+    
+    def test_failed_attempt_is_retried_after_backoff(self, tmp_path):
+        """Test a handler error re-queues the job until its backoff delay has passed."""
+        finished = []
+        handler = Mock(side_effect=[RuntimeError("OCR timed out"), None])
+        queue = JobQueue(
+            handler, path=str(tmp_path / "jobs.sqlite3"), max_attempts=3, retry_backoff_seconds=60,
+            on_finished=finished.append
+        )
+        job = queue.submit("doc-1", "/tmp/doc.pdf", "doc.pdf", "tester")
+        
+        queue._run(queue._claim_next())
+        retrying = queue.get(job.job_id)
+        assert retrying.status == ProcessingStatus.UPLOADED
+        assert retrying.error_message == "OCR timed out"
+        assert finished == []
+        assert queue._claim_next() is None
+        
+        with patch('src.jobs.job_queue.time.time', return_value=time.time() + 61):
+            claimed = queue._claim_next()
+        assert claimed.attempts == 2
+        queue._run(claimed)
+        
+        done = queue.get(job.job_id)
+        assert done.status == ProcessingStatus.COMPLETED
+        assert done.error_message is None
+        assert [job.status for job in finished] == [ProcessingStatus.COMPLETED]
+    
+    def test_on_finished_sees_recorded_final_state(self, tmp_path):
+        """Test the finished callback runs only after the job's final status is written."""
+        seen = []
+        
+        def on_finished(job):
+            seen.append((job.status, queue.get(job.job_id).status, job.error_message))
+        
+        handler = Mock(side_effect=[None, RuntimeError("OCR crashed")])
+        queue = JobQueue(
+            handler, path=str(tmp_path / "jobs.sqlite3"), max_workers=1, max_attempts=1, on_finished=on_finished
+        )
+        queue.start()
+        try:
+            first = queue.submit("doc-1", "/tmp/a.pdf", "a.pdf", "tester")
+            self._wait_for(queue, first.job_id)
+            second = queue.submit("doc-2", "/tmp/b.pdf", "b.pdf", "tester")
+            self._wait_for(queue, second.job_id)
+            deadline = time.time() + 5
+            while len(seen) < 2 and time.time() < deadline:
+                time.sleep(0.02)
+        finally:
+            queue.stop()
+        
+        assert seen == [
+            (ProcessingStatus.COMPLETED, ProcessingStatus.COMPLETED, None),
+            (ProcessingStatus.FAILED, ProcessingStatus.FAILED, "OCR crashed"),
+        ]
+    
+    def test_queued_jobs_survive_restart(self, tmp_path):
+        """Test jobs queued before a restart are run by the next queue instance."""
+        path = str(tmp_path / "jobs.sqlite3")
+        job = JobQueue(Mock(), path=path).submit("doc-1", "/tmp/doc.pdf", "doc.pdf", "tester")
+        
+        handler = Mock()
+        queue = JobQueue(handler, path=path)
+        queue.start()
+        try:
+            finished = self._wait_for(queue, job.job_id)
+        finally:
+            queue.stop()
+        
+        assert finished.status == ProcessingStatus.COMPLETED
+        assert handler.call_args[0][0].document_id == "doc-1"
+    
+    def test_batch_status_counts_and_throughput(self, tmp_path):
+        """Test batch status aggregates per-file results and throughput."""
+        def handler(job, report_progress):
+            if job.filename == "bad.pdf":
+                raise ValueError("unreadable")
+        
+        queue = JobQueue(handler, path=str(tmp_path / "jobs.sqlite3"), max_workers=2, max_attempts=1)
+        jobs = [
+            queue.submit(f"doc-{i}", f"/tmp/{name}", name, "tester", batch_id="batch-1")
+            for i, name in enumerate(["a.pdf", "bad.pdf", "c.pdf"])
+        ]
+        queue.submit("doc-other", "/tmp/x.pdf", "x.pdf", "tester")
+        
+        assert queue.get_batch_status("batch-1").finished_at is None
+        
+        queue.start()
+        try:
+            for job in jobs:
+                self._wait_for(queue, job.job_id)
+        finally:
+            queue.stop()
+        
+        status = queue.get_batch_status("batch-1")
+        assert status.total == 3
+        assert status.status_counts["completed"] == 2
+        assert status.status_counts["failed"] == 1
+        assert [doc.filename for doc in status.documents] == ["a.pdf", "bad.pdf", "c.pdf"]
+        assert status.finished_at is not None
+        assert status.documents_per_minute > 0
+        assert queue.get_batch_status("missing") is None
+
+
+class TestProgressBroker:
+    """Tests for processing progress pub/sub."""
+    
+    def test_events_delivered_across_threads(self):
+        """Test events published on a worker thread reach an asyncio subscriber."""
+        broker = ProgressBroker()
+        
+        async def consume():
+            queue = broker.subscribe("doc-1")
+            worker = threading.Thread(target=lambda: [
+                broker.publish("doc-1", "progress", {"stage": "ocr", "progress": 10}),
+                broker.publish("doc-1", "completed", {"progress": 100})
+            ])
+            worker.start()
+            events = [await asyncio.wait_for(queue.get(), timeout=5) for _ in range(2)]
+            worker.join()
+            broker.unsubscribe("doc-1", queue)
+            return events
+        
+        events = asyncio.run(consume())
+        
+        assert [event for event, _ in events] == ["progress", "completed"]
+        assert [data["seq"] for _, data in events] == [1, 2]
+    
+    def test_history_replays_latest_run(self):
+        """Test late subscribers can replay events, and a rerun replaces old history."""
+        broker = ProgressBroker()
+        broker.publish("doc-1", "progress", {"stage": "ocr"})
+        broker.publish("doc-1", "failed", {"error_message": "boom"})
+        broker.publish("doc-1", "progress", {"stage": "ocr"})
+        
+        history = broker.history("doc-1")
+        assert [event for event, _ in history] == ["progress"]
+        assert history[0][1]["seq"] == 1
+        
+        # Queueing a new run forgets the old one before the worker publishes
+        broker.publish("doc-1", "completed", {"progress": 100})
+        broker.reset("doc-1")
+        assert broker.history("doc-1") == []
+        assert broker.publish("doc-1", "progress", {"stage": "ocr"})["seq"] == 1
+    
+    def test_pipeline_reports_page_progress(self):
+        """Test the pipeline turns per-page OCR callbacks into progress events."""
+        with patch('poc_pipeline.DocumentPreprocessor') as mock_preprocessor, \
+             patch('poc_pipeline.LLMExtractor') as mock_extractor, \
+             patch('poc_pipeline.VectorStore') as mock_vector, \
+             patch('poc_pipeline.RAGEngine'), \
+             patch('poc_pipeline.OnlineAnomalyScorer') as mock_scorer, \
+             patch('poc_pipeline.DuplicateIndex') as mock_duplicates, \
+             patch('poc_pipeline.Path') as mock_path:
+            mock_path.return_value.stat.return_value.st_size = 1000
+            mock_path.return_value.suffix = ".pdf"
+            
+            def process(file_path, page_callback=None):
+                page_callback("rasterized", 0, 2)
+                page_callback("ocr", 1, 2)
+                page_callback("ocr", 2, 2)
+                return [], [], "Invoice"
+            
+            mock_preprocessor.return_value.process_document.side_effect = process
+            mock_extractor.return_value.classify_document.return_value = DocumentType.INVOICE
+            mock_extractor.return_value.extract_structured_data.return_value = InvoiceExtraction()
+            mock_extractor.return_value.extract_generic_entities.return_value = []
+            mock_vector.return_value.add_document.return_value = {"added": 3, "removed": 0, "unchanged": 0}
+            mock_scorer.return_value.observe.return_value = []
+            mock_duplicates.return_value.observe.return_value = []
+            
+            events = []
+            DocumentPipeline().process_document(
+                "invoice.pdf", filename="invoice.pdf",
+                progress_callback=lambda stage, progress, details: events.append((stage, progress, details))
+            )
+        
+        stages = [stage for stage, _, _ in events]
+        assert stages[:4] == ["ocr", "rasterized", "ocr", "ocr"]
+        assert events[3] == ("ocr", 40, {"page": 2, "total_pages": 2})
+        assert ("classified", 45, {"document_type": "invoice"}) in events
+        assert ("embedded", 90, {"added": 3, "removed": 0, "unchanged": 0}) in events
+        assert [progress for _, progress, _ in events] == sorted(progress for _, progress, _ in events)
+
+
+class TestStreamingUpload:
+    """Tests for streamed upload persistence."""
+    
+    def test_save_stream_hashes_while_copying(self, tmp_path):
+        """Test chunks are written to disk with size and SHA-256 computed in one pass."""
+        source = io.BytesIO(b"invoice bytes " * 1000)
+        destination = str(tmp_path / "uploads" / "doc.pdf")
+        
+        size, content_hash = asyncio.run(save_stream(read_chunks(source, 1024), destination, max_bytes=1 << 20))
+        
+        assert size == 14000
+        assert content_hash == hashlib.sha256(b"invoice bytes " * 1000).hexdigest()
+        assert Path(destination).read_bytes() == source.getvalue()
+    
+    def test_save_stream_enforces_limit_mid_stream(self, tmp_path):
+        """Test the copy stops at the size limit and removes the partial file."""
+        read = []
+        
+        async def chunks():
+            for _ in range(100):
+                read.append(1)
+                yield b"x" * 1024
+        
+        destination = tmp_path / "doc.pdf"
+        with pytest.raises(FileTooLargeError):
+            asyncio.run(save_stream(chunks(), str(destination), max_bytes=4096))
+        
+        assert len(read) == 5
+        assert not destination.exists()
+
+
+class TestDocumentRepository:
+    """Tests for persistent document repository."""
+    
+    def _extraction(self, document_id, vendor="Acme Corp", amount=1500.0, day=1, content_hash=None):
+        return DocumentExtraction(
+            document_id=document_id,
+            document_type=DocumentType.INVOICE,
+            metadata=DocumentMetadata(
+                document_id=document_id,
+                filename=f"{document_id}.pdf",
+                file_size=1024,
+                mime_type="application/pdf",
+                upload_timestamp=datetime(2025, 11, day),
+                uploader="tester",
+                content_hash=content_hash
+            ),
+            ocr_results=[OCRResult(text="Total", confidence=0.9, page_number=1)],
+            structured_data=InvoiceExtraction(
+                vendor_name=vendor,
+                total_amount=MonetaryAmount(amount=amount, currency=Currency.USD)
+            ),
+            raw_text=f"Invoice from {vendor}"
+        )
+    
+    @pytest.fixture
+    def database_url(self, tmp_path):
+        return f"sqlite:///{tmp_path / 'documents.sqlite3'}"
+    
+    def test_round_trip_survives_restart(self, database_url):
+        """Test documents persist across instances with typed structured data."""
+        SQLDocumentRepository(database_url).save(self._extraction("doc-1"))
+        
+        loaded = SQLDocumentRepository(database_url).get("doc-1")
+        
+        assert isinstance(loaded.structured_data, InvoiceExtraction)
+        assert loaded.structured_data.total_amount.amount == 1500.0
+        assert loaded.ocr_results[0].text == "Total"
+    
+    def test_hot_documents_served_from_cache(self, database_url):
+        """Test repeated reads hit the in-process LRU, not the database."""
+        repository = SQLDocumentRepository(database_url, cache_size=1)
+        repository.save(self._extraction("doc-1"))
+        repository.save(self._extraction("doc-2"))  # Evicts doc-1
+        
+        assert repository.get("doc-1") is not None
+        assert repository.get("doc-1") is repository.get("doc-1")
+        assert repository.cache.stats()["hits"] == 2
+    
+    def test_serialized_payload_stored_at_write_time(self, database_url):
+        """Test reads return the JSON written at save time without re-serializing."""
+        extraction = self._extraction("doc-1")
+        SQLDocumentRepository(database_url).save(extraction)
+        
+        repository = SQLDocumentRepository(database_url)
+        with patch.object(DocumentExtraction, 'model_dump_json') as mock_dump:
+            serialized = repository.get_serialized("doc-1")
+            mock_dump.assert_not_called()
+        
+        assert gzip.decompress(serialized.body) == extraction.model_dump_json().encode()
+        assert repository.get_etag("doc-1") == serialized.etag
+        assert repository.get_serialized("missing") is None
+    
+    def test_list_filters_on_indexed_columns(self, database_url):
+        """Test listing filters by type, vendor and upload time."""
+        repository = SQLDocumentRepository(database_url)
+        repository.save(self._extraction("doc-1", vendor="Acme Corp", day=1))
+        repository.save(self._extraction("doc-2", vendor="Globex", day=2))
+        repository.save(self._extraction("doc-3", vendor="Acme Corp", day=3))
+        
+        assert [e.document_id for e in repository.list(vendor_name="Acme Corp")] == ["doc-1", "doc-3"]
+        assert [e.document_id for e in repository.list(uploaded_after=datetime(2025, 11, 2))] == ["doc-2", "doc-3"]
+        assert [e.document_id for e in repository.list(document_ids=["doc-3", "missing"])] == ["doc-3"]
+        assert repository.list(document_type="bank_statement") == []
+    
+    def test_delete_and_content_hash_lookup(self, database_url):
+        """Test deletes remove documents and content hashes resolve to ids."""
+        repository = SQLDocumentRepository(database_url)
+        repository.save(self._extraction("doc-1", content_hash="abc123"))
+        
+        assert repository.find_by_content_hash("abc123") == "doc-1"
+        assert repository.delete("doc-1") is True
+        assert repository.delete("doc-1") is False
+        assert repository.get("doc-1") is None
+        assert repository.count() == 0
+
+
+class TestAdmissionController:
+    """Tests for per-endpoint admission control."""
+    
+    def test_queue_then_reject_when_full(self):
+        """Test requests over the limit wait in FIFO order and overflow is rejected."""
+        async def scenario():
+            controller = AdmissionController("test", max_concurrent=1, max_queue=1, queue_timeout_seconds=5)
+            order = []
+            
+            async def request(name):
+                async with controller.admit():
+                    order.append(name)
+                    await asyncio.sleep(0.01)
+            
+            first = asyncio.create_task(request("first"))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(request("second"))
+            await asyncio.sleep(0)
+            assert controller.queue_depth == 1
+            
+            with pytest.raises(AdmissionRejected) as rejected:
+                await controller.acquire()
+            assert rejected.value.reason == "queue_full"
+            assert rejected.value.retry_after >= 1
+            
+            await asyncio.gather(first, second)
+            return order, controller
+        
+        order, controller = asyncio.run(scenario())
+        assert order == ["first", "second"]
+        assert controller.in_flight == 0
+        assert controller.queue_depth == 0
+    
+    def test_wait_timeout_rejects_and_leaves_queue(self):
+        """Test a request that waits too long is rejected and removed from the queue."""
+        async def scenario():
+            controller = AdmissionController("test", max_concurrent=1, max_queue=4, queue_timeout_seconds=0.01)
+            await controller.acquire()
+            
+            with pytest.raises(AdmissionRejected) as rejected:
+                await controller.acquire()
+            
+            controller.release()
+            return rejected.value, controller
+        
+        rejected, controller = asyncio.run(scenario())
+        assert rejected.reason == "timeout"
+        assert controller.queue_depth == 0
+        assert controller.in_flight == 0
+
+
+class TestPipelineMetrics:
+    """Tests for per-stage timing and usage metrics."""
+    
+    @staticmethod
+    def _sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+    
+    def test_timed_operation_records_sync_and_async(self):
+        """Test the decorator records operation histograms for sync and async functions."""
+        @timed_operation("test_sync_op")
+        def sync_op():
+            return 1
+        
+        @timed_operation("test_async_op")
+        async def async_op():
+            await asyncio.sleep(0)
+            return 2
+        
+        before_sync = self._sample('app_operation_duration_seconds_count', operation="test_sync_op")
+        before_async = self._sample('app_operation_duration_seconds_count', operation="test_async_op")
+        
+        assert sync_op() == 1
+        assert asyncio.run(async_op()) == 2
+        
+        assert self._sample('app_operation_duration_seconds_count', operation="test_sync_op") == before_sync + 1
+        assert self._sample('app_operation_duration_seconds_count', operation="test_async_op") == before_async + 1
+        # Operations are not pipeline stages
+        assert self._sample('pipeline_stage_duration_seconds_count', stage="test_sync_op") == 0.0
+        assert self._sample('pipeline_stage_duration_seconds_count', stage="test_async_op") == 0.0
+    
+    def test_timed_stage_counts_failures_and_pages(self):
+        """Test failed stages are counted and per-page timings count pages."""
+        before_failures = self._sample('pipeline_stage_failures_total', stage="test_failing_stage")
+        before_pages = self._sample('pipeline_pages_total', stage="test_page_stage")
+        
+        with pytest.raises(ValueError):
+            with timed_stage("test_failing_stage"):
+                raise ValueError("boom")
+        for _ in range(3):
+            with timed_stage("test_page_stage", per_page=True):
+                pass
+        
+        assert self._sample('pipeline_stage_failures_total', stage="test_failing_stage") == before_failures + 1
+        assert self._sample('pipeline_pages_total', stage="test_page_stage") == before_pages + 3
+    
+    def test_token_usage_recorded_per_operation(self):
+        """Test LLM token usage from OpenAI responses is counted by operation."""
+        before = self._sample('llm_tokens_total', operation="test_op", kind="prompt")
+        
+        TokenUsageRecorder("test_op").on_llm_end(
+            LLMResult(generations=[], llm_output={"token_usage": {"prompt_tokens": 120, "completion_tokens": 30}})
+        )
+        
+        assert self._sample('llm_tokens_total', operation="test_op", kind="prompt") == before + 120
+        assert self._sample('llm_tokens_total', operation="test_op", kind="completion") >= 30
+    
+    def test_streamed_token_usage_recorded_when_stream_finishes(self):
+        """Test streamed responses, which report no usage, are counted when the stream ends."""
+        before_prompt = self._sample('llm_tokens_total', operation="test_stream", kind="prompt")
+        before_completion = self._sample('llm_tokens_total', operation="test_stream", kind="completion")
+        
+        recorder = TokenUsageRecorder("test_stream")
+        recorder.on_chat_model_start(
+            {}, [[HumanMessage(content="What is the total?")]], run_id=None, invocation_params={"model": "gpt-4"}
+        )
+        for token in ("The", " total", " is", " $100"):
+            recorder.on_llm_new_token(token, run_id=None)
+        with patch('src.utils.llm_usage.count_prompt_tokens', return_value=42) as count:
+            recorder.on_llm_end(LLMResult(generations=[]))
+        
+        count.assert_called_once_with([HumanMessage(content="What is the total?")], "gpt-4")
+        assert self._sample('llm_tokens_total', operation="test_stream", kind="prompt") == before_prompt + 42
+        assert self._sample('llm_tokens_total', operation="test_stream", kind="completion") == before_completion + 4
 
 
 class TestAnomalyDetector:
@@ -205,6 +1062,623 @@ class TestAnomalyDetector:
         assert isinstance(anomalies, list)
 
 
+class TestAmountAnomalies:
+    """Tests for robust per-group amount anomaly detection."""
+    
+    def _detect(self, rows, **kwargs):
+        document_ids, amounts, currencies, vendors = (np.array(column) for column in zip(*rows))
+        types = np.full(len(rows), "invoice", dtype=object)
+        return AnomalyDetector().detect_amount_anomalies_matrix(
+            document_ids, amounts.astype(float), currencies, vendors, types, **kwargs
+        )
+    
+    def test_amounts_compared_within_vendor_and_currency(self):
+        """Test a total normal for one vendor is flagged for another, and currencies don't mix."""
+        rows = [(f"small-{i}", 100.0 + i, "USD", "Acme") for i in range(10)]
+        rows += [(f"large-{i}", 10_000.0 + i, "USD", "Globex") for i in range(10)]
+        rows += [(f"eur-{i}", 9_000.0 + i, "EUR", "Acme") for i in range(10)]
+        rows.append(("acme-spike", 10_000.0, "USD", "Acme"))
+        
+        anomalies = self._detect(rows)
+        
+        assert [a.document_id for a in anomalies] == ["acme-spike"]
+        assert anomalies[0].expected_value == 105.0
+        assert anomalies[0].severity == "critical"
+        assert "Acme" in anomalies[0].description
+    
+    def test_outlier_cannot_mask_itself(self):
+        """Test robust statistics still flag an extreme total that would inflate a plain std."""
+        rows = [(f"doc-{i}", 1000.0 + (i % 3), "USD", "Acme") for i in range(6)]
+        rows.append(("spike", 5000.0, "USD", "Acme"))
+        
+        assert [a.document_id for a in self._detect(rows)] == ["spike"]
+    
+    def test_small_vendors_fall_back_to_document_type(self):
+        """Test vendors with too few documents are scored against all documents of the type."""
+        rows = [(f"doc-{i}", 1000.0 + i, "USD", f"vendor-{i}") for i in range(10)]
+        rows.append(("new-vendor", 80_000.0, "USD", "Initech"))
+        rows.append(("unknown", float("nan"), "USD", "Initech"))
+        
+        anomalies = self._detect(rows, min_group_size=5)
+        
+        assert [a.document_id for a in anomalies] == ["new-vendor"]
+        assert "invoices" in anomalies[0].description
+
+
+class TestTrendAnalyzer:
+    """Tests for daily-aggregated, cached trend analysis."""
+    
+    def _series(self, days=56, spike_day=40):
+        start = datetime(2025, 1, 1).timestamp()
+        timestamps, amounts = [], []
+        for day in range(days):
+            for hour in (9, 15):
+                timestamps.append(start + day * 86400 + hour * 3600)
+                amounts.append(500.0 + 5 * day + (5000.0 if day == spike_day and hour == 9 else 0.0))
+        return np.array(timestamps), np.array(amounts)
+    
+    def test_daily_totals_fill_empty_days(self):
+        """Test totals are summed per day, with gaps as zero and missing values dropped."""
+        day = 86400.0
+        daily = daily_totals(np.array([0.0, 3600.0, 2 * day, np.nan]), np.array([10.0, 5.0, 7.0, 1.0]))
+        
+        assert list(daily['y']) == [15.0, 0.0, 7.0]
+        assert list(daily['count']) == [2, 0, 1]
+    
+    def test_exponential_smoothing_forecast_and_anomalies(self):
+        """Test the statsmodels engine forecasts the horizon and flags the spike day."""
+        timestamps, amounts = self._series()
+        
+        result = TrendAnalyzer(engine="exponential_smoothing").analyze_series(timestamps, amounts, forecast_periods=14)
+        
+        assert result['engine'] == "exponential_smoothing"
+        assert result['trend_direction'] == "increasing"
+        assert result['days'] == 56
+        assert len(result['forecast']) == 14
+        assert all(row['yhat_lower'] <= row['yhat'] <= row['yhat_upper'] for row in result['forecast'])
+        assert [a['date'][:10] for a in result['anomalies']] == ["2025-02-10"]
+    
+    def test_result_cached_per_data_version(self):
+        """Test unchanged data is served from cache and a new version refits."""
+        timestamps, amounts = self._series()
+        analyzer = TrendAnalyzer(engine="exponential_smoothing")
+        
+        with patch.object(analyzer, '_fit_exponential_smoothing', wraps=analyzer._fit_exponential_smoothing) as fit:
+            first = analyzer.analyze_series(timestamps, amounts, data_version=7)
+            assert analyzer.analyze_series(timestamps, amounts, data_version=7) is first
+            analyzer.analyze_series(timestamps, amounts, data_version=8)
+        
+        assert fit.call_count == 2
+    
+    def test_unknown_engine_rejected(self):
+        """Test configuration errors surface at construction."""
+        with pytest.raises(ValueError):
+            TrendAnalyzer(engine="arima")
+
+
+class TestFeatureStore:
+    """Tests for the incremental anomaly feature store."""
+    
+    _extraction = TestDocumentRepository._extraction
+    
+    @pytest.fixture
+    def repository(self, tmp_path):
+        return SQLDocumentRepository(f"sqlite:///{tmp_path / 'documents.sqlite3'}")
+    
+    def test_sync_applies_saves_and_deletes_incrementally(self, repository):
+        """Test the store loads existing rows, then applies only new changes."""
+        repository.save(self._extraction("doc-1", amount=100.0))
+        repository.save(self._extraction("doc-2", amount=200.0))
+        store = FeatureStore(repository)
+        
+        frame = store.frame()
+        assert list(frame.document_ids) == ["doc-1", "doc-2"]
+        assert list(frame.column('total_amount')) == [100.0, 200.0]
+        assert frame.column('text_length')[0] == len("Invoice from Acme Corp")
+        
+        # Unchanged repository: the materialized frame is reused as-is
+        assert store.frame() is frame
+        
+        repository.save(self._extraction("doc-1", amount=150.0))
+        repository.save(self._extraction("doc-3", amount=300.0))
+        repository.delete("doc-2")
+        
+        assert store.sync() == 3
+        frame = store.frame()
+        assert list(frame.document_ids) == ["doc-1", "doc-3"]
+        assert list(frame.column('total_amount')) == [150.0, 300.0]
+        assert list(store.frame(["doc-3", "doc-2"]).document_ids) == ["doc-3"]
+    
+    def test_sees_writes_from_other_processes(self, repository):
+        """Test a store catches up with writes made through another repository instance."""
+        store = FeatureStore(repository)
+        assert len(store.frame()) == 0
+        
+        other_worker = SQLDocumentRepository(repository.database_url)
+        other_worker.save(self._extraction("doc-1"))
+        
+        assert list(store.frame().document_ids) == ["doc-1"]
+    
+    def test_columns_grow_and_compact(self, repository):
+        """Test preallocated columns double when full and tombstones are compacted away."""
+        for i in range(5):
+            repository.save(self._extraction(f"doc-{i}", amount=float(i)))
+        store = FeatureStore(repository, initial_capacity=2)
+        store.sync()
+        
+        for i in range(4):
+            repository.delete(f"doc-{i}")
+        store.sync()
+        
+        assert len(store) == 1
+        # Compacted once tombstones outnumbered half the rows (after the third delete)
+        assert store._size == 2
+        assert list(store.frame().column('total_amount')) == [4.0]
+    
+    def test_matrix_detection_matches_extraction_path(self, repository):
+        """Test detection on stored features flags the same documents as on extractions."""
+        extractions = [self._extraction(f"doc-{i}", amount=1000.0 + i) for i in range(20)]
+        extractions.append(self._extraction("doc-big", amount=1_000_000.0))
+        for extraction in extractions:
+            repository.save(extraction)
+        
+        detector = AnomalyDetector()
+        frame = FeatureStore(repository).frame()
+        from_matrix = detector.detect_amount_anomalies_matrix(
+            frame.document_ids, frame.column('total_amount'),
+            frame.currencies, frame.vendor_names, frame.document_types
+        )
+        from_extractions = detector.detect_amount_anomalies(extractions)
+        
+        assert [a.document_id for a in from_matrix] == ["doc-big"]
+        assert [a.document_id for a in from_extractions] == ["doc-big"]
+        assert from_matrix[0].expected_value == from_extractions[0].expected_value
+
+
+class TestAnomalyModelManager:
+    """Tests for persisted, versioned anomaly models."""
+    
+    _extraction = TestDocumentRepository._extraction
+    
+    @pytest.fixture
+    def repository(self, tmp_path):
+        repository = SQLDocumentRepository(f"sqlite:///{tmp_path / 'documents.sqlite3'}")
+        for i in range(12):
+            repository.save(self._extraction(f"doc-{i}", amount=1000.0 + 10 * i))
+        return repository
+    
+    def _manager(self, repository, tmp_path, **kwargs):
+        return AnomalyModelManager(
+            AnomalyDetector(), FeatureStore(repository), ModelRegistry(str(tmp_path / "models"), keep_versions=2),
+            **kwargs
+        )
+    
+    def test_model_is_saved_and_loaded_by_other_workers(self, repository, tmp_path):
+        """Test the first model is trained, saved with metadata, and picked up after a restart."""
+        manager = self._manager(repository, tmp_path)
+        manager.ensure_model()
+        
+        metadata = manager.detector.model.metadata
+        assert metadata.version == 1
+        assert metadata.reason == "initial"
+        assert metadata.training_documents == 12
+        
+        restarted = self._manager(repository, tmp_path)
+        restarted.ensure_model()
+        
+        assert restarted.detector.model.metadata == metadata
+        assert restarted.registry.versions() == [1]
+    
+    def test_retrain_swaps_model_and_prunes_old_versions(self, repository, tmp_path):
+        """Test retraining saves new versions, keeps only the newest and swaps atomically."""
+        manager = self._manager(repository, tmp_path)
+        manager.ensure_model()
+        in_use = manager.detector.model
+        
+        for _ in range(2):
+            manager.retrain()
+        
+        assert manager.detector.model is not in_use
+        assert manager.detector.model.metadata.version == 3
+        assert manager.registry.versions() == [2, 3]
+        assert manager.registry.latest_version() == 3
+    
+    def test_drift_and_age_trigger_retraining(self, repository, tmp_path):
+        """Test automatic retraining when features drift or the model is stale."""
+        manager = self._manager(repository, tmp_path, drift_threshold=1.0, retrain_interval_seconds=3600)
+        manager.ensure_model()
+        assert manager.check() is None
+        
+        for i in range(12):
+            repository.save(self._extraction(f"big-{i}", amount=50_000.0))
+        
+        assert manager.check().metadata.reason == "drift"
+        
+        stale = manager.detector.model
+        manager.detector.swap(stale._replace(
+            metadata=stale.metadata.model_copy(update={"trained_at": datetime(2020, 1, 1)})
+        ))
+        assert manager.check().metadata.reason == "scheduled"
+    
+    def test_retrain_skipped_while_another_process_trains(self, repository, tmp_path):
+        """Test only one process retrains at a time."""
+        manager = self._manager(repository, tmp_path)
+        
+        with manager.registry.lock("training"):
+            assert manager.retrain() is None
+        
+        assert manager.retrain().metadata.version == 1
+    
+    def test_requests_wait_for_model_trained_elsewhere(self, repository, tmp_path):
+        """Test a request waits for another process's first model instead of fitting its own."""
+        manager = self._manager(repository, tmp_path)
+        trainer = self._manager(repository, tmp_path)
+        
+        def train_elsewhere():
+            time.sleep(0.2)
+            frame = trainer.feature_store.frame()
+            trainer.registry.save(trainer.detector.train(frame.values))
+        
+        with manager.registry.lock("training"):
+            assert manager.ensure_model(wait_seconds=0) is False
+            
+            other = threading.Thread(target=train_elsewhere)
+            other.start()
+            assert manager.ensure_model(wait_seconds=5) is True
+            other.join()
+        
+        assert manager.detector.model.metadata.version == 1
+        
+        # Without a model, outliers are skipped rather than fitted on the requested frame
+        pipeline = DocumentPipeline()
+        pipeline.detect_anomalies_from_features(FeatureStore(repository).frame(["doc-1", "doc-2"]))
+        assert pipeline.anomaly_detector.fitted is False
+    
+    def test_registry_lock_on_windows(self, tmp_path):
+        """Test the registry locks with msvcrt where fcntl is unavailable."""
+        held = set()
+        
+        def locking(fd, mode, size):
+            if mode == msvcrt.LK_UNLCK:
+                held.clear()
+            elif held:
+                raise OSError("locked")
+            else:
+                held.add(fd)
+        
+        msvcrt = Mock(LK_NBLCK=2, LK_UNLCK=0, locking=Mock(side_effect=locking))
+        registry = ModelRegistry(str(tmp_path / "models"))
+        with patch('src.anomaly.registry.os.name', 'nt'), \
+             patch('src.anomaly.registry.msvcrt', msvcrt, create=True):
+            with registry.lock("training") as acquired:
+                assert acquired
+                with registry.lock("training", blocking=False) as again:
+                    assert again is False
+            assert not held
+
+
+class TestOnlineAnomalyScorer:
+    """Tests for streaming anomaly scoring at ingest."""
+    
+    _extraction = TestDocumentRepository._extraction
+    
+    def test_streaming_statistics_track_exact_values(self):
+        """Test Welford moments are exact and P² quartiles are close to the true ones."""
+        values = np.random.default_rng(7).normal(1000, 50, 5000)
+        stats = RunningStats()
+        for value in values:
+            stats.add(float(value))
+        
+        restored = RunningStats(stats.to_dict())
+        assert restored.count == 5000
+        assert restored.mean == pytest.approx(values.mean())
+        assert restored.std == pytest.approx(values.std())
+        for quartile, p in zip(restored.quartiles, (25, 50, 75)):
+            assert quartile.value() == pytest.approx(np.percentile(values, p), rel=0.01)
+    
+    def test_small_samples_are_exact(self):
+        """Test quantiles are exact before the estimator has five observations."""
+        quantile = P2Quantile(0.5)
+        for value in (3.0, 1.0, 2.0):
+            quantile.add(value)
+        assert quantile.value() == 2.0
+    
+    def test_alerts_on_ingest_and_survives_restart(self, tmp_path):
+        """Test a spike is flagged at ingest, once, against state that persists."""
+        path = str(tmp_path / "state.sqlite3")
+        scorer = OnlineAnomalyScorer(path, threshold=3.5, min_observations=10)
+        for i in range(12):
+            assert scorer.observe(self._extraction(f"doc-{i}", amount=1000.0 + 10 * (i % 4))) == []
+        
+        restarted = OnlineAnomalyScorer(path, threshold=3.5, min_observations=10)
+        alerts = restarted.observe(self._extraction("spike", amount=25_000.0))
+        
+        assert [a.document_id for a in alerts] == ["spike"]
+        assert "Acme Corp" in alerts[0].description
+        assert "12 prior documents" in alerts[0].description
+        
+        # A retried job neither double counts nor raises a second alert
+        assert [a.anomaly_id for a in restarted.observe(self._extraction("spike", amount=25_000.0))] == \
+            [alerts[0].anomaly_id]
+        assert [a.anomaly_id for a in restarted.alerts()] == [alerts[0].anomaly_id]
+    
+    def test_new_vendor_scored_against_document_type(self, tmp_path):
+        """Test vendors without enough history are compared with all documents of the type."""
+        scorer = OnlineAnomalyScorer(str(tmp_path / "state.sqlite3"), min_observations=10)
+        for i in range(12):
+            scorer.observe(self._extraction(f"doc-{i}", vendor=f"vendor-{i}", amount=500.0 + i))
+        
+        alerts = scorer.observe(self._extraction("new", vendor="Initech", amount=90_000.0))
+        
+        assert [a.document_id for a in alerts] == ["new"]
+        assert "invoices" in alerts[0].description
+    
+    def test_removed_values_leave_the_moments(self):
+        """Test removing an observation restores the count, mean and variance without it."""
+        values = [1000.0, 1040.0, 990.0, 25_000.0, 1010.0]
+        stats = RunningStats()
+        for value in values:
+            stats.add(value)
+        stats.remove(25_000.0)
+        
+        remaining = np.array([value for value in values if value != 25_000.0])
+        assert stats.count == 4
+        assert stats.mean == pytest.approx(remaining.mean())
+        assert stats.std == pytest.approx(remaining.std())
+    
+    def test_reprocessed_and_deleted_documents_are_rescored(self, tmp_path):
+        """Test a reprocessed document replaces its old amount and alert, and removal forgets it."""
+        scorer = OnlineAnomalyScorer(str(tmp_path / "state.sqlite3"), threshold=3.5, min_observations=10)
+        for i in range(12):
+            scorer.observe(self._extraction(f"doc-{i}", amount=1000.0 + 10 * (i % 4)))
+        assert len(scorer.observe(self._extraction("spike", amount=25_000.0))) == 1
+        
+        # Reprocessing with a corrected total withdraws the alert and the misread amount
+        assert scorer.observe(self._extraction("spike", amount=1010.0)) == []
+        assert scorer.alerts() == []
+        stats = scorer._load(_group_keys("USD", "Acme Corp", "invoice")["vendor"])
+        assert stats.count == 13
+        assert stats.mean == pytest.approx((sum(1000.0 + 10 * (i % 4) for i in range(12)) + 1010.0) / 13)
+        
+        assert scorer.remove(["spike", "unknown"]) == 1
+        assert scorer._load(_group_keys("USD", "Acme Corp", "invoice")["vendor"]).count == 12
+        assert scorer.observe(self._extraction("spike", amount=1010.0)) == []
+
+
+class TestDuplicateIndex:
+    """Tests for exact and near-duplicate detection at ingest."""
+    
+    @staticmethod
+    def _extraction(document_id, raw_text, vendor="Acme Corp", invoice_number=None, amount=1500.0):
+        extraction = TestDocumentRepository._extraction(None, document_id, vendor=vendor, amount=amount)
+        extraction.structured_data.invoice_number = invoice_number
+        extraction.raw_text = raw_text
+        return extraction
+    
+    @staticmethod
+    def _text(seed, words=200):
+        rng = np.random.default_rng(seed)
+        vocabulary = ["invoice", "total", "widget", "service", "hours", "consulting", "net", "due",
+                      "shipping", "license", "support", "annual", "unit", "price", "quantity"]
+        return " ".join(f"{rng.choice(vocabulary)} {rng.integers(1, 1000)}" for _ in range(words))
+    
+    def test_exact_duplicate_survives_restart(self, tmp_path):
+        """Test the same invoice is matched despite formatting differences, once, after a restart."""
+        path = str(tmp_path / "duplicates.sqlite3")
+        index = DuplicateIndex(path)
+        assert index.observe(self._extraction("doc-1", "", "Acme Corp.", "INV-0042")) == []
+        
+        restarted = DuplicateIndex(path)
+        matches = restarted.observe(self._extraction("doc-2", "", "ACME corp", "inv 0042"))
+        
+        assert [(m.anomaly_type, m.field_name) for m in matches] == [(AnomalyType.DUPLICATE, "invoice_number")]
+        assert "doc-1" in matches[0].description
+        assert restarted.observe(self._extraction("doc-3", "", "Acme Corp", "INV-0042", amount=1600.0)) == []
+        
+        # A retried job returns the original match without indexing the document twice
+        assert [m.anomaly_id for m in restarted.observe(self._extraction("doc-2", "", "ACME corp", "inv 0042"))] == \
+            [matches[0].anomaly_id]
+        assert [m.anomaly_id for m in restarted.alerts()] == [matches[0].anomaly_id]
+    
+    def test_reprocessed_document_is_rekeyed(self, tmp_path):
+        """Test reprocessing with corrected fields or text replaces the document's old entries."""
+        index = DuplicateIndex(str(tmp_path / "duplicates.sqlite3"), similarity_threshold=0.8)
+        text = self._text(1)
+        index.observe(self._extraction("doc-1", text, invoice_number="INV-1"))
+        assert len(index.observe(self._extraction("doc-2", "", invoice_number="INV-1"))) == 1
+        
+        # doc-1 was misread: once corrected it neither matches nor is matched under its old key and text
+        assert index.observe(self._extraction("doc-1", self._text(2), invoice_number="INV-7")) == []
+        assert index.alerts(document_id="doc-1") == []
+        assert index.observe(self._extraction("doc-3", "", invoice_number="INV-1")) == \
+            index.alerts(document_id="doc-3")
+        assert ["doc-2" in m.description for m in index.alerts(document_id="doc-3")] == [True]
+        assert index.observe(self._extraction("doc-4", text)) == []
+        assert len(index.observe(self._extraction("doc-5", "", invoice_number="INV-7"))) == 1
+    
+    def test_near_duplicate_text(self, tmp_path):
+        """Test a rescan with OCR noise is matched by text, and unrelated documents are not."""
+        index = DuplicateIndex(str(tmp_path / "duplicates.sqlite3"), similarity_threshold=0.8)
+        original = self._text(1)
+        for seed in range(2, 50):
+            index.observe(self._extraction(f"other-{seed}", self._text(seed)))
+        index.observe(self._extraction("original", original))
+        
+        rescan = original.replace("total", "tota1", 3).replace("widget", "Widget")
+        matches = index.observe(self._extraction("rescan", rescan))
+        
+        assert [(m.field_name, m.document_id) for m in matches] == [("raw_text", "rescan")]
+        assert "original" in matches[0].description
+        assert matches[0].confidence_score >= 0.8
+        
+        # Deleted documents are no longer matched
+        assert index.remove(["original", "rescan"]) == 2
+        assert index.observe(self._extraction("rescan-2", rescan)) == []
+    
+    def test_signature_estimates_jaccard_similarity(self, tmp_path):
+        """Test MinHash agreement approximates the true shingle Jaccard similarity."""
+        index = DuplicateIndex(str(tmp_path / "duplicates.sqlite3"), num_permutations=256, bands=16)
+        first, second = self._text(1, words=300), self._text(1, words=300)[:2000] + self._text(2, words=100)
+        
+        a, b = set(_shingles(first).tolist()), set(_shingles(second).tolist())
+        estimate = np.mean(index.signature(first) == index.signature(second))
+        
+        assert estimate == pytest.approx(len(a & b) / len(a | b), abs=0.08)
+        assert index.signature("too short") is None
+
+
+class TestValidationRules:
+    """Tests for the declarative, vectorized validation rules."""
+    
+    @staticmethod
+    def _invoice(document_id, **fields):
+        extraction = TestDocumentRepository._extraction(None, document_id)
+        data = {
+            "invoice_number": f"INV-{document_id}",
+            "vendor_name": "Acme Corp",
+            "invoice_date": datetime(2025, 11, 1),
+            "due_date": datetime(2025, 12, 1),
+            "line_items": [{"description": "Widgets", "quantity": 10, "unit_price": 100.0, "total": 1000.0},
+                           {"description": "Support", "quantity": 2, "unit_price": 125.0}],
+            "subtotal": MonetaryAmount(amount=1250.0, currency=Currency.USD),
+            "tax_amount": MonetaryAmount(amount=250.0, currency=Currency.USD),
+            "total_amount": MonetaryAmount(amount=1500.0, currency=Currency.USD),
+        }
+        data.update(fields)
+        extraction.structured_data = InvoiceExtraction(**data)
+        return extraction
+    
+    def test_consistent_invoice_passes(self):
+        """Test an invoice whose amounts and dates agree raises nothing."""
+        assert RuleEngine().validate([self._invoice("ok")]) == []
+    
+    def test_each_rule_reports_its_field(self):
+        """Test missing fields, sums and date order are each flagged on the offending field."""
+        engine = RuleEngine()
+        cases = {
+            "invoice_number": self._invoice("a", invoice_number=" "),
+            "total_amount": self._invoice("b", total_amount=MonetaryAmount(amount=1600.0, currency=Currency.USD)),
+            "subtotal": self._invoice("c", line_items=[{"description": "Widgets", "total": 900.0}]),
+            "due_date": self._invoice("d", due_date=datetime(2025, 10, 15)),
+        }
+        
+        for field, extraction in cases.items():
+            anomalies = engine.validate([extraction])
+            assert [a.field_name for a in anomalies] == [field]
+        
+        (late,) = engine.validate([cases["due_date"]])
+        assert late.anomaly_type == AnomalyType.VALIDATION_ERROR
+        assert (late.expected_value, late.actual_value) == ("2025-11-01", "2025-10-15")
+        (total,) = engine.validate([cases["total_amount"]])
+        assert (total.expected_value, total.actual_value) == (1500.0, 1600.0)
+    
+    def test_rounding_and_missing_parts_are_tolerated(self):
+        """Test a cent of rounding passes, and sums with a missing part are not checked."""
+        engine = RuleEngine()
+        rounded = self._invoice("a", total_amount=MonetaryAmount(amount=1500.01, currency=Currency.USD))
+        untaxed = self._invoice("b", tax_amount=None, line_items=[])
+        assert engine.validate([rounded, untaxed]) == []
+    
+    def test_batch_matches_per_document_validation(self):
+        """Test one vectorized pass over a mixed batch finds what validating one at a time does."""
+        rng = np.random.default_rng(3)
+        extractions = []
+        for i in range(2000):
+            fields = {}
+            if rng.random() < 0.1:
+                fields["vendor_name"] = None
+            if rng.random() < 0.1:
+                fields["tax_amount"] = MonetaryAmount(amount=300.0, currency=Currency.USD)
+            if rng.random() < 0.1:
+                fields["due_date"] = datetime(2025, 10, 1)
+            extractions.append(self._invoice(f"doc-{i}", **fields))
+        statement = TestDocumentRepository._extraction(None, "statement")
+        statement.document_type = DocumentType.BANK_STATEMENT
+        statement.structured_data = BankStatementExtraction(account_number="123")
+        extractions.append(statement)
+        
+        engine = RuleEngine()
+        batch = {(a.document_id, a.field_name) for a in engine.validate(extractions)}
+        single = {(a.document_id, a.field_name) for e in extractions for a in engine.validate([e])}
+        
+        assert batch == single
+        assert ("statement", "opening_balance") in batch
+        assert len(batch) > 400
+    
+    def test_rules_compiled_once(self):
+        """Test unknown rule kinds and fields are rejected when the engine is built."""
+        with pytest.raises(ValueError):
+            RuleEngine([Rule("bad", "between", ("invoice",), ("total_amount",))])
+        with pytest.raises(ValueError):
+            RuleEngine([Rule("bad", "required", ("invoice",), ("po_number",))])
+
+
+class TestBalanceReconciliation:
+    """Tests for running-balance reconciliation of bank statements."""
+    
+    @staticmethod
+    def _statement(amounts, balances, opening=1000.0, closing=None):
+        extraction = TestDocumentRepository._extraction(None, "statement")
+        extraction.document_type = DocumentType.BANK_STATEMENT
+        extraction.structured_data = BankStatementExtraction(
+            account_number="12-3456",
+            opening_balance=None if opening is None else MonetaryAmount(amount=opening, currency=Currency.USD),
+            closing_balance=None if closing is None else MonetaryAmount(amount=closing, currency=Currency.USD),
+            transactions=[
+                {"date": f"2025-11-{i + 1:02d}", "description": f"Payment {i}", "amount": amount, "balance": balance}
+                for i, (amount, balance) in enumerate(zip(amounts, balances))
+            ]
+        )
+        return extraction
+    
+    def test_consistent_statement_passes(self):
+        """Test a statement whose balances follow from its amounts raises nothing."""
+        statement = self._statement([-200.0, "1,500.00", "(300.00)"], [800.0, 2300.0, 2000.0], closing=2000.0)
+        assert reconcile_statement(statement) == []
+        assert ValidationEngine().validate_extraction(statement) == []
+    
+    def test_breaks_found_at_exact_rows(self):
+        """Test a misread balance is flagged once, a misread amount at its row, and the closing balance."""
+        amounts = [-200.0, 100.0, 50.0, 25.0, -75.0]
+        balances = [800.0, 909.0, 950.0, 975.0, 900.0]  # Row 1 should be 900; row 2 follows from 900
+        anomalies = reconcile_statement(self._statement(amounts, balances, closing=900.0))
+        assert [(a.field_name, a.expected_value, a.actual_value) for a in anomalies] == [
+            ("transactions[1].balance", 900.0, 909.0)
+        ]
+        
+        amounts[3] = 30.0  # Misread amount: every later balance is off by the same 5
+        anomalies = reconcile_statement(self._statement(amounts, [800.0, 900.0, 950.0, 975.0, 900.0], closing=910.0))
+        assert [(a.field_name, a.anomaly_type) for a in anomalies] == [
+            ("transactions[3].balance", AnomalyType.VALIDATION_ERROR),
+            ("closing_balance", AnomalyType.VALIDATION_ERROR)
+        ]
+        assert anomalies[1].expected_value == 900.0
+        assert "2025-11-04 Payment 3" in anomalies[0].description
+    
+    def test_gaps_are_bridged(self):
+        """Test missing balances are bridged and an unreadable amount re-anchors the chain."""
+        amounts, balances = [100.0, 100.0, "n/a", 100.0, 100.0], [None, 1200.0, 1250.0, None, 1450.0]
+        assert reconcile_statement(self._statement(amounts, balances, opening=None, closing=1450.0)) == []
+        
+        balances[1] = 1210.0
+        assert [a.field_name for a in reconcile_statement(self._statement(amounts, balances))] == [
+            "transactions[1].balance"
+        ]
+    
+    def test_long_statement(self):
+        """Test tens of thousands of transactions reconcile with breaks at the injected rows."""
+        rng = np.random.default_rng(5)
+        amounts = np.round(rng.normal(0, 250, 50_000), 2)
+        balances = np.round(1000.0 + np.cumsum(amounts), 2)
+        balances[12_345] += 0.5
+        amounts[40_000] += 10.0
+        
+        breaks = find_balance_breaks(1000.0, amounts, balances)
+        
+        assert breaks.rows.tolist() == [12_345, 40_000]
+        assert breaks.expected_closing == pytest.approx(balances[-1])
+
+
 class TestDocumentPipeline:
     """Integration tests for complete pipeline."""
     
@@ -215,7 +1689,9 @@ class TestDocumentPipeline:
              patch('poc_pipeline.LLMExtractor') as mock_extractor, \
              patch('poc_pipeline.VectorStore') as mock_vector, \
              patch('poc_pipeline.RAGEngine') as mock_rag, \
-             patch('poc_pipeline.AnomalyDetector') as mock_anomaly:
+             patch('poc_pipeline.AnomalyDetector') as mock_anomaly, \
+             patch('poc_pipeline.OnlineAnomalyScorer'), \
+             patch('poc_pipeline.DuplicateIndex'):
             
             # Configure mocks
             mock_preprocessor.return_value.process_document.return_value = ([], [], "Test text")
@@ -249,6 +1725,49 @@ class TestDocumentPipeline:
         # Should not raise exception
         # extraction = pipeline.process_document("test.pdf")
         # assert extraction.document_id is not None
+    
+    def test_components_built_on_first_use(self, mock_pipeline_components):
+        """Test components are constructed lazily, once, and all at once by load_components()."""
+        pipeline = DocumentPipeline()
+        mock_pipeline_components['vector'].assert_not_called()
+        
+        assert pipeline.vector_store is pipeline.vector_store
+        mock_pipeline_components['vector'].assert_called_once()
+        mock_pipeline_components['rag'].assert_not_called()
+        
+        pipeline.load_components()
+        mock_pipeline_components['rag'].assert_called_once_with(pipeline.vector_store)
+        mock_pipeline_components['preprocessor'].assert_called_once()
+    
+    def test_import_skips_heavy_subsystems(self):
+        """Test importing the API does not load OCR, vector store or ML libraries."""
+        heavy = ["camelot", "chromadb", "langchain_openai", "prophet", "sklearn", "statsmodels"]
+        code = f"import sys, api; print([m for m in {heavy!r} if m in sys.modules])"
+        
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=Path(__file__).resolve().parent.parent,
+            capture_output=True, text=True, timeout=120
+        )
+        
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip().splitlines()[-1] == "[]"
+    
+    def test_process_batch_runs_in_parallel(self, mock_pipeline_components):
+        """Test batch processing overlaps documents and keeps input order."""
+        pipeline = DocumentPipeline()
+        barrier = threading.Barrier(3, timeout=5)
+        
+        def process(file_path):
+            barrier.wait()  # Deadlocks unless all three run at once
+            if file_path == "bad.pdf":
+                raise ValueError("unreadable")
+            return file_path
+        
+        pipeline.process_document = Mock(side_effect=process)
+        results = pipeline.process_batch(["a.pdf", "bad.pdf", "b.pdf"], max_workers=3)
+        
+        assert results == ["a.pdf", "b.pdf"]
 
 
 class TestDataModels:
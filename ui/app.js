@@ -1,6 +1,7 @@
 // API Configuration
 const API_BASE_URL = 'http://localhost:8000';
 const API_KEY = ''; // Optional - leave empty for development
+const DOCUMENT_VIEW_FIELDS = 'document_id,document_type,metadata,structured_data,extracted_entities,tables,raw_text,processing_time_seconds';
 
 // State
 let currentDocumentId = null;
@@ -111,14 +112,6 @@ async function uploadFile(file) {
     formData.append('uploader', 'web_ui');
     
     try {
-        // Simulate progress
-        let progress = 0;
-        const progressInterval = setInterval(() => {
-            progress += Math.random() * 30;
-            if (progress > 90) progress = 90;
-            progressFill.style.width = `${progress}%`;
-        }, 200);
-        
         const headers = {};
         if (API_KEY) headers['X-API-Key'] = API_KEY;
         
@@ -128,15 +121,18 @@ async function uploadFile(file) {
             body: formData
         });
         
-        clearInterval(progressInterval);
-        progressFill.style.width = '100%';
-        
         if (!response.ok) {
             const error = await response.json();
             throw new Error(error.detail || 'Upload failed');
         }
         
         const result = await response.json();
+        
+        // Follow real pipeline progress until the document is ready
+        progressText.textContent = 'Queued for processing...';
+        await followProcessing(result.document_id, headers);
+        
+        progressFill.style.width = '100%';
         progressText.textContent = 'Processing complete!';
         
         setTimeout(() => {
@@ -155,7 +151,7 @@ async function uploadFile(file) {
         // Update UI
         await loadDocumentDetails(result.document_id);
         updateDocumentsList();
-        showToast('Document processed successfully!', 'success');
+        showToast(result.deduplicated ? 'Document already processed' : 'Document processed successfully!', 'success');
         
     } catch (error) {
         uploadProgress.classList.add('hidden');
@@ -164,13 +160,46 @@ async function uploadFile(file) {
     }
 }
 
+// Stream processing progress events (fetch rather than EventSource so the API key header is sent)
+async function followProcessing(documentId, headers) {
+    const response = await fetch(`${API_BASE_URL}/api/v1/documents/${documentId}/events`, { headers });
+    if (!response.ok) throw new Error('Failed to follow processing');
+    
+    await readServerSentEvents(response, (event, data) => {
+        if (event === 'failed') {
+            throw new Error(data.error_message || 'Processing failed');
+        }
+        if (data.progress !== undefined) {
+            progressFill.style.width = `${data.progress}%`;
+        }
+        progressText.textContent = describeProgress(event, data);
+    });
+}
+
+function describeProgress(event, data) {
+    const details = data.details || {};
+    switch (data.stage) {
+        case 'rasterized': return `Rendered ${details.total_pages} page(s)`;
+        case 'ocr': return details.page ? `OCR page ${details.page} of ${details.total_pages}` : 'Running OCR...';
+        case 'classified': return `Classified as ${formatKey(details.document_type)}`;
+        case 'extraction': return 'Extracting fields...';
+        case 'entity_extraction': return 'Extracting entities...';
+        case 'vectorization': return 'Indexing for search...';
+        case 'embedded': return `Indexed ${details.added} new chunk(s)`;
+        case 'validation': return 'Validating...';
+        case 'queued': return 'Queued for processing...';
+        default: return event === 'completed' ? 'Processing complete!' : 'Processing...';
+    }
+}
+
 // Load Document Details
 async function loadDocumentDetails(documentId) {
     try {
         const headers = {};
         if (API_KEY) headers['X-API-Key'] = API_KEY;
         
-        const response = await fetch(`${API_BASE_URL}/api/v1/documents/${documentId}`, {
+        // Skip per-word OCR boxes; the view only needs the extraction summary
+        const response = await fetch(`${API_BASE_URL}/api/v1/documents/${documentId}?fields=${DOCUMENT_VIEW_FIELDS}`, {
             headers
         });
         
@@ -273,7 +302,7 @@ async function handleQuery() {
         const headers = { 'Content-Type': 'application/json' };
         if (API_KEY) headers['X-API-Key'] = API_KEY;
         
-        const response = await fetch(`${API_BASE_URL}/api/v1/query`, {
+        const response = await fetch(`${API_BASE_URL}/api/v1/query/stream`, {
             method: 'POST',
             headers,
             body: JSON.stringify({
@@ -285,8 +314,21 @@ async function handleQuery() {
         
         if (!response.ok) throw new Error('Query failed');
         
-        const result = await response.json();
-        displayQueryResults(result);
+        // Render answer tokens as they arrive
+        let answer = '';
+        let sources = [];
+        await readServerSentEvents(response, (event, data) => {
+            if (event === 'sources') {
+                sources = data;
+            } else if (event === 'token') {
+                answer += data;
+                displayQueryResults({ answer, confidence: 0, sources }, true);
+            } else if (event === 'done') {
+                displayQueryResults(data);
+            } else if (event === 'error') {
+                throw new Error(data.detail || 'Query failed');
+            }
+        });
         
     } catch (error) {
         showToast(`Query failed: ${error.message}`, 'error');
@@ -302,13 +344,39 @@ async function handleQuery() {
     }
 }
 
+// Read a server-sent event stream from a fetch response
+async function readServerSentEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const messages = buffer.split('\n\n');
+        buffer = messages.pop();
+        
+        for (const message of messages) {
+            let event = 'message';
+            let data = '';
+            for (const line of message.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
 // Display Query Results
-function displayQueryResults(result) {
+function displayQueryResults(result, streaming = false) {
     const html = `
         <div class="query-answer">
             <h4>Answer</h4>
             <p>${result.answer}</p>
-            <span class="confidence-badge">Confidence: ${(result.confidence * 100).toFixed(0)}%</span>
+            ${streaming ? '' : `<span class="confidence-badge">Confidence: ${(result.confidence * 100).toFixed(0)}%</span>`}
         </div>
         
         ${result.sources && result.sources.length > 0 ? `